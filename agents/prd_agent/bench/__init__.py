@@ -0,0 +1 @@
+"""Offline benchmark harness for the PRD pipeline (no network required)."""
@@ -0,0 +1,171 @@
+"""Compare two commits on the same cassette: pipeline latency, CPU and memory side by side.
+
+Each ref is checked out into a temporary ``git worktree`` and replayed with
+``bench.replay`` from that checkout, alternating the order every round so
+drift on the machine hits both sides alike. Arguments after ``--`` go to
+``bench.replay`` unchanged (use absolute paths for files). From
+``agents/prd_agent``::
+
+    python -m bench.compare cassettes/blog.jsonl.gz --base main --rounds 3 \\
+        -- --input "博客系统" --parallel --runs 5
+
+``--head`` defaults to the working tree, uncommitted changes included. Both
+refs must contain ``src/cassette.py``.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from bench.run import _percentile
+
+AGENT_DIR = Path(__file__).resolve().parents[1]
+
+# (label, result key); higher is worse for all of them.
+METRICS: Tuple[Tuple[str, str], ...] = (
+    ("p50 ms", "p50_ms"),
+    ("p95 ms", "p95_ms"),
+    ("mean ms", "mean_ms"),
+    ("cpu ms/PRD", "cpu_ms_per_prd"),
+    ("peak RSS MB", "peak_rss_mb"),
+)
+
+
+def _git(*args: str, cwd: Path = AGENT_DIR) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def _checkout(ref: Optional[str], workdir: Path, trees: List[Path]) -> Tuple[Path, str]:
+    """The ``agents/prd_agent`` directory of ``ref`` (the working tree if ``None``) and its label.
+
+    New worktrees are appended to ``trees`` for the caller to remove.
+    """
+    if ref is None:
+        return AGENT_DIR, "working tree"
+    root = Path(_git("rev-parse", "--show-toplevel"))
+    sha = _git("rev-parse", "--short", ref)
+    tree = workdir / sha
+    if tree not in trees:
+        _git("worktree", "add", "--detach", str(tree), sha)
+        trees.append(tree)
+    checkout = tree / AGENT_DIR.relative_to(root)
+    if not (checkout / "src" / "cassette.py").exists():
+        raise SystemExit(f"{ref} 中没有 src/cassette.py，无法回放（需要包含录制/回放功能的提交）")
+    return checkout, f"{ref} ({sha})"
+
+
+def _replay(checkout: Path, cassette: Path, passthrough: List[str], out: Path) -> Dict[str, Any]:
+    command = [sys.executable, "-m", "bench.replay", str(cassette), "--json", str(out), *passthrough]
+    completed = subprocess.run(command, cwd=checkout, capture_output=True, text=True)
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr)
+        raise SystemExit(f"回放失败：{checkout}")
+    return json.loads(out.read_text(encoding="utf-8"))
+
+
+def _merge(rounds: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Pool every round's runs into one result."""
+    latencies = [value for result in rounds for value in result["latencies_ms"]]
+    nodes: Dict[str, Dict[str, List[float]]] = {}
+    for result in rounds:
+        for node, values in result["nodes"].items():
+            for key, value in values.items():
+                nodes.setdefault(node, {}).setdefault(key, []).append(value)
+    return {
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "mean_ms": statistics.fmean(latencies),
+        "cpu_ms_per_prd": statistics.fmean(result["cpu_ms_per_prd"] for result in rounds),
+        "peak_rss_mb": max(result["peak_rss_mb"] for result in rounds),
+        "nodes": {
+            node: {key: statistics.fmean(values) for key, values in node_values.items()}
+            for node, node_values in nodes.items()
+        },
+        "fallback": sum(result["cassette"].get("fallback", 0) for result in rounds),
+    }
+
+
+def _format(
+    base: Dict[str, Any], head: Dict[str, Any], labels: Tuple[str, str], threshold: float
+) -> Tuple[str, int]:
+    """The report and how many headline metrics regressed by more than ``threshold`` percent.
+
+    Per-node rows are flagged too but not counted: a node's CPU time is a
+    fraction of a millisecond, where a few percent is noise.
+    """
+    rows: List[Tuple[str, float, float]] = [(label, base[key], head[key]) for label, key in METRICS]
+    for node in base["nodes"]:
+        if node in head["nodes"]:
+            rows.append((f"{node} ms", base["nodes"][node]["avg_ms"], head["nodes"][node]["avg_ms"]))
+            rows.append((f"{node} cpu ms", base["nodes"][node]["cpu_ms"], head["nodes"][node]["cpu_ms"]))
+    lines = [
+        f"base: {labels[0]}",
+        f"head: {labels[1]}",
+        "",
+        f"{'metric':<24} {'base':>10} {'head':>10} {'delta':>8}",
+    ]
+    regressions = 0
+    for index, (label, before, after) in enumerate(rows):
+        delta = (after - before) * 100 / before if before else 0.0
+        flag = ""
+        if delta > threshold:
+            flag = "  regression"
+            regressions += int(index < len(METRICS))
+        lines.append(f"{label:<24} {before:>10.1f} {after:>10.1f} {delta:>+7.1f}%{flag}")
+    for label, result in zip(labels, (base, head)):
+        if result["fallback"]:
+            lines.append(
+                f"note: {label} replayed {result['fallback']} calls whose prompt differs from the recording"
+            )
+    return "\n".join(lines), regressions
+
+
+def main(argv: List[str] | None = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    passthrough: List[str] = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, passthrough = argv[:split], argv[split + 1 :]
+    parser = argparse.ArgumentParser(description="在同一录制文件上对比两个提交的框架性能")
+    parser.add_argument("cassette", type=Path, help="--record-cassette 录制的文件")
+    parser.add_argument("--base", default="HEAD", help="基线提交（默认 HEAD）")
+    parser.add_argument("--head", help="对比的提交（默认当前工作区，含未提交的修改）")
+    parser.add_argument("--rounds", type=int, default=3, help="交替执行的轮数")
+    parser.add_argument("--threshold", type=float, default=5.0, help="视为退化的增幅（百分比）")
+    parser.add_argument("--fail-on-regression", action="store_true", help="有指标退化时以退出码 1 结束")
+    parser.add_argument("--json", type=Path, help="将两边的汇总结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    cassette = args.cassette.resolve()
+    trees: List[Path] = []
+    with tempfile.TemporaryDirectory(prefix="prd-compare-") as workdir:
+        try:
+            sides = [_checkout(ref, Path(workdir), trees) for ref in (args.base, args.head)]
+            results: List[List[Dict[str, Any]]] = [[], []]
+            for round_index in range(args.rounds):
+                order = (0, 1) if round_index % 2 == 0 else (1, 0)
+                for side in order:
+                    out = Path(workdir) / f"result-{side}-{round_index}.json"
+                    results[side].append(_replay(sides[side][0], cassette, passthrough, out))
+        finally:
+            for tree in trees:
+                _git("worktree", "remove", "--force", str(tree))
+    base, head = _merge(results[0]), _merge(results[1])
+    report, regressions = _format(base, head, (sides[0][1], sides[1][1]), args.threshold)
+    print(report)
+    if args.json:
+        summary = {"base": base, "head": head}
+        args.json.write_text(json.dumps(summary, indent=2, ensure_ascii=False), encoding="utf-8")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,346 @@
+"""Deterministic scripted chat model used by the offline benchmarks."""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from src.nodes import api, architecture, datamodel, features, fused, intent, nfr
+
+
+@dataclass(frozen=True)
+class Workload:
+    """Response sizes the fake model produces for one benchmark scenario."""
+
+    name: str
+    features: int = 5
+    tables: int = 5
+    fields_per_table: int = 6
+    apis: int = 8
+
+    def intent(self) -> Dict[str, Any]:
+        return {
+            "project_name": f"Bench {self.name}",
+            "project_goal": "Measure framework overhead",
+            "background": "Synthetic requirement for benchmarking.",
+            "value": "Repeatable numbers without network access.",
+            "user_segments": ["operators", "analysts", "end users"],
+            "vision": "A pipeline whose overhead is negligible next to LLM time.",
+            "domain": "generic",
+        }
+
+    def features_payload(self) -> Dict[str, Any]:
+        return {
+            "features": [
+                {
+                    "name": f"Feature {idx}",
+                    "description": f"Synthetic feature number {idx}.",
+                    "inputs": [f"input_{idx}_a", f"input_{idx}_b"],
+                    "outputs": [f"output_{idx}"],
+                    "preconditions": ["user is authenticated"],
+                    "postconditions": ["state persisted"],
+                    "edge_cases": ["empty payload", "duplicate submit"],
+                    "dependencies": [f"Feature {idx - 1}"] if idx else [],
+                }
+                for idx in range(self.features)
+            ]
+        }
+
+    def feature_outline(self) -> Dict[str, Any]:
+        return {
+            "features": [
+                {"name": feature["name"], "description": feature["description"]}
+                for feature in self.features_payload()["features"]
+            ]
+        }
+
+    def feature_detail(self) -> Dict[str, Any]:
+        # The merge step restores each feature's name from the outline.
+        return {"feature": self.features_payload()["features"][0] if self.features else {}}
+
+    def architecture(self) -> Dict[str, Any]:
+        return {
+            "business_architecture": "Layered business capabilities.",
+            "technical_architecture": "Stateless API tier over a relational store.",
+            "data_flow": "Client -> API -> service -> database.",
+            "scalability": "Horizontal scaling behind a load balancer.",
+            "frameworks": {
+                "language": "python",
+                "rationale": "Mainstream, well supported.",
+                "backend": ["FastAPI", "SQLAlchemy"],
+                "frontend": ["React"],
+                "orchestration": ["Celery"],
+            },
+        }
+
+    def datamodel(self) -> Dict[str, Any]:
+        return {
+            "core_entities": [f"Entity{idx}" for idx in range(self.tables)],
+            "tables": [
+                {
+                    "name": f"table_{idx}",
+                    "description": f"Synthetic table {idx}.",
+                    "primary_key": "id",
+                    "fields": [
+                        {
+                            "name": f"field_{col}",
+                            "type": "varchar(64)",
+                            "description": f"Column {col}.",
+                            "constraints": "not null",
+                        }
+                        for col in range(self.fields_per_table)
+                    ],
+                }
+                for idx in range(self.tables)
+            ],
+            "dto_contracts": [
+                {"provider": "api", "consumer": "web", "payload": {"id": "int"}, "notes": "-"}
+            ],
+        }
+
+    def api(self) -> Dict[str, Any]:
+        return {
+            "apis": [
+                {
+                    "name": f"Endpoint {idx}",
+                    "url": f"/api/v1/resource_{idx}",
+                    "method": "POST" if idx % 2 else "GET",
+                    "request": [
+                        {"name": "id", "type": "int", "required": True, "description": "Resource id."}
+                    ],
+                    "response": [
+                        {"name": "data", "type": "object", "required": True, "description": "Payload."}
+                    ],
+                    "errors": {"400": "Bad request", "404": "Not found"},
+                    "example": {"request": {"id": 1}, "response": {"data": {}}},
+                }
+                for idx in range(self.apis)
+            ]
+        }
+
+    def nfr(self) -> Dict[str, Any]:
+        return {
+            "nfr": {
+                "performance": "p95 < 200ms",
+                "security": "OAuth2",
+                "scalability": "10x headroom",
+                "observability": "Tracing and metrics",
+                "internationalization": "zh/en",
+                "external_services": "None",
+            },
+            "risks": ["Synthetic risk"],
+            "glossary": ["PRD: product requirement document"],
+        }
+
+    def fused(self) -> Dict[str, Any]:
+        return {**self.datamodel(), **self.api(), **self.nfr()}
+
+    def responders(self) -> Dict[str, Callable[[], Dict[str, Any]]]:
+        """Map each node's instructions (its ``SYSTEM_PROMPT``) to the payload builder for it."""
+        return {
+            intent.SYSTEM_PROMPT: self.intent,
+            features.SYSTEM_PROMPT: self.features_payload,
+            features.OUTLINE_PROMPT: self.feature_outline,
+            features.DETAIL_PROMPT: self.feature_detail,
+            architecture.SYSTEM_PROMPT: self.architecture,
+            datamodel.SYSTEM_PROMPT: self.datamodel,
+            api.SYSTEM_PROMPT: self.api,
+            nfr.SYSTEM_PROMPT: self.nfr,
+            fused.SYSTEM_PROMPT: self.fused,
+        }
+
+
+@dataclass(frozen=True)
+class LatencyModel:
+    """Log-normal service time; ``ttft_ratio`` of it elapses before the first chunk.
+
+    ``ms_per_output_token`` adds decode time proportional to the reply size,
+    so a long (e.g. fused) reply costs more than a short one.
+    ``ms_per_input_token`` adds prefill time before the first chunk for every
+    prompt token that was not served from the prefix cache.
+    """
+
+    median_ms: float = 0.0
+    sigma: float = 0.0
+    ttft_ratio: float = 0.3
+    ms_per_output_token: float = 0.0
+    ms_per_input_token: float = 0.0
+
+    def prefill(self, uncached_tokens: int) -> float:
+        return uncached_tokens * self.ms_per_input_token / 1000
+
+    def sample(self, rng: random.Random, output_tokens: int = 0) -> float:
+        decode = output_tokens * self.ms_per_output_token / 1000
+        if self.median_ms <= 0:
+            return decode
+        factor = rng.lognormvariate(0.0, self.sigma) if self.sigma else 1.0
+        return factor * self.median_ms / 1000 + decode
+
+
+class PrefixCache:
+    """Mimics provider prompt caching: prefixes of at least ``min_tokens`` are
+    remembered in ``block_tokens`` increments and a later prompt that starts
+    with one of them reports those tokens as ``cache_read``.
+
+    Tokens are approximated as four characters, like the fake usage numbers.
+    """
+
+    def __init__(self, min_tokens: int = 1024, block_tokens: int = 128) -> None:
+        self.min_chars = min_tokens * 4
+        self.block_chars = block_tokens * 4
+        self._lock = threading.Lock()
+        self._seen: Set[str] = set()
+
+    def lookup(self, prompt: str) -> int:
+        """Cached tokens for ``prompt``; its own prefixes are stored for later calls."""
+        ends = range(self.min_chars, len(prompt) + 1, self.block_chars)
+        digests = [hashlib.sha1(prompt[:end].encode("utf-8")).hexdigest() for end in ends]
+        with self._lock:
+            hit = 0
+            for end, digest in zip(ends, digests):
+                if digest not in self._seen:
+                    break
+                hit = end
+            self._seen.update(digests)
+        return hit // 4
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model that answers each node with a canned payload after a simulated delay."""
+
+    workload: Workload
+    latency: LatencyModel = LatencyModel()
+    seed: int = 0
+    chunks: int = 8
+    prefix_cache: bool = False
+
+    _rng: random.Random
+    _rng_lock: threading.Lock
+    _cache: Dict[str, str]
+    _prefixes: PrefixCache
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._rng = random.Random(self.seed)
+        self._rng_lock = threading.Lock()
+        self._cache = {}
+        self._prefixes = PrefixCache()
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        # The node's instructions follow the shared preamble and the context.
+        request = "".join(str(message.content) for message in messages[:2])
+        for prompt, build in self.workload.responders().items():
+            if prompt in request:
+                if prompt not in self._cache:
+                    self._cache[prompt] = json.dumps(build(), ensure_ascii=False)
+                return self._cache[prompt]
+        return "{}"
+
+    def _delay(self, text: str) -> float:
+        with self._rng_lock:
+            return self.latency.sample(self._rng, len(text) // 4)
+
+    def _prompt(self, messages: List[BaseMessage]) -> Tuple[int, int]:
+        """``(input tokens, of which cached)`` for ``messages``."""
+        text = "".join(f"<{message.type}>{message.content}" for message in messages)
+        tokens = sum(len(str(message.content)) for message in messages) // 4
+        cached = min(tokens, self._prefixes.lookup(text)) if self.prefix_cache else 0
+        return tokens, cached
+
+    @staticmethod
+    def _usage(prompt: Tuple[int, int], text: str) -> Dict[str, Any]:
+        tokens, cached = prompt
+        completion = len(text) // 4
+        usage: Dict[str, Any] = {
+            "input_tokens": tokens,
+            "output_tokens": completion,
+            "total_tokens": tokens + completion,
+        }
+        if cached:
+            usage["input_token_details"] = {"cache_read": cached}
+        return usage
+
+    def _pieces(self, text: str) -> List[str]:
+        step = max(1, len(text) // max(1, self.chunks))
+        return [text[idx : idx + step] for idx in range(0, len(text), step)] or [""]
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = self._reply(messages)
+        prompt = self._prompt(messages)
+        time.sleep(self._delay(text) + self.latency.prefill(prompt[0] - prompt[1]))
+        message = AIMessage(content=text, usage_metadata=self._usage(prompt, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = self._reply(messages)
+        prompt = self._prompt(messages)
+        await asyncio.sleep(self._delay(text) + self.latency.prefill(prompt[0] - prompt[1]))
+        message = AIMessage(content=text, usage_metadata=self._usage(prompt, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        text = self._reply(messages)
+        prompt = self._prompt(messages)
+        delay = self._delay(text)
+        pieces = self._pieces(text)
+        time.sleep(delay * self.latency.ttft_ratio + self.latency.prefill(prompt[0] - prompt[1]))
+        for piece in pieces:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            time.sleep(delay * (1 - self.latency.ttft_ratio) / len(pieces))
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(content="", usage_metadata=self._usage(prompt, text))
+        )
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        text = self._reply(messages)
+        prompt = self._prompt(messages)
+        delay = self._delay(text)
+        pieces = self._pieces(text)
+        await asyncio.sleep(delay * self.latency.ttft_ratio + self.latency.prefill(prompt[0] - prompt[1]))
+        for piece in pieces:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            await asyncio.sleep(delay * (1 - self.latency.ttft_ratio) / len(pieces))
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(content="", usage_metadata=self._usage(prompt, text))
+        )
+
+
+__all__ = ["LatencyModel", "PrefixCache", "ScriptedChatModel", "Workload"]
@@ -0,0 +1,150 @@
+"""Local OpenAI-compatible chat completions endpoint backed by the scripted workload.
+
+Usage (from ``agents/prd_agent``)::
+
+    python -m bench.openai_stub --port 8000 --latency-ms 300
+    OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=stub python main.py serve
+
+Unlike :class:`bench.fake_llm.ScriptedChatModel` this goes through the real
+``ChatOpenAI`` transport, so connection reuse shows up in ``/stats``.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+from bench.fake_llm import LatencyModel, Workload
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], workload: Workload, latency: LatencyModel) -> None:
+        super().__init__(address, _StubHandler)
+        self.workload = workload
+        self.latency = latency
+        self.rng = random.Random(0)
+        self.lock = threading.Lock()
+        self.replies: Dict[str, str] = {}
+        self.connections = 0
+        self.requests = 0
+
+    def reply(self, request: str) -> str:
+        for prompt, build in self.workload.responders().items():
+            if prompt in request:
+                with self.lock:
+                    if prompt not in self.replies:
+                        self.replies[prompt] = json.dumps(build(), ensure_ascii=False)
+                    return self.replies[prompt]
+        return "{}"
+
+    def delay(self) -> float:
+        with self.lock:
+            self.requests += 1
+            return self.latency.sample(self.rng)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: StubServer
+
+    def setup(self) -> None:
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002 - stdlib signature
+        return
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:  # noqa: N802 - stdlib naming
+        if self.path.rstrip("/") != "/stats":
+            self._send(404, b"{}", "application/json")
+            return
+        stats = {"connections": self.server.connections, "requests": self.server.requests}
+        self._send(200, json.dumps(stats).encode("utf-8"), "application/json")
+
+    def do_POST(self) -> None:  # noqa: N802 - stdlib naming
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send(404, b"{}", "application/json")
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        messages: List[Dict[str, Any]] = request.get("messages", [])
+        text = self.server.reply("".join(str(message.get("content", "")) for message in messages[:2]))
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(text) // 4,
+            "total_tokens": prompt_tokens + len(text) // 4,
+        }
+        time.sleep(self.server.delay())
+        base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": request.get("model", "stub")}
+        if not request.get("stream"):
+            body = {
+                **base,
+                "object": "chat.completion",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            }
+            self._send(200, json.dumps(body).encode("utf-8"), "application/json")
+            return
+        step = max(1, len(text) // 8)
+        events = [
+            {
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {"content": text[idx : idx + step]}, "finish_reason": None}],
+            }
+            for idx in range(0, len(text), step)
+        ]
+        events.append(
+            {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        )
+        if (request.get("stream_options") or {}).get("include_usage"):
+            events.append({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        payload = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+        self._send(200, payload.encode("utf-8"), "text/event-stream")
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="模拟每次调用的中位延迟")
+    parser.add_argument("--sigma", type=float, default=0.0, help="对数正态延迟的 sigma")
+    parser.add_argument("--features", type=int, default=5)
+    parser.add_argument("--tables", type=int, default=5)
+    parser.add_argument("--apis", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    workload = Workload("stub", features=args.features, tables=args.tables, apis=args.apis)
+    server = StubServer((args.host, args.port), workload, LatencyModel(args.latency_ms, args.sigma))
+    print(f"OpenAI 兼容桩服务：http://{args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,127 @@
+"""Run the pipeline against a recorded cassette and report latency, CPU and memory.
+
+Record once against the real provider, then replay offline as often as needed
+(from ``agents/prd_agent``)::
+
+    python main.py --record-cassette cassettes/blog.jsonl.gz --input "博客系统" --language python --parallel
+    python -m bench.replay cassettes/blog.jsonl.gz --input "博客系统" --parallel --runs 5
+
+Pass the same input and graph options that were used while recording, so the
+prompts match the cassette; calls that still differ are replayed from the
+node's recorded calls in turn and counted as ``fallback``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from bench.run import _peak_rss_mb, _percentile
+
+
+def replay(options: argparse.Namespace) -> Dict[str, Any]:
+    from src.graph import agenerate_prd, generate_prd
+    from src.llm import configure_llm, get_cassette
+    from src.telemetry import configure_tracer
+
+    configure_llm(
+        cache=False,
+        replay=str(options.cassette),
+        replay_scale=options.scale,
+        # Every run sends the same prompts, so de-duplication would hide the per-call overhead.
+        single_flight=False,
+        budgets=str(options.budgets) if options.budgets else None,
+    )
+    out_dir = Path(tempfile.mkdtemp(prefix="prd-replay-"))
+    graph_options = {
+        "language": options.language,
+        "parallel": options.parallel,
+        "speculative": options.speculative,
+        "feature_fanout": options.feature_fanout,
+        "api_shard_size": options.api_shard_size,
+        "fused": options.fused,
+    }
+    tracer = configure_tracer()
+    latencies: List[float] = []
+    cpu_started = time.process_time()
+
+    if options.concurrency == 1:
+        for idx in range(options.runs):
+            t0 = time.perf_counter()
+            generate_prd(options.input, output_path=str(out_dir / f"{idx}.md"), **graph_options)
+            latencies.append(time.perf_counter() - t0)
+    else:
+
+        async def _drive() -> None:
+            semaphore = asyncio.Semaphore(options.concurrency)
+
+            async def _one(idx: int) -> None:
+                async with semaphore:
+                    t0 = time.perf_counter()
+                    output_path = str(out_dir / f"{idx}.md")
+                    await agenerate_prd(options.input, output_path=output_path, **graph_options)
+                    latencies.append(time.perf_counter() - t0)
+
+            await asyncio.gather(*(_one(idx) for idx in range(options.runs)))
+
+        asyncio.run(_drive())
+
+    cpu_ms = (time.process_time() - cpu_started) * 1000
+    cassette = get_cassette()
+    return {
+        "runs": options.runs,
+        "latencies_ms": [value * 1000 for value in latencies],
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "cpu_ms_per_prd": cpu_ms / options.runs,
+        "peak_rss_mb": _peak_rss_mb(),
+        "nodes": {
+            node: {
+                "avg_ms": totals["wall_ms"] / max(1, totals["calls"]),
+                "cpu_ms": totals["cpu_ms"] / max(1, totals["calls"]),
+            }
+            for node, totals in tracer.summary().items()
+        },
+        "cassette": cassette.stats() if cassette is not None else {},
+    }
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="按录制文件离线回放 PRD 流程")
+    parser.add_argument("cassette", type=Path, help="--record-cassette 录制的文件")
+    parser.add_argument("--input", "-i", required=True, help="录制时使用的需求描述")
+    parser.add_argument("--language", "-l", default="python", help="录制时使用的技术栈")
+    parser.add_argument("--parallel", action="store_true", help="使用并行图")
+    parser.add_argument("--speculative", action="store_true", help="流式提前发起下游调用")
+    parser.add_argument("--feature-fanout", action="store_true", help="功能列表按 map-reduce 拆分生成")
+    parser.add_argument("--api-shard-size", type=int, default=0, help="每个 API 分片包含的实体数，0 表示不分片")
+    parser.add_argument("--fused", action="store_true", help="数据模型、API 与 NFR 合并为一次调用")
+    parser.add_argument("--budgets", type=Path, help="按节点的上下文 token 预算 JSON 文件")
+    parser.add_argument("--runs", type=int, default=5, help="生成的 PRD 数")
+    parser.add_argument("--concurrency", type=int, default=1, help="并发度（大于 1 时使用 agenerate_prd）")
+    parser.add_argument("--scale", type=float, default=1.0, help="录制耗时的缩放倍数（0 表示不等待，只测框架开销）")
+    parser.add_argument("--json", type=Path, help="将结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    result = replay(args)
+    print(
+        f"{result['runs']} runs: p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, "
+        f"cpu {result['cpu_ms_per_prd']:.1f} ms/PRD, peak RSS {result['peak_rss_mb']:.1f} MB"
+    )
+    print(
+        f"cassette: {result['cassette'].get('exact', 0)} exact, "
+        f"{result['cassette'].get('fallback', 0)} fallback"
+    )
+    if args.json:
+        args.json.write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,233 @@
+"""Run the PRD pipeline against a scripted fake model and report overhead numbers.
+
+Usage (from ``agents/prd_agent``)::
+
+    python -m bench.run                       # all scenarios, concurrency 1/8/64
+    python -m bench.run --scenario small --latency-ms 0 --json bench.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from bench.fake_llm import LatencyModel, ScriptedChatModel, Workload
+
+SCENARIOS: Dict[str, Workload] = {
+    "small": Workload("small", features=5, tables=5, apis=8),
+    "features-500": Workload("features-500", features=500, tables=20, apis=40),
+    "tables-2000": Workload("tables-2000", features=20, tables=2000, apis=40),
+}
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_scenario(options: Dict[str, Any]) -> Dict[str, Any]:
+    """Executed in a fresh process so peak RSS is attributable to one scenario."""
+    from src.graph import agenerate_prd, generate_prd
+    from src.llm import configure_llm, get_single_flight
+    from src.telemetry import configure_tracer
+
+    workload = SCENARIOS[options["scenario"]]
+    latency = LatencyModel(
+        median_ms=options["latency_ms"],
+        sigma=options["sigma"],
+        ms_per_output_token=options["ms_per_token"],
+        ms_per_input_token=options["ms_per_input_token"],
+    )
+    configure_llm(
+        cache=False,
+        client=ScriptedChatModel(
+            workload=workload,
+            latency=latency,
+            seed=options["seed"],
+            prefix_cache=options["prefix_cache"],
+        ),
+        # Every run sends the same prompts, so de-duplication would hide the per-call overhead.
+        single_flight=options["single_flight"],
+        budgets=options["budgets"],
+    )
+    out_dir = Path(tempfile.mkdtemp(prefix="prd-bench-"))
+    result: Dict[str, Any] = {"scenario": workload.name, "levels": []}
+
+    for concurrency in options["concurrency"]:
+        tracer = configure_tracer()
+        group = get_single_flight()
+        coalesced_before = sum(group.stats().values()) if group is not None else 0
+        runs = max(options["runs"], concurrency)
+        latencies: List[float] = []
+
+        if concurrency == 1:
+            # Sequential sync runs keep thread CPU time exact for the per-node table.
+            started = time.perf_counter()
+            for idx in range(runs):
+                t0 = time.perf_counter()
+                generate_prd(
+                    workload.name,
+                    language="python",
+                    parallel=options["parallel"],
+                    feature_fanout=options["feature_fanout"],
+                    api_shard_size=options["api_shard_size"],
+                    fused=options["fused"],
+                    output_path=str(out_dir / f"c1-{idx}.md"),
+                )
+                latencies.append(time.perf_counter() - t0)
+            elapsed = time.perf_counter() - started
+        else:
+
+            async def _drive() -> float:
+                semaphore = asyncio.Semaphore(concurrency)
+
+                async def _one(idx: int) -> None:
+                    async with semaphore:
+                        t0 = time.perf_counter()
+                        await agenerate_prd(
+                            workload.name,
+                            language="python",
+                            parallel=options["parallel"],
+                            feature_fanout=options["feature_fanout"],
+                            api_shard_size=options["api_shard_size"],
+                            fused=options["fused"],
+                            output_path=str(out_dir / f"c{concurrency}-{idx}.md"),
+                        )
+                        latencies.append(time.perf_counter() - t0)
+
+                t_start = time.perf_counter()
+                await asyncio.gather(*(_one(idx) for idx in range(runs)))
+                return time.perf_counter() - t_start
+
+            elapsed = asyncio.run(_drive())
+
+        summary = tracer.summary()
+        llm_nodes = [totals for node, totals in summary.items() if node != "assembler"]
+        result["levels"].append(
+            {
+                "concurrency": concurrency,
+                "runs": runs,
+                "p50_ms": _percentile(latencies, 50) * 1000,
+                "p95_ms": _percentile(latencies, 95) * 1000,
+                "p99_ms": _percentile(latencies, 99) * 1000,
+                "mean_ms": statistics.fmean(latencies) * 1000,
+                "throughput_per_s": runs / elapsed if elapsed else 0.0,
+                "llm_calls_per_prd": sum(totals["calls"] for totals in llm_nodes) / runs,
+                "input_tokens_per_prd": sum(totals["input_tokens"] for totals in llm_nodes) / runs,
+                "output_tokens_per_prd": sum(totals["output_tokens"] for totals in llm_nodes) / runs,
+                "cached_tokens_per_prd": sum(totals["cached_tokens"] for totals in llm_nodes) / runs,
+                "mean_ttft_ms": sum(totals["ttft_ms"] for totals in llm_nodes)
+                / max(1, sum(totals["ttft_samples"] for totals in llm_nodes)),
+                "coalesced": (sum(group.stats().values()) if group is not None else 0) - coalesced_before,
+                "node_cpu_ms": {
+                    node: totals["cpu_ms"] / max(1, totals["calls"]) for node, totals in summary.items()
+                },
+            }
+        )
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def _format(results: List[Dict[str, Any]]) -> str:
+    lines: List[str] = []
+    for result in results:
+        lines.append(f"== {result['scenario']}  (peak RSS {result['peak_rss_mb']:.1f} MB)")
+        lines.append(
+            f"{'conc':>5} {'runs':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'PRD/s':>8} {'merged':>7}"
+        )
+        for level in result["levels"]:
+            lines.append(
+                f"{level['concurrency']:>5} {level['runs']:>5} {level['p50_ms']:>9.1f} "
+                f"{level['p95_ms']:>9.1f} {level['p99_ms']:>9.1f} {level['throughput_per_s']:>8.2f} "
+                f"{level['coalesced']:>7}"
+            )
+        first = result["levels"][0]
+        lines.append(
+            f"per PRD: {first['llm_calls_per_prd']:.1f} LLM calls, "
+            f"{first['input_tokens_per_prd']:.0f} in ({first['cached_tokens_per_prd']:.0f} cached) / "
+            f"{first['output_tokens_per_prd']:.0f} out tokens, mean TTFT {first['mean_ttft_ms']:.0f} ms"
+        )
+        cpu = result["levels"][0]["node_cpu_ms"]
+        lines.append(
+            "cpu/node ms (c=%d): " % result["levels"][0]["concurrency"]
+            + ", ".join(f"{node}={value:.2f}" for node, value in cpu.items())
+        )
+        lines.append("")
+    return "\n".join(lines)
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="PRD pipeline offline benchmark")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="默认全部")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--runs", type=int, default=20, help="每个并发度至少执行的 PRD 数")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="模拟 LLM 中位延迟，0 表示只测框架开销")
+    parser.add_argument("--sigma", type=float, default=0.0, help="对数正态延迟的 sigma")
+    parser.add_argument(
+        "--ms-per-token", type=float, default=0.0, help="每个输出 token 额外的模拟解码耗时（毫秒）"
+    )
+    parser.add_argument(
+        "--ms-per-input-token", type=float, default=0.0, help="每个未命中前缀缓存的输入 token 的模拟预填充耗时（毫秒）"
+    )
+    parser.add_argument(
+        "--prefix-cache", action="store_true", help="模拟服务端提示词前缀缓存（≥1024 token 的相同前缀）"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--parallel", action="store_true", help="使用并行图")
+    parser.add_argument("--feature-fanout", action="store_true", help="功能列表按 map-reduce 拆分生成")
+    parser.add_argument("--api-shard-size", type=int, default=0, help="每个 API 分片包含的实体数，0 表示不分片")
+    parser.add_argument("--fused", action="store_true", help="数据模型、API 与 NFR 合并为一次调用")
+    parser.add_argument(
+        "--single-flight", action="store_true", help="合并同时发出的相同请求（各次运行的提示词相同，默认关闭）"
+    )
+    parser.add_argument("--budgets", type=Path, help="按节点的上下文 token 预算 JSON 文件（见 src/budget.py）")
+    parser.add_argument("--json", type=Path, help="将结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    context = multiprocessing.get_context("spawn")
+    results: List[Dict[str, Any]] = []
+    for scenario in args.scenario or list(SCENARIOS):
+        options = {
+            "scenario": scenario,
+            "concurrency": args.concurrency,
+            "runs": args.runs,
+            "latency_ms": args.latency_ms,
+            "sigma": args.sigma,
+            "seed": args.seed,
+            "parallel": args.parallel,
+            "feature_fanout": args.feature_fanout,
+            "api_shard_size": args.api_shard_size,
+            "single_flight": args.single_flight,
+            "fused": args.fused,
+            "ms_per_token": args.ms_per_token,
+            "ms_per_input_token": args.ms_per_input_token,
+            "prefix_cache": args.prefix_cache,
+            "budgets": str(args.budgets) if args.budgets else None,
+        }
+        with context.Pool(1) as pool:
+            results.append(pool.apply(_run_scenario, (options,)))
+    print(_format(results))
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,22 +1,111 @@
 """Entry-point for running the LangGraph PRD agent."""
 from __future__ import annotations
 
+import asyncio
 from pathlib import Path
+from typing import Any
 
 import typer
 
-from src.graph import build_graph
-from src.llm import configure_llm
-from src.state import PRDState
+from src.batch import load_items, run_batch
+from src.checkpoint import aopen_checkpointer, compact_checkpoints, open_checkpointer
+from src.dedup import DedupIndex
+from src.graph import agenerate_prd, generate_prd, regenerate_prd
+from src.hedging import HedgePolicy
+from src.incremental import SECTION_NODES
+from src.llm import (
+    configure_llm,
+    get_budgeter,
+    get_cache,
+    get_cassette,
+    get_hedger,
+    get_router,
+    get_single_flight,
+)
+from src.nodes.assembler import SECTION_TITLES, prd_path
+from src.prefetch import get_prefetcher
+from src.telemetry import configure_tracer, get_tracer
 
 app = typer.Typer(help="生成结构化 PRD 的 LangGraph Agent")
 
 
-@app.command()
+def _progress(mode: str, chunk: Any) -> None:
+    """Print each PRD section as soon as it has been written to disk."""
+    if mode == "custom" and isinstance(chunk, dict) and chunk.get("sections"):
+        titles = "、".join(SECTION_TITLES.get(name, name) for name in chunk["sections"])
+        typer.echo(f"已写入 {chunk['path']}：{titles}")
+
+
+def _report() -> None:
+    cache = get_cache()
+    if cache is not None:
+        stats = cache.stats()
+        typer.echo(f"缓存：命中 {stats['hits']} / 未命中 {stats['misses']}（共 {stats['entries']} 条）")
+    fallbacks = get_router().fallbacks
+    if fallbacks:
+        typer.echo("模型回退：" + ", ".join(f"{node} {count} 次" for node, count in fallbacks.items()))
+    hedger = get_hedger()
+    if hedger is not None and hedger.stats():
+        typer.echo(
+            "对冲请求："
+            + ", ".join(
+                f"{node} 发起 {counts['fired']} / 胜出 {counts['won']}"
+                for node, counts in hedger.stats().items()
+            )
+        )
+    group = get_single_flight()
+    if group is not None and group.stats():
+        typer.echo(
+            "合并的重复请求：" + ", ".join(f"{node} {count} 次" for node, count in group.stats().items())
+        )
+    cassette = get_cassette()
+    if cassette is not None:
+        stats = cassette.stats()
+        if cassette.replay:
+            typer.echo(f"回放：精确匹配 {stats['exact']} / 按节点顺序回退 {stats['fallback']}")
+        else:
+            typer.echo(f"录制：{stats['recorded']} 次调用已写入 {cassette.path}")
+    compacted = get_budgeter().stats()
+    if compacted:
+        typer.echo(
+            "上下文压缩："
+            + ", ".join(
+                f"{node} {counts['compacted']} 次，节省 {counts['tokens_saved']} token"
+                + (f"（{counts['over_budget']} 次仍超预算）" if counts["over_budget"] else "")
+                for node, counts in compacted.items()
+            )
+        )
+    prefetch = get_prefetcher().stats()
+    if prefetch["started"]:
+        typer.echo(f"预取：发起 {prefetch['started']} / 命中 {prefetch['used']}")
+    tracer = get_tracer()
+    prompt_cache = tracer.prompt_cache()
+    if prompt_cache["cached_tokens"]:
+        typer.echo(
+            f"提示词前缀缓存：{prompt_cache['cached_tokens']} / {prompt_cache['input_tokens']} 输入 token "
+            f"（{prompt_cache['cached_tokens'] * 100 // max(1, prompt_cache['input_tokens'])}%）"
+        )
+    if tracer.summary():
+        typer.echo("\n节点耗时统计：")
+        typer.echo(tracer.format_summary())
+        if tracer.trace_file is not None:
+            typer.echo(f"Trace：{tracer.trace_file.resolve()}")
+
+
+def _check_fused(fused: bool, api_shard_size: int) -> None:
+    if fused and api_shard_size:
+        raise typer.BadParameter("--fused 不能与 --api-shard-size 同时使用", param_hint="--fused")
+
+
+@app.callback(invoke_without_command=True)
 def main(
-    input: str = typer.Option(..., "--input", "-i", help="项目需求描述"),
+    ctx: typer.Context,
+    input: str | None = typer.Option(None, "--input", "-i", help="项目需求描述"),
     language: str | None = typer.Option(
-        None, "--language", "-l", help="若已确定技术栈，可直接在此指定"
+        None,
+        "--language",
+        "-l",
+        help="若已确定技术栈，可直接在此指定；多个语言用逗号分隔（如 python,java,go）时并排对比各技术栈",
     ),
     model: str | None = typer.Option(
         None, "--model", help="自定义 LLM 模型（默认 gpt-4o-mini，可通过 LLM_MODEL env 覆盖）"
@@ -26,17 +115,296 @@ def main(
         "--temperature",
         help="LLM 温度（可通过 LLM_TEMPERATURE env 覆盖）",
     ),
+    parallel: bool = typer.Option(
+        False, "--parallel", help="按节点依赖并行执行互不依赖的分支"
+    ),
+    async_mode: bool = typer.Option(
+        False, "--async", help="在事件循环中以 ainvoke 异步执行整个流程"
+    ),
+    speculative: bool = typer.Option(
+        False, "--speculative", help="上游流式输出已包含下游所需字段时提前发起下游调用"
+    ),
+    feature_fanout: bool = typer.Option(
+        False, "--feature-fanout", help="先列出功能名称，再为每个功能并行生成详情（适合大型产品）"
+    ),
+    api_shard_size: int = typer.Option(
+        0, "--api-shard-size", help="按实体分片并发生成 API，每片包含的实体数（0 表示不分片）"
+    ),
+    fused: bool = typer.Option(
+        False, "--fused", help="数据模型、API 与 NFR 合并为一次 LLM 调用（缺失的章节回退为单独调用）"
+    ),
+    routes: Path | None = typer.Option(
+        None,
+        "--routes",
+        help="按节点配置模型/温度及延迟回退的 JSON 文件（也可通过 LLM_ROUTES_FILE env 指定）",
+    ),
+    hedge: bool = typer.Option(
+        False, "--hedge", help="调用耗时超过该节点近期延迟分位数时发起重复请求，取先返回者"
+    ),
+    hedge_percentile: float = typer.Option(95.0, "--hedge-percentile", help="触发对冲的首分片耗时分位数"),
+    hedge_max_per_run: int = typer.Option(
+        2, "--hedge-max-per-run", help="每次生成 PRD 最多发起的对冲请求数（额外花费上限）"
+    ),
+    no_single_flight: bool = typer.Option(
+        False, "--no-single-flight", help="不合并同时发出的相同 LLM 请求（默认合并为一次调用）"
+    ),
+    budgets: Path | None = typer.Option(
+        None,
+        "--budgets",
+        help="按节点配置上下文 token 预算及压缩规则的 JSON 文件（也可通过 LLM_BUDGETS_FILE env 指定）",
+    ),
+    record_cassette: Path | None = typer.Option(
+        None, "--record-cassette", help="把每次 LLM 调用的回复与耗时录制到该文件（.gz 结尾则压缩）"
+    ),
+    replay_cassette: Path | None = typer.Option(
+        None, "--replay-cassette", help="不访问网络，按录制文件回放 LLM 回复与耗时"
+    ),
+    replay_scale: float = typer.Option(
+        1.0, "--replay-scale", help="回放耗时的缩放倍数（0 表示不等待）"
+    ),
+    cache_dir: str | None = typer.Option(
+        None, "--cache-dir", help="LLM 响应磁盘缓存目录（也可通过 LLM_CACHE_DIR env 开启）"
+    ),
+    no_cache: bool = typer.Option(False, "--no-cache", help="禁用 LLM 响应缓存"),
+    trace_file: Path | None = typer.Option(
+        None, "--trace-file", help="将每个节点调用的 span 以 JSON Lines 写入该文件"
+    ),
+    thread_id: str | None = typer.Option(
+        None, "--thread-id", help="启用检查点：每个节点完成后写入 SQLite，崩溃后可按此 id 恢复"
+    ),
+    resume: bool = typer.Option(
+        False, "--resume", help="从 --thread-id 的最后一个检查点继续（无需 --input）"
+    ),
+    checkpoint_db: Path = typer.Option(
+        Path("outputs/checkpoints.sqlite3"), "--checkpoint-db", help="检查点数据库路径"
+    ),
+    keep_threads: int = typer.Option(
+        200, "--keep-threads", help="检查点库最多保留的线程数（更早的线程自动清理）"
+    ),
+    dedup_index: Path | None = typer.Option(
+        None, "--dedup-index", help="近似需求索引路径：相似需求直接复用意图/功能/架构章节"
+    ),
+    dedup_threshold: float = typer.Option(
+        0.8, "--dedup-threshold", help="复用所需的最低相似度（MinHash 估计的 Jaccard）"
+    ),
 ) -> None:
-    configure_llm(model=model, temperature=temperature)
-    graph = build_graph()
-    initial_state: PRDState = {"user_input": input}
-    if language:
-        initial_state["tech_stack"] = language
-    result = graph.invoke(initial_state)
-    output_path = Path("outputs/prd.md").resolve()
-    typer.secho(f"PRD 已生成：{output_path}", fg="green")
+    configure_tracer(trace_file)
+    configure_llm(
+        model=model,
+        temperature=temperature,
+        cache_dir=cache_dir,
+        cache=False if no_cache else None,
+        routes=str(routes) if routes else None,
+        hedge=HedgePolicy(percentile=hedge_percentile, max_per_run=hedge_max_per_run) if hedge else None,
+        single_flight=False if no_single_flight else None,
+        budgets=str(budgets) if budgets else None,
+        record=str(record_cassette) if record_cassette else None,
+        replay=str(replay_cassette) if replay_cassette else None,
+        replay_scale=replay_scale if replay_cassette else None,
+    )
+    if ctx.invoked_subcommand is not None:
+        return
+    _check_fused(fused, api_shard_size)
+    if resume and not thread_id:
+        raise typer.BadParameter("--resume 需要同时指定 --thread-id", param_hint="--resume")
+    if not input and not resume:
+        raise typer.BadParameter("请通过 --input 提供项目需求描述", param_hint="--input")
+    options = {
+        "language": language,
+        "parallel": parallel,
+        "speculative": speculative,
+        "feature_fanout": feature_fanout,
+        "api_shard_size": api_shard_size,
+        "fused": fused,
+        "dedup": DedupIndex(dedup_index, threshold=dedup_threshold) if dedup_index else None,
+        "on_event": _progress,
+    }
+    try:
+        if not thread_id:
+            if async_mode:
+                result = asyncio.run(agenerate_prd(input or "", **options))
+            else:
+                result = generate_prd(input or "", **options)
+        elif async_mode:
+
+            async def _run_async() -> dict:
+                async with aopen_checkpointer(checkpoint_db) as saver:
+                    return await agenerate_prd(
+                        input or "", checkpointer=saver, thread_id=thread_id, resume=resume, **options
+                    )
+
+            result = asyncio.run(_run_async())
+        else:
+            with open_checkpointer(checkpoint_db) as saver:
+                result = generate_prd(
+                    input or "", checkpointer=saver, thread_id=thread_id, resume=resume, **options
+                )
+    except ValueError as exc:
+        typer.secho(str(exc), fg="red")
+        raise typer.Exit(code=1)
+    if thread_id:
+        compact_checkpoints(checkpoint_db, finished_threads=[thread_id], keep_threads=keep_threads)
+    typer.secho(f"PRD 已生成：{prd_path(result).resolve()}", fg="green")
     if result.get("project_name"):
         typer.echo(f"项目：{result['project_name']}")
+    if result.get("reused_sections"):
+        typer.echo(
+            f"复用近似需求（相似度 {result.get('reuse_similarity', 0):.2f}）："
+            f"{', '.join(result['reused_sections'])}"
+        )
+    _report()
+
+
+@app.command()
+def batch(
+    file: Path = typer.Argument(..., exists=True, dir_okay=False, help="JSONL 或 CSV 需求列表"),
+    out_dir: Path = typer.Option(Path("outputs/batch"), "--out-dir", help="每条 PRD 与 manifest 的输出目录"),
+    concurrency: int = typer.Option(4, "--concurrency", "-n", help="同时生成的 PRD 数量"),
+    language: str = typer.Option("python", "--language", "-l", help="条目未指定 language 时使用的技术栈"),
+    parallel: bool = typer.Option(False, "--parallel", help="单条 PRD 内部按节点依赖并行"),
+    speculative: bool = typer.Option(False, "--speculative", help="单条 PRD 内部启用流式预取"),
+    feature_fanout: bool = typer.Option(
+        False, "--feature-fanout", help="单条 PRD 内部按功能拆分并行生成功能详情"
+    ),
+    api_shard_size: int = typer.Option(
+        0, "--api-shard-size", help="单条 PRD 内部按实体分片并发生成 API（0 表示不分片）"
+    ),
+    fused: bool = typer.Option(
+        False, "--fused", help="单条 PRD 内部将数据模型、API 与 NFR 合并为一次 LLM 调用"
+    ),
+    checkpoint_db: Path | None = typer.Option(
+        None, "--checkpoint-db", help="为每个条目启用检查点（线程 id 即条目 id），重跑时从中断处继续"
+    ),
+    resume: bool = typer.Option(True, "--resume/--no-resume", help="跳过 manifest 中已成功的条目"),
+    dedup_index: Path | None = typer.Option(
+        None, "--dedup-index", help="近似需求索引路径：相似条目直接复用意图/功能/架构章节"
+    ),
+    dedup_threshold: float = typer.Option(0.8, "--dedup-threshold", help="复用所需的最低相似度"),
+) -> None:
+    """批量生成 PRD：共享一个已编译的图与 LLM 客户端，并发执行并写出 manifest。"""
+    _check_fused(fused, api_shard_size)
+    items = load_items(file)
+    entries = asyncio.run(
+        run_batch(
+            items,
+            out_dir,
+            concurrency=concurrency,
+            parallel=parallel,
+            speculative=speculative,
+            feature_fanout=feature_fanout,
+            api_shard_size=api_shard_size,
+            fused=fused,
+            checkpoint_db=checkpoint_db,
+            default_language=language,
+            resume=resume,
+            dedup=DedupIndex(dedup_index, threshold=dedup_threshold) if dedup_index else None,
+        )
+    )
+    ok = sum(1 for entry in entries if entry.get("status") == "ok")
+    failed = [entry for entry in entries if entry.get("status") != "ok"]
+    typer.secho(f"批量完成：成功 {ok} / 共 {len(items)}", fg="green" if not failed else "yellow")
+    for entry in failed:
+        typer.secho(f"  {entry['id']}：{entry.get('error', '')}", fg="red")
+    typer.echo(f"Manifest：{(out_dir / 'manifest.jsonl').resolve()}")
+    _report()
+    if failed:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def regenerate(
+    prd: Path = typer.Argument(Path("outputs/prd.md"), help="上一次生成的 PRD（同目录下需有 .state.json）"),
+    input: str | None = typer.Option(None, "--input", "-i", help="更新后的需求描述（默认沿用上次）"),
+    language: str | None = typer.Option(None, "--language", "-l", help="改用的技术栈（默认沿用上次）"),
+    parallel: bool = typer.Option(False, "--parallel", help="按节点依赖并行执行互不依赖的分支"),
+    speculative: bool = typer.Option(False, "--speculative", help="启用流式预取"),
+    feature_fanout: bool = typer.Option(
+        False, "--feature-fanout", help="功能列表需要重新生成时按功能拆分并行生成"
+    ),
+    api_shard_size: int = typer.Option(
+        0, "--api-shard-size", help="API 需要重新生成时按实体分片并发（0 表示不分片）"
+    ),
+    fused: bool = typer.Option(
+        False, "--fused", help="数据模型、API 与 NFR 都需要重新生成时合并为一次 LLM 调用"
+    ),
+) -> None:
+    """增量重新生成：只重跑输入指纹发生变化的章节，并只改写 PRD 中受影响的部分。"""
+    _check_fused(fused, api_shard_size)
+    try:
+        result = regenerate_prd(
+            str(prd),
+            language=language,
+            user_input=input,
+            parallel=parallel,
+            speculative=speculative,
+            feature_fanout=feature_fanout,
+            api_shard_size=api_shard_size,
+            fused=fused,
+        )
+    except ValueError as exc:
+        typer.secho(str(exc), fg="red")
+        raise typer.Exit(code=1)
+    reused = result.get("reused_sections", [])
+    rerun = [node.name for node in SECTION_NODES if node.name not in reused]
+    typer.secho(f"PRD 已更新：{prd.resolve()}", fg="green")
+    typer.echo(f"重新生成：{', '.join(rerun) or '无'}")
+    typer.echo(f"沿用上次：{', '.join(reused) or '无'}")
+    _report()
+
+
+@app.command()
+def serve(
+    host: str = typer.Option("127.0.0.1", "--host", help="监听地址"),
+    port: int = typer.Option(8765, "--port", help="监听端口"),
+    out_dir: Path = typer.Option(Path("outputs/serve"), "--out-dir", help="每个任务 PRD 的输出目录"),
+    concurrency: int = typer.Option(8, "--concurrency", "-n", help="同时生成的 PRD 数量"),
+    language: str = typer.Option("python", "--language", "-l", help="请求未指定 language 时使用的技术栈"),
+    parallel: bool = typer.Option(True, "--parallel/--sequential", help="单条 PRD 内部按节点依赖并行"),
+    speculative: bool = typer.Option(False, "--speculative", help="单条 PRD 内部启用流式预取"),
+    feature_fanout: bool = typer.Option(
+        False, "--feature-fanout", help="单条 PRD 内部按功能拆分并行生成功能详情"
+    ),
+    api_shard_size: int = typer.Option(
+        0, "--api-shard-size", help="单条 PRD 内部按实体分片并发生成 API（0 表示不分片）"
+    ),
+    fused: bool = typer.Option(
+        False, "--fused", help="单条 PRD 内部将数据模型、API 与 NFR 合并为一次 LLM 调用"
+    ),
+    keepalive: float = typer.Option(
+        90.0, "--keepalive", help="到 LLM 服务的空闲 HTTP 连接保留秒数（连接池复用，避免重复 TLS 握手）"
+    ),
+    dedup_index: Path | None = typer.Option(
+        None, "--dedup-index", help="近似需求索引路径：相似请求直接复用意图/功能/架构章节"
+    ),
+    dedup_threshold: float = typer.Option(0.8, "--dedup-threshold", help="复用所需的最低相似度"),
+) -> None:
+    """常驻 HTTP 服务：预编译图、复用 LLM 连接池，并发处理提交的 PRD 任务。"""
+    _check_fused(fused, api_shard_size)
+    from src.server import PRDServer, PRDService
+
+    configure_llm(keepalive_s=keepalive)
+    service = PRDService(
+        out_dir,
+        concurrency=concurrency,
+        default_language=language,
+        parallel=parallel,
+        speculative=speculative,
+        feature_fanout=feature_fanout,
+        api_shard_size=api_shard_size,
+        fused=fused,
+        dedup=DedupIndex(dedup_index, threshold=dedup_threshold) if dedup_index else None,
+    )
+    service.start()
+    server = PRDServer((host, port), service)
+    typer.secho(f"PRD 服务已启动：http://{host}:{server.server_port}", fg="green")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        _report()
 
 
 if __name__ == "__main__":
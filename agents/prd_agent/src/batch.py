@@ -0,0 +1,172 @@
+"""Bulk PRD generation with bounded concurrency and a resumable manifest."""
+from __future__ import annotations
+
+import asyncio
+import csv
+import json
+import re
+import time
+from contextlib import AsyncExitStack
+from pathlib import Path
+from typing import Any, Dict, List, TypedDict
+
+from src.checkpoint import aopen_checkpointer, compact_checkpoints
+from src.dedup import DedupIndex
+from src.graph import agenerate_prd
+from src.telemetry import run_context
+
+
+class BatchItem(TypedDict, total=False):
+    id: str
+    input: str
+    language: str
+
+
+class ManifestEntry(TypedDict, total=False):
+    id: str
+    status: str
+    output: str
+    latency_s: float
+    project_name: str
+    reused_sections: List[str]
+    error: str
+
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def _safe_id(raw: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", raw).strip("._") or "item"
+
+
+def _normalize_item(raw: Dict[str, Any], index: int) -> BatchItem:
+    text = raw.get("input") or raw.get("user_input") or raw.get("requirement")
+    if not text:
+        raise ValueError(f"第 {index} 条缺少 input 字段：{raw}")
+    item: BatchItem = {
+        "id": _safe_id(str(raw.get("id") or f"item-{index:05d}")),
+        "input": str(text),
+    }
+    if raw.get("language"):
+        item["language"] = str(raw["language"])
+    return item
+
+
+def load_items(path: Path) -> List[BatchItem]:
+    """Read requirements from JSONL (one object per line) or CSV (header row)."""
+    rows: List[Dict[str, Any]] = []
+    with path.open(encoding="utf-8", newline="") as handle:
+        if path.suffix.lower() == ".csv":
+            rows = list(csv.DictReader(handle))
+        else:
+            rows = [json.loads(line) for line in handle if line.strip()]
+    items = [_normalize_item(row, index) for index, row in enumerate(rows, start=1)]
+    seen: set[str] = set()
+    for item in items:
+        if item["id"] in seen:
+            raise ValueError(f"批量任务 id 重复：{item['id']}")
+        seen.add(item["id"])
+    return items
+
+
+def load_manifest(out_dir: Path) -> Dict[str, ManifestEntry]:
+    """Latest manifest entry per item id; later lines win."""
+    manifest_path = out_dir / MANIFEST_NAME
+    entries: Dict[str, ManifestEntry] = {}
+    if manifest_path.exists():
+        for line in manifest_path.read_text(encoding="utf-8").splitlines():
+            if line.strip():
+                entry: ManifestEntry = json.loads(line)
+                entries[entry["id"]] = entry
+    return entries
+
+
+def _is_done(entry: ManifestEntry | None) -> bool:
+    return bool(entry and entry.get("status") == "ok" and Path(entry["output"]).exists())
+
+
+async def run_batch(
+    items: List[BatchItem],
+    out_dir: Path,
+    concurrency: int = 4,
+    parallel: bool = True,
+    speculative: bool = False,
+    feature_fanout: bool = False,
+    api_shard_size: int = 0,
+    fused: bool = False,
+    checkpoint_db: Path | None = None,
+    default_language: str = "python",
+    resume: bool = True,
+    dedup: DedupIndex | None = None,
+) -> List[ManifestEntry]:
+    """Generate every item on one event loop, at most ``concurrency`` at a time.
+
+    Each finished item is appended to ``manifest.jsonl`` immediately, so a
+    rerun with ``resume=True`` skips everything that already succeeded. With
+    ``checkpoint_db`` each item is also checkpointed per node under its id, so
+    an item interrupted mid-pipeline continues from its last finished node.
+    A finished item's markdown and manifest line are its durable record, so
+    its checkpoints are dropped as soon as it succeeds.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    previous = load_manifest(out_dir) if resume else {}
+    pending = [item for item in items if not _is_done(previous.get(item["id"]))]
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    manifest = (out_dir / MANIFEST_NAME).open("a" if resume else "w", encoding="utf-8")
+    stack = AsyncExitStack()
+    saver = await stack.enter_async_context(aopen_checkpointer(checkpoint_db)) if checkpoint_db else None
+
+    async def _run(item: BatchItem) -> ManifestEntry:
+        output = out_dir / f"{item['id']}.md"
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                with run_context(item["id"]):
+                    state = await agenerate_prd(
+                        item["input"],
+                        language=item.get("language") or default_language,
+                        parallel=parallel,
+                        speculative=speculative,
+                        feature_fanout=feature_fanout,
+                        api_shard_size=api_shard_size,
+                        fused=fused,
+                        output_path=str(output),
+                        checkpointer=saver,
+                        thread_id=item["id"] if saver is not None else None,
+                        resume=None if resume else False,
+                        dedup=dedup,
+                    )
+                entry: ManifestEntry = {
+                    "id": item["id"],
+                    "status": "ok",
+                    "output": str(output),
+                    "project_name": state.get("project_name", ""),
+                }
+                if state.get("reused_sections"):
+                    entry["reused_sections"] = list(state["reused_sections"])
+            except Exception as exc:  # noqa: BLE001 - recorded per item, batch keeps going
+                entry = {
+                    "id": item["id"],
+                    "status": "error",
+                    "output": str(output),
+                    "error": f"{type(exc).__name__}: {exc}",
+                }
+            entry["latency_s"] = round(time.perf_counter() - started, 3)
+        if checkpoint_db is not None and entry["status"] == "ok":
+            await asyncio.to_thread(
+                compact_checkpoints, checkpoint_db, keep_threads=None, drop_threads=[item["id"]]
+            )
+        manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        manifest.flush()
+        return entry
+
+    try:
+        await asyncio.gather(*(_run(item) for item in pending))
+    finally:
+        manifest.close()
+        await stack.aclose()
+    latest = load_manifest(out_dir)
+    return [latest[item["id"]] for item in items if item["id"] in latest]
+
+
+__all__ = ["BatchItem", "ManifestEntry", "load_items", "load_manifest", "run_batch"]
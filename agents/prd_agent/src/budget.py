@@ -0,0 +1,236 @@
+"""Per-node token budgets for prompt context and deterministic compaction over budget.
+
+Budgets come from a JSON file (``--budgets`` or ``LLM_BUDGETS_FILE``) keyed by
+node name, with an optional ``default`` entry::
+
+    {
+      "default": {"max_tokens": 16000},
+      "api_shard": {"max_tokens": 2000, "max_items": 200},
+      "nfr": {"max_tokens": 1500, "max_chars": 300, "keep": ["project_name"]}
+    }
+
+and per-node env overrides such as ``LLM_CONTEXT_TOKENS_API``. A context
+over ``max_tokens`` is compacted in steps until it fits: lists are
+deduplicated, then long strings are cut to ``max_chars`` and lists to
+``max_items`` (with a ``... (+N more)`` marker), then both limits are halved
+until they bottom out. Fields in ``keep`` are never touched. The same values
+always compact the same way, so prompts stay byte-stable for the prefetcher,
+the response cache and provider prefix caching. Each compaction is written
+to the trace file as a ``context_compacted`` event.
+
+``tiktoken`` downloads its BPE file on first use; offline, point
+``TIKTOKEN_CACHE_DIR`` at a directory holding it, or token counts fall back
+to the character estimate of :func:`count_tokens`.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, Iterator, Mapping, Optional, Sequence
+
+from src.telemetry import get_tracer
+
+DEFAULT_BUDGET = "default"
+DEFAULT_MAX_TOKENS = 16000
+
+# Floors of the halving steps; below these a context is sent as compacted as it gets.
+_MIN_ITEMS = 8
+_MIN_CHARS = 80
+
+
+@lru_cache(maxsize=1)
+def _encoding() -> Any:
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(os.getenv("LLM_TOKENIZER", "o200k_base"))
+    except Exception:  # noqa: BLE001 - not installed, or its BPE file is neither cached nor downloadable
+        return None
+
+
+def tokenizer_name() -> str:
+    """The encoding :func:`count_tokens` uses, or ``"estimate"`` without one."""
+    encoding = _encoding()
+    return encoding.name if encoding is not None else "estimate"
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in ``text`` per the local tokenizer (``tiktoken``), else an estimate.
+
+    The estimate counts four ASCII characters, or one other character, per token.
+    """
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return -(-ascii_chars // 4) + len(text) - ascii_chars
+
+
+@dataclass(frozen=True)
+class BudgetRule:
+    max_tokens: int = DEFAULT_MAX_TOKENS
+    max_items: int = 100
+    max_chars: int = 600
+    keep: FrozenSet[str] = frozenset()
+
+
+def load_budgets(path: str | Path | None) -> Dict[str, Dict[str, Any]]:
+    if not path:
+        return {}
+    try:
+        budgets = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError) as exc:
+        raise ValueError(f"无法读取上下文预算配置 {path}：{exc}") from exc
+    if not isinstance(budgets, dict) or not all(isinstance(value, dict) for value in budgets.values()):
+        raise ValueError(f"上下文预算配置 {path} 应为 {{节点名: {{max_tokens, max_items, ...}}}}")
+    return budgets
+
+
+def _dedupe(items: Sequence[Any]) -> list:
+    seen = set()
+    unique = []
+    for item in items:
+        key = item.strip().casefold() if isinstance(item, str) else json.dumps(item, sort_keys=True, default=str)
+        if key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique
+
+
+def _shorten(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    # Prefer ending on a sentence or word boundary in the last fifth of the allowance.
+    for stop in ("。", ". ", "；", "; ", "，", ", ", " "):
+        index = cut.rfind(stop)
+        if index >= max_chars * 4 // 5:
+            cut = cut[: index + len(stop)]
+            break
+    return f"{cut.rstrip()}..."
+
+
+def _compact(value: Any, max_items: Optional[int], max_chars: Optional[int]) -> Any:
+    if isinstance(value, str):
+        return _shorten(value, max_chars) if max_chars else value
+    if isinstance(value, list):
+        items = _dedupe(value)
+        dropped = 0
+        if max_items is not None and len(items) > max_items:
+            dropped = len(items) - max_items
+            items = items[:max_items]
+        items = [_compact(item, max_items, max_chars) for item in items]
+        return items + [f"... (+{dropped} more)"] if dropped else items
+    if isinstance(value, dict):
+        return {key: _compact(item, max_items, max_chars) for key, item in value.items()}
+    return value
+
+
+def _steps(rule: BudgetRule) -> Iterator[tuple[Optional[int], Optional[int]]]:
+    """``(max_items, max_chars)`` per compaction step, gentlest first."""
+    yield None, None  # dedupe only
+    items, chars = rule.max_items, rule.max_chars
+    while True:
+        yield items, chars
+        if items <= _MIN_ITEMS and chars <= _MIN_CHARS:
+            return
+        items, chars = max(_MIN_ITEMS, items // 2), max(_MIN_CHARS, chars // 2)
+
+
+class ContextBudgeter:
+    """Measures each node's rendered context and compacts it when it exceeds the node's budget."""
+
+    def __init__(self, budgets: Dict[str, Dict[str, Any]] | None = None) -> None:
+        self.budgets = budgets or {}
+        self._rules: Dict[str, BudgetRule] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def rule(self, node: str) -> BudgetRule:
+        rule = self._rules.get(node)
+        if rule is None:
+            rule = self._resolve(node)
+            self._rules[node] = rule
+        return rule
+
+    def _resolve(self, node: str) -> BudgetRule:
+        # A variant such as "architecture:go" is budgeted like its base node.
+        base = node.split(":", 1)[0]
+        config = {
+            **self.budgets.get(DEFAULT_BUDGET, {}),
+            **(self.budgets.get(node) or self.budgets.get(base, {})),
+        }
+        max_tokens = os.getenv(f"LLM_CONTEXT_TOKENS_{base.upper()}") or config.get("max_tokens")
+        return BudgetRule(
+            max_tokens=int(max_tokens) if max_tokens is not None else DEFAULT_MAX_TOKENS,
+            max_items=max(1, int(config.get("max_items", BudgetRule.max_items))),
+            max_chars=max(1, int(config.get("max_chars", BudgetRule.max_chars))),
+            keep=frozenset(config.get("keep", ())),
+        )
+
+    def fit(self, node: str, values: Mapping[str, Any], render: Callable[[Mapping[str, Any]], str]) -> str:
+        """``render(values)``, compacted step by step while it exceeds ``node``'s budget.
+
+        ``max_tokens`` of 0 disables the budget for the node.
+        """
+        text = render(values)
+        rule = self.rule(node)
+        # A token is at least one UTF-8 byte, so short contexts skip tokenization.
+        if not rule.max_tokens or len(text.encode("utf-8")) <= rule.max_tokens:
+            return text
+        before = count_tokens(text)
+        if before <= rule.max_tokens:
+            return text
+        after = before
+        for max_items, max_chars in _steps(rule):
+            compacted = {
+                key: value if key in rule.keep else _compact(value, max_items, max_chars)
+                for key, value in values.items()
+            }
+            text = render(compacted)
+            after = count_tokens(text)
+            if after <= rule.max_tokens:
+                break
+        self._record(node, before, after)
+        return text
+
+    def _record(self, node: str, before: int, after: int) -> None:
+        max_tokens = self.rule(node).max_tokens
+        get_tracer().event(
+            node,
+            "context_compacted",
+            tokens_before=before,
+            tokens_after=after,
+            tokens_saved=before - after,
+            max_tokens=max_tokens,
+            tokenizer=tokenizer_name(),
+        )
+        with self._lock:
+            stats = self._stats.setdefault(
+                node, {"compacted": 0, "tokens_before": 0, "tokens_after": 0, "over_budget": 0}
+            )
+            stats["compacted"] += 1
+            stats["tokens_before"] += before
+            stats["tokens_after"] += after
+            stats["over_budget"] += int(after > max_tokens)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Per node: compacted contexts, their tokens before/after and how many still did not fit."""
+        with self._lock:
+            return {
+                node: {**stats, "tokens_saved": stats["tokens_before"] - stats["tokens_after"]}
+                for node, stats in self._stats.items()
+            }
+
+
+__all__ = [
+    "BudgetRule",
+    "ContextBudgeter",
+    "count_tokens",
+    "load_budgets",
+    "tokenizer_name",
+]
@@ -0,0 +1,230 @@
+"""Persistent, content-addressed cache for chat completions."""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence
+
+from langchain_core.messages import (
+    AIMessageChunk,
+    BaseMessage,
+    message_to_dict,
+    messages_from_dict,
+    messages_to_dict,
+)
+
+from src.proxy import ChatModelProxy, chunk_to_message, message_to_chunk
+from src.utils import PARSE_EMPTY, extract_json_with_outcome, message_to_str
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at);
+"""
+
+
+class ResponseCache:
+    """SQLite store of serialized replies with LRU eviction and optional TTL.
+
+    ``max_bytes`` bounds the total payload size; once exceeded the least
+    recently read entries are dropped. Entries older than ``ttl_seconds``
+    count as misses and are deleted on access.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: float | None = None,
+    ) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+
+    @staticmethod
+    def make_key(
+        model: str,
+        temperature: float | None,
+        base_url: str | None,
+        messages: Sequence[BaseMessage],
+        **kwargs: Any,
+    ) -> str:
+        material = json.dumps(
+            {
+                "model": model,
+                "temperature": temperature,
+                "base_url": base_url,
+                "messages": messages_to_dict(list(messages)),
+                "kwargs": kwargs,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[BaseMessage]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            payload, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        message = messages_from_dict([json.loads(payload)])[0]
+        message.response_metadata = {**message.response_metadata, "cache_hit": True}
+        return message
+
+    def put(self, key: str, message: BaseMessage) -> None:
+        payload = json.dumps(message_to_dict(message), ensure_ascii=False)
+        size = len(payload.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, payload, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, payload, size, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+        ).fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _cacheable(message: BaseMessage) -> bool:
+    """Whether the reply parses as JSON."""
+    return extract_json_with_outcome(message_to_str(message))[1] != PARSE_EMPTY
+
+
+class CachedChatModel(ChatModelProxy):
+    """Serves repeated (model, temperature, base_url, messages) calls from disk.
+
+    Only replies that parse as JSON are stored, so a malformed or truncated
+    reply is retried on the next call instead of being served from the cache.
+    """
+
+    def __init__(
+        self,
+        inner: Any,
+        cache: ResponseCache,
+        model: str,
+        temperature: float | None,
+        base_url: str | None,
+    ) -> None:
+        super().__init__(inner)
+        self.cache = cache
+        self._key_params = {"model": model, "temperature": temperature, "base_url": base_url}
+
+    def _key(self, messages: Sequence[BaseMessage], kwargs: Dict[str, Any]) -> str:
+        return ResponseCache.make_key(messages=messages, **self._key_params, **kwargs)
+
+    def invoke(self, messages: Sequence[BaseMessage], **kwargs: Any) -> BaseMessage:
+        key = self._key(messages, kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        result = self.inner.invoke(messages, **kwargs)
+        if _cacheable(result):
+            self.cache.put(key, result)
+        return result
+
+    async def ainvoke(self, messages: Sequence[BaseMessage], **kwargs: Any) -> BaseMessage:
+        key = self._key(messages, kwargs)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            return cached
+        result = await self.inner.ainvoke(messages, **kwargs)
+        if _cacheable(result):
+            await asyncio.to_thread(self.cache.put, key, result)
+        return result
+
+    def stream(self, messages: Sequence[BaseMessage], **kwargs: Any) -> Iterator[AIMessageChunk]:
+        key = self._key(messages, kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield message_to_chunk(cached)
+            return
+        full: AIMessageChunk | None = None
+        for chunk in self.inner.stream(messages, **kwargs):
+            full = chunk if full is None else full + chunk
+            yield chunk
+        if full is not None:
+            message = chunk_to_message(full)
+            if _cacheable(message):
+                self.cache.put(key, message)
+
+    async def astream(
+        self, messages: Sequence[BaseMessage], **kwargs: Any
+    ) -> AsyncIterator[AIMessageChunk]:
+        key = self._key(messages, kwargs)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            yield message_to_chunk(cached)
+            return
+        full: AIMessageChunk | None = None
+        async for chunk in self.inner.astream(messages, **kwargs):
+            full = chunk if full is None else full + chunk
+            yield chunk
+        if full is not None:
+            message = chunk_to_message(full)
+            if _cacheable(message):
+                await asyncio.to_thread(self.cache.put, key, message)
+
+
+__all__ = ["CachedChatModel", "ResponseCache"]
@@ -0,0 +1,265 @@
+"""Record real LLM replies into a cassette and replay them offline with their timing.
+
+A cassette is a JSON Lines file (gzip-compressed when the name ends in
+``.gz``) with one line per model call::
+
+    {"key": "...", "node": "api", "model": "gpt-4o", "content": "{...}",
+     "usage": {...}, "chunks": 42, "ttft_ms": 812.4, "total_ms": 9120.7}
+
+``key`` hashes the model, temperature and messages; the prompt itself is not
+stored. Recording wraps the bare client, so timings are the provider's, not
+our rate limiting or queueing. Replay serves a call from the entry with the
+same key, or, when the prompt changed (e.g. a commit edited a template), from
+the node's recorded calls in turn, so the same cassette can drive two
+versions of the pipeline; such calls are counted as ``fallback``. Replayed
+streams wait the recorded time to first token and spread the rest of the
+recorded duration over the recorded number of chunks, all multiplied by
+``scale`` (0 replays instantly).
+"""
+from __future__ import annotations
+
+import asyncio
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import IO, Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, messages_to_dict
+
+from src.proxy import ChatModelProxy, chunk_to_message
+
+
+class CassetteMiss(LookupError):
+    """Replay has no recorded call for the node."""
+
+
+def _open(path: Path, mode: str) -> IO[str]:
+    if path.suffix == ".gz":
+        return gzip.open(path, mode, encoding="utf-8")  # type: ignore[return-value]
+    return path.open(mode, encoding="utf-8")
+
+
+class Cassette:
+    """A recording (``replay=False``) or replaying cassette file.
+
+    Recording appends each call as it completes, so a crashed run keeps what
+    it recorded; each append is its own gzip member, which gzip readers
+    concatenate.
+    """
+
+    def __init__(self, path: str | Path, replay: bool = False, scale: float = 1.0) -> None:
+        self.path = Path(path)
+        self.replay = replay
+        self.scale = scale
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._by_node: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._turns: Dict[tuple[str, str], int] = defaultdict(int)
+        self._stats = {"recorded": 0, "exact": 0, "fallback": 0}
+        if replay:
+            self._load()
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _load(self) -> None:
+        try:
+            with _open(self.path, "rt") as handle:
+                entries = [json.loads(line) for line in handle if line.strip()]
+        except (OSError, ValueError) as exc:
+            raise ValueError(f"无法读取回放文件 {self.path}：{exc}") from exc
+        for entry in entries:
+            self._by_key[entry["key"]].append(entry)
+            self._by_node[entry["node"]].append(entry)
+
+    @staticmethod
+    def make_key(model: str, temperature: float | None, messages: Sequence[BaseMessage]) -> str:
+        material = json.dumps(
+            {"model": model, "temperature": temperature, "messages": messages_to_dict(list(messages))},
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()[:32]
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            with _open(self.path, "at") as handle:
+                handle.write(line)
+            self._stats["recorded"] += 1
+
+    def lookup(self, key: str, node: str) -> Dict[str, Any]:
+        """The recorded call for ``key``, else the node's next recorded call."""
+        with self._lock:
+            entries, kind = self._by_key.get(key), "exact"
+            if not entries:
+                entries, kind = self._by_node.get(node), "fallback"
+            if not entries:
+                raise CassetteMiss(f"回放文件 {self.path} 中没有节点 {node} 的调用记录")
+            # Identical calls (repeated runs, hedges) take the recorded samples in turn.
+            turn_key = (kind, key if kind == "exact" else node)
+            turn = self._turns[turn_key]
+            self._turns[turn_key] = turn + 1
+            self._stats[kind] += 1
+            return entries[turn % len(entries)]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+
+def _text(content: Any) -> str:
+    return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+
+
+class RecordingChatModel(ChatModelProxy):
+    """Passes calls through to ``inner`` and appends each reply and its timing to the cassette."""
+
+    def __init__(
+        self, inner: Any, cassette: Cassette, node: str, model: str, temperature: float | None
+    ) -> None:
+        super().__init__(inner)
+        self.cassette = cassette
+        self.node = node
+        self._key_params = {"model": model, "temperature": temperature}
+
+    def _record(
+        self,
+        messages: Sequence[BaseMessage],
+        reply: BaseMessage,
+        chunks: int,
+        ttft_ms: Optional[float],
+        total_ms: float,
+    ) -> None:
+        self.cassette.record(
+            {
+                "key": Cassette.make_key(messages=messages, **self._key_params),
+                "node": self.node,
+                "model": self._key_params["model"],
+                "content": _text(reply.content),
+                "usage": getattr(reply, "usage_metadata", None),
+                "chunks": chunks,
+                "ttft_ms": ttft_ms,
+                "total_ms": total_ms,
+            }
+        )
+
+    def invoke(self, messages: Sequence[BaseMessage], **kwargs: Any) -> BaseMessage:
+        started = time.perf_counter()
+        result = self.inner.invoke(messages, **kwargs)
+        self._record(messages, result, 1, None, (time.perf_counter() - started) * 1000)
+        return result
+
+    async def ainvoke(self, messages: Sequence[BaseMessage], **kwargs: Any) -> BaseMessage:
+        started = time.perf_counter()
+        result = await self.inner.ainvoke(messages, **kwargs)
+        self._record(messages, result, 1, None, (time.perf_counter() - started) * 1000)
+        return result
+
+    def stream(self, messages: Sequence[BaseMessage], **kwargs: Any) -> Iterator[AIMessageChunk]:
+        started = time.perf_counter()
+        ttft_ms: Optional[float] = None
+        chunks = 0
+        full: AIMessageChunk | None = None
+        for chunk in self.inner.stream(messages, **kwargs):
+            if chunk.content:
+                chunks += 1
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - started) * 1000
+            full = chunk if full is None else full + chunk
+            yield chunk
+        if full is not None:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._record(messages, chunk_to_message(full), chunks, ttft_ms, elapsed_ms)
+
+    async def astream(
+        self, messages: Sequence[BaseMessage], **kwargs: Any
+    ) -> AsyncIterator[AIMessageChunk]:
+        started = time.perf_counter()
+        ttft_ms: Optional[float] = None
+        chunks = 0
+        full: AIMessageChunk | None = None
+        async for chunk in self.inner.astream(messages, **kwargs):
+            if chunk.content:
+                chunks += 1
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - started) * 1000
+            full = chunk if full is None else full + chunk
+            yield chunk
+        if full is not None:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._record(messages, chunk_to_message(full), chunks, ttft_ms, elapsed_ms)
+
+
+class ReplayChatModel:
+    """Stands in for the provider client, answering every call from the cassette."""
+
+    def __init__(self, cassette: Cassette, node: str, model: str, temperature: float | None) -> None:
+        self.cassette = cassette
+        self.node = node
+        self.model_name = model
+        self.temperature = temperature
+
+    def _entry(self, messages: Sequence[BaseMessage]) -> Dict[str, Any]:
+        key = Cassette.make_key(self.model_name, self.temperature, messages)
+        return self.cassette.lookup(key, self.node)
+
+    def _schedule(self, entry: Dict[str, Any]) -> tuple[float, List[str], float]:
+        """``(seconds to first chunk, chunks, seconds between chunks)``."""
+        total = entry["total_ms"] * self.cassette.scale / 1000
+        ttft_ms = entry["ttft_ms"] if entry["ttft_ms"] is not None else entry["total_ms"]
+        ttft = ttft_ms * self.cassette.scale / 1000
+        text = entry["content"]
+        count = max(1, min(entry.get("chunks") or 1, len(text)))
+        step = -(-len(text) // count) if text else 1
+        pieces = [text[idx : idx + step] for idx in range(0, len(text), step)] or [""]
+        return ttft, pieces, max(0.0, total - ttft) / len(pieces)
+
+    @staticmethod
+    def _message(entry: Dict[str, Any]) -> AIMessage:
+        return AIMessage(content=entry["content"], usage_metadata=entry.get("usage"))
+
+    @staticmethod
+    def _usage_chunk(entry: Dict[str, Any]) -> AIMessageChunk:
+        return AIMessageChunk(content="", usage_metadata=entry.get("usage"))
+
+    def invoke(self, messages: Sequence[BaseMessage], **kwargs: Any) -> BaseMessage:
+        entry = self._entry(messages)
+        time.sleep(entry["total_ms"] * self.cassette.scale / 1000)
+        return self._message(entry)
+
+    async def ainvoke(self, messages: Sequence[BaseMessage], **kwargs: Any) -> BaseMessage:
+        entry = self._entry(messages)
+        await asyncio.sleep(entry["total_ms"] * self.cassette.scale / 1000)
+        return self._message(entry)
+
+    def stream(self, messages: Sequence[BaseMessage], **kwargs: Any) -> Iterator[AIMessageChunk]:
+        entry = self._entry(messages)
+        ttft, pieces, gap = self._schedule(entry)
+        time.sleep(ttft)
+        for index, piece in enumerate(pieces):
+            if index:
+                time.sleep(gap)
+            yield AIMessageChunk(content=piece)
+        time.sleep(gap)
+        yield self._usage_chunk(entry)
+
+    async def astream(
+        self, messages: Sequence[BaseMessage], **kwargs: Any
+    ) -> AsyncIterator[AIMessageChunk]:
+        entry = self._entry(messages)
+        ttft, pieces, gap = self._schedule(entry)
+        await asyncio.sleep(ttft)
+        for index, piece in enumerate(pieces):
+            if index:
+                await asyncio.sleep(gap)
+            yield AIMessageChunk(content=piece)
+        await asyncio.sleep(gap)
+        yield self._usage_chunk(entry)
+
+
+__all__ = ["Cassette", "CassetteMiss", "RecordingChatModel", "ReplayChatModel"]
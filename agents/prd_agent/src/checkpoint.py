@@ -0,0 +1,118 @@
+"""SQLite-backed LangGraph checkpointing with automatic compaction."""
+from __future__ import annotations
+
+import sqlite3
+from contextlib import asynccontextmanager, contextmanager
+from importlib.metadata import version
+from pathlib import Path
+from typing import AsyncIterator, Iterator, Sequence
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+
+@contextmanager
+def open_checkpointer(path: str | Path) -> Iterator[SqliteSaver]:
+    """Sync saver for ``graph.invoke``; the database file is created on demand."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with SqliteSaver.from_conn_string(str(path)) as saver:
+        yield saver
+
+
+@asynccontextmanager
+async def aopen_checkpointer(path: str | Path) -> AsyncIterator[AsyncSqliteSaver]:
+    """Async saver (aiosqlite) for ``graph.ainvoke``."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    async with AsyncSqliteSaver.from_conn_string(str(path)) as saver:
+        yield saver
+
+
+# Columns of langgraph-checkpoint-sqlite's tables that the in-thread pruning
+# below relies on; the saver has no public API for dropping single checkpoints.
+_SCHEMA = {
+    "checkpoints": {"thread_id", "checkpoint_ns", "checkpoint_id"},
+    "writes": {"thread_id", "checkpoint_ns", "checkpoint_id"},
+}
+
+
+def _check_schema(cur: sqlite3.Cursor) -> None:
+    """Refuse to prune a database whose layout differs from the one expected."""
+    for table, expected in _SCHEMA.items():
+        columns = {row[1] for row in cur.execute(f"PRAGMA table_info({table})")}
+        if not expected <= columns:
+            raise RuntimeError(
+                f"检查点库的表 {table} 结构不受支持（langgraph-checkpoint-sqlite "
+                f"{version('langgraph-checkpoint-sqlite')}），缺少列：{', '.join(sorted(expected - columns))}"
+            )
+
+
+def _count(cur: sqlite3.Cursor) -> int:
+    return cur.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+
+
+def compact_checkpoints(
+    path: str | Path,
+    finished_threads: Sequence[str] = (),
+    keep_threads: int | None = 200,
+    drop_threads: Sequence[str] = (),
+) -> int:
+    """Shrink the checkpoint database and return the number of checkpoints removed.
+
+    ``finished_threads`` keep only their latest checkpoint (enough to read the
+    final state or rerun from it) and ``drop_threads`` are removed outright.
+    Beyond that only the ``keep_threads`` most recently active threads are
+    retained. Whole threads go through the saver's ``delete_thread``; trimming
+    inside a thread has no public API, so it checks the table layout first and
+    raises ``RuntimeError`` rather than guess at an unknown schema.
+    """
+    if not Path(path).exists():
+        return 0
+    with open_checkpointer(path) as saver:
+        with saver.cursor() as cur:
+            _check_schema(cur)
+            before = _count(cur)
+            stale: list[str] = list(drop_threads)
+            if keep_threads is not None:
+                stale += [
+                    row[0]
+                    for row in cur.execute(
+                        """
+                        SELECT thread_id FROM checkpoints
+                        GROUP BY thread_id
+                        ORDER BY MAX(checkpoint_id) DESC
+                        LIMIT -1 OFFSET ?
+                        """,
+                        (keep_threads,),
+                    )
+                ]
+        for thread_id in dict.fromkeys(stale):
+            saver.delete_thread(thread_id)
+        with saver.cursor() as cur:
+            for thread_id in finished_threads:
+                cur.execute(
+                    """
+                    DELETE FROM checkpoints
+                    WHERE thread_id = ?
+                      AND checkpoint_id NOT IN (
+                          SELECT MAX(checkpoint_id) FROM checkpoints AS latest
+                          WHERE latest.thread_id = checkpoints.thread_id
+                            AND latest.checkpoint_ns = checkpoints.checkpoint_ns
+                      )
+                    """,
+                    (thread_id,),
+                )
+                cur.execute(
+                    """
+                    DELETE FROM writes WHERE thread_id = ? AND NOT EXISTS (
+                        SELECT 1 FROM checkpoints AS c
+                        WHERE c.thread_id = writes.thread_id
+                          AND c.checkpoint_ns = writes.checkpoint_ns
+                          AND c.checkpoint_id = writes.checkpoint_id
+                    )
+                    """,
+                    (thread_id,),
+                )
+            return before - _count(cur)
+
+
+__all__ = ["aopen_checkpointer", "compact_checkpoints", "open_checkpointer"]
@@ -0,0 +1,223 @@
+"""Near-duplicate requirement index: shingled MinHash signatures with LSH banding."""
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, TypedDict
+
+# Larger than any slot value, so an empty text matches nothing but another empty text.
+_EMPTY_SLOT = 1 << 31
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_input TEXT NOT NULL,
+    signature BLOB NOT NULL,
+    state TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lsh (
+    bucket INTEGER NOT NULL,
+    entry_id INTEGER NOT NULL,
+    PRIMARY KEY (bucket, entry_id)
+) WITHOUT ROWID;
+"""
+
+
+def normalize_text(text: str) -> str:
+    """Case-fold, unify full/half width and collapse punctuation and whitespace."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return re.sub(r"[\W_]+", " ", text).strip()
+
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """Character ``size``-grams; they work for CJK and space-separated text alike."""
+    normalized = normalize_text(text)
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[idx : idx + size] for idx in range(len(normalized) - size + 1)}
+
+
+class MinHasher:
+    """``num_perm`` independent 31-bit hash functions per shingle, keeping each one's minimum.
+
+    One ``shake_128`` digest of ``4 * num_perm`` bytes per shingle supplies
+    all ``num_perm`` hash values as the 32-bit lanes of a single integer
+    (top bit of each lane cleared). The running per-lane minimum is kept
+    SWAR-style on that integer: setting every lane's top bit and
+    subtracting leaves the bit set exactly where the running value is not
+    smaller, and that bit selects the new value. A shingle costs one C
+    hash call and a handful of big-integer operations instead of
+    ``num_perm`` Python-level multiplications.
+    """
+
+    def __init__(self, num_perm: int = 120, shingle_size: int = 3, seed: int = 1) -> None:
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._salt = seed.to_bytes(8, "little")
+        self._width = 4 * num_perm
+        self._values = int.from_bytes(b"\xff\xff\xff\x7f" * num_perm, "little")
+        self._guards = int.from_bytes(b"\x00\x00\x00\x80" * num_perm, "little")
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        lowest: Optional[int] = None
+        for item in shingles(text, self.shingle_size):
+            digest = hashlib.shake_128(self._salt + item.encode("utf-8")).digest(self._width)
+            lanes = int.from_bytes(digest, "little") & self._values
+            if lowest is None:
+                lowest = lanes
+                continue
+            not_smaller = (((lowest | self._guards) - lanes) & self._guards) >> 31
+            lowest ^= (lowest ^ lanes) & (not_smaller * 0x7FFFFFFF)
+        if lowest is None:
+            return (_EMPTY_SLOT,) * self.num_perm
+        return tuple(array("I", lowest.to_bytes(self._width, "little")))
+
+
+def estimate_similarity(left: Sequence[int], right: Sequence[int]) -> float:
+    """Fraction of agreeing MinHash slots, an unbiased estimate of Jaccard similarity."""
+    if not left or len(left) != len(right):
+        return 0.0
+    return sum(1 for a, b in zip(left, right) if a == b) / len(left)
+
+
+class DedupMatch(TypedDict):
+    entry_id: int
+    similarity: float
+    user_input: str
+    state: Dict[str, Any]
+
+
+class DedupIndex:
+    """SQLite-backed LSH index from past requirements to their generated sections.
+
+    Signatures are split into ``bands`` bands of ``num_perm // bands`` rows;
+    each band (together with its band number) is hashed into a 64-bit bucket
+    stored in a ``WITHOUT ROWID`` table keyed by bucket, so a lookup is one
+    primary-key probe per band however many entries the index holds. Only
+    candidates sharing a bucket have their full signature compared against
+    ``threshold``. With the defaults (20 bands of 6 rows) a pair at
+    similarity 0.8 becomes a candidate with probability 0.998, a pair at 0.3
+    with about 1.5%.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        threshold: float = 0.8,
+        num_perm: int = 120,
+        bands: int = 20,
+        shingle_size: int = 3,
+        max_candidates: int = 64,
+    ) -> None:
+        if num_perm % bands:
+            raise ValueError("num_perm 必须能被 bands 整除")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_candidates = max_candidates
+        self.hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._check_params(num_perm, shingle_size)
+
+    def _check_params(self, num_perm: int, shingle_size: int) -> None:
+        params = json.dumps(
+            {"num_perm": num_perm, "bands": self.bands, "shingle_size": shingle_size, "hash": "shake128"}
+        )
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'params'").fetchone()
+            if row is None:
+                self._conn.execute("INSERT INTO meta (key, value) VALUES ('params', ?)", (params,))
+            elif row[0] != params:
+                raise ValueError(f"索引 {self.path} 使用不同的 MinHash 参数构建：{row[0]}")
+
+    def _buckets(self, signature: Sequence[int]) -> List[int]:
+        buckets: List[int] = []
+        for band in range(self.bands):
+            rows = array("Q", [band, *signature[band * self.rows : (band + 1) * self.rows]])
+            digest = hashlib.blake2b(rows.tobytes(), digest_size=8).digest()
+            buckets.append(int.from_bytes(digest, "little", signed=True))
+        return buckets
+
+    def lookup(self, text: str) -> Optional[DedupMatch]:
+        """Most similar stored requirement at or above ``threshold``, if any."""
+        signature = self.hasher.signature(text)
+        buckets = self._buckets(signature)
+        placeholders = ", ".join("?" for _ in buckets)
+        with self._lock:
+            # Newest candidates first; a hot bucket cannot make the lookup unbounded.
+            ids = [
+                row[0]
+                for row in self._conn.execute(
+                    f"SELECT DISTINCT entry_id FROM lsh WHERE bucket IN ({placeholders}) "
+                    "ORDER BY entry_id DESC LIMIT ?",
+                    (*buckets, self.max_candidates),
+                )
+            ]
+            best: Optional[Tuple[float, int]] = None
+            if ids:
+                marks = ", ".join("?" for _ in ids)
+                for entry_id, blob in self._conn.execute(
+                    f"SELECT id, signature FROM entries WHERE id IN ({marks})", ids
+                ):
+                    similarity = estimate_similarity(signature, array("Q", blob))
+                    if similarity >= self.threshold and (best is None or similarity > best[0]):
+                        best = (similarity, entry_id)
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            user_input, state = self._conn.execute(
+                "SELECT user_input, state FROM entries WHERE id = ?", (best[1],)
+            ).fetchone()
+        return {
+            "entry_id": best[1],
+            "similarity": best[0],
+            "user_input": user_input,
+            "state": json.loads(state),
+        }
+
+    def add(self, text: str, state: Dict[str, Any]) -> int:
+        signature = self.hasher.signature(text)
+        payload = json.dumps(state, ensure_ascii=False)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO entries (user_input, signature, state, created_at) VALUES (?, ?, ?, ?)",
+                (text, array("Q", signature).tobytes(), payload, time.time()),
+            )
+            entry_id = int(cursor.lastrowid)
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO lsh (bucket, entry_id) VALUES (?, ?)",
+                [(bucket, entry_id) for bucket in self._buckets(signature)],
+            )
+        return entry_id
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+__all__ = ["DedupIndex", "DedupMatch", "MinHasher", "estimate_similarity", "normalize_text", "shingles"]
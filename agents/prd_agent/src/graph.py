@@ -1,38 +1,581 @@
 """LangGraph pipeline definition."""
 from __future__ import annotations
 
+import asyncio
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.graph import StateGraph
+from langgraph.types import Command, StateSnapshot
 
-from src.nodes.api import ApiNode
+from src.dedup import DedupIndex
+from src.incremental import SECTION_NODES, load_snapshot, reused_sections, snapshot_path
+from src.nodes.api import ApiNode, ApiShardNode, fan_out_apis, merge_apis, plan_api_shards
 from src.nodes.architecture import ArchitectureNode
 from src.nodes.assembler import AssemblerNode
+from src.nodes.base import LLMNode
 from src.nodes.datamodel import DataModelNode
-from src.nodes.features import FeatureNode
+from src.nodes.features import (
+    FeatureDetailNode,
+    FeatureNode,
+    FeatureOutlineNode,
+    fan_out_features,
+    merge_features,
+)
+from src.nodes.fused import FusedNode
 from src.nodes.intent import IntentNode
+from src.nodes.language import LanguageNode, parse_languages
 from src.nodes.nfr import NfrNode
+from src.nodes.stacks import StackVariantNode, fan_out_stacks, merge_stacks, plan_stacks
 from src.state import PRDState
+from src.telemetry import current_run_id, run_context
+
+
+def _publishing(step: Any, assembler: AssemblerNode) -> RunnableLambda:
+    """``step`` followed by writing the PRD sections its update completes."""
+    inner = step if isinstance(step, RunnableLambda) else RunnableLambda(step)
+
+    def _run(state: PRDState, config: Any) -> PRDState:
+        update = inner.invoke(state, config)
+        assembler.publish(state, update)
+        return update
+
+    async def _arun(state: PRDState, config: Any) -> PRDState:
+        update = await inner.ainvoke(state, config)
+        await asyncio.to_thread(assembler.publish, state, update)
+        return update
+
+    return RunnableLambda(_run, afunc=_arun, name=inner.name)
+
+
+def build_graph(
+    parallel: bool = False,
+    speculative: bool = False,
+    checkpointer: BaseCheckpointSaver | None = None,
+    feature_fanout: bool = False,
+    api_shard_size: int = 0,
+    fused: bool = False,
+    compare_languages: bool = False,
+) -> StateGraph:
+    """Constructs and compiles the LangGraph state machine.
+
+    Every run enters through ``language``, which passes straight on when
+    ``tech_stack`` is set and otherwise interrupts the run with the language
+    question (which needs a ``checkpointer``), prefetching the calls that do
+    not depend on the answer meanwhile (see :class:`LanguageNode`).
+
+    With ``parallel=True`` each node is wired only to the nodes whose output it
+    actually reads, so independent branches run in the same superstep:
+
+        intent -> features -> datamodel -> api ---+
+               -> architecture -> nfr ------------+-> assembler
+
+    Every node only returns the keys it owns, so the final state is the same
+    as in the sequential chain. Each node that completes a PRD section writes
+    it into the output file as soon as it returns (see
+    :meth:`AssemblerNode.publish`); ``assembler`` fills any gaps at the end.
+
+    With ``speculative=True`` a node whose stream has already produced every
+    key a downstream node reads starts that node's (identical) request early,
+    e.g. ``api`` as soon as ``datamodel`` has emitted ``core_entities``.
+
+    A ``checkpointer`` persists state after every superstep so a run with the
+    same ``thread_id`` can resume from the last finished node.
+
+    With ``feature_fanout=True`` features are planned map-reduce style: a short
+    ``features`` call lists the feature names, one ``feature_detail`` call per
+    feature runs in parallel via ``Send`` and ``feature_merge`` reassembles
+    them in order, so feature latency follows the slowest single feature
+    rather than one long (and truncation-prone) reply.
+
+    With ``api_shard_size > 0`` the API contracts are generated in shards of
+    that many entities, run concurrently via ``Send``; ``api_merge`` drops
+    endpoints that repeat an earlier ``(method, url)`` and keeps shard order.
+
+    With ``fused=True`` a single ``fused`` node asks for the data model, API
+    contracts and NFRs in one completion once features and architecture are
+    known; sections missing from its reply fall back to their regular nodes
+    (see :class:`FusedNode`). It cannot be combined with ``api_shard_size``.
+
+    With ``compare_languages=True`` every language in ``languages`` after the
+    first (which is ``tech_stack`` and gets the regular sections) is sent to
+    its own ``stack_variant`` call pair, architecture then NFRs, via ``Send``;
+    ``stack_merge`` collects them for the side-by-side comparison section.
+    In parallel mode the variants start right after ``intent``, alongside the
+    primary architecture; sequentially they run after the last section.
+    """
+    if fused and api_shard_size:
+        raise ValueError("合并调用模式（fused）不能与 API 分片同时使用")
+    features: FeatureNode = FeatureOutlineNode() if feature_fanout else FeatureNode()
+    intent, architecture = IntentNode(), ArchitectureNode()
+    datamodel, api, nfr = DataModelNode(), ApiNode(), NfrNode()
+    if speculative:
+        intent.speculate(features, architecture)
+        if not fused:
+            architecture.speculate(nfr)
+        if not api_shard_size and not fused:
+            datamodel.speculate(api)
 
+    # Dedicated instances, so the prefetch chain never triggers the graph's own followers.
+    prefetch: Tuple[LLMNode, ...] = (IntentNode(), type(features)())
+    if not fused:
+        prefetch += (DataModelNode(),)
+    for node, follower in zip(prefetch, prefetch[1:]):
+        node.speculate(follower)
+    language = LanguageNode(prefetch)
 
-def build_graph() -> StateGraph:
-    """Constructs and compiles the LangGraph state machine."""
+    assembler = AssemblerNode()
     builder: StateGraph = StateGraph(PRDState)
-    builder.add_node("intent", IntentNode())
-    builder.add_node("features", FeatureNode())
-    builder.add_node("architecture", ArchitectureNode())
-    builder.add_node("datamodel", DataModelNode())
-    builder.add_node("api", ApiNode())
-    builder.add_node("nfr", NfrNode())
-    builder.add_node("assembler", AssemblerNode())
-
-    builder.set_entry_point("intent")
-    builder.add_edge("intent", "features")
-    builder.add_edge("features", "architecture")
-    builder.add_edge("architecture", "datamodel")
-    builder.add_edge("datamodel", "api")
-    builder.add_edge("api", "nfr")
-    builder.add_edge("nfr", "assembler")
-
-    return builder.compile()
-
-
-__all__ = ["build_graph"]
+    builder.add_node("language", language)
+    builder.add_node("intent", _publishing(intent.as_runnable(), assembler))
+    builder.add_node("features", _publishing(features.as_runnable(), assembler))
+    builder.add_node("architecture", _publishing(architecture.as_runnable(), assembler))
+    api_done = "api"
+    if fused:
+        builder.add_node("fused", _publishing(FusedNode().as_runnable(), assembler))
+    else:
+        builder.add_node("datamodel", _publishing(datamodel.as_runnable(), assembler))
+        if api_shard_size > 0:
+            builder.add_node("api", plan_api_shards)
+            builder.add_node("api_shard", ApiShardNode().as_runnable())
+            builder.add_node("api_merge", _publishing(merge_apis, assembler))
+            builder.add_conditional_edges("api", fan_out_apis(api_shard_size), ["api_shard", "api_merge"])
+            builder.add_edge("api_shard", "api_merge")
+            api_done = "api_merge"
+        else:
+            builder.add_node("api", _publishing(api.as_runnable(), assembler))
+        builder.add_node("nfr", _publishing(nfr.as_runnable(), assembler))
+    builder.add_node("assembler", assembler)
+
+    features_done = "features"
+    if feature_fanout:
+        builder.add_node("feature_detail", FeatureDetailNode().as_runnable())
+        builder.add_node("feature_merge", _publishing(merge_features, assembler))
+        builder.add_conditional_edges("features", fan_out_features, ["feature_detail", "feature_merge"])
+        builder.add_edge("feature_detail", "feature_merge")
+        features_done = "feature_merge"
+
+    # Nodes the assembler waits for besides the last section of the main chain.
+    joined: List[str] = []
+    if compare_languages:
+        builder.add_node("stacks", plan_stacks)
+        builder.add_node("stack_variant", StackVariantNode().as_runnable())
+        builder.add_node("stack_merge", _publishing(merge_stacks, assembler))
+        builder.add_conditional_edges("stacks", fan_out_stacks, ["stack_variant", "stack_merge"])
+        builder.add_edge("stack_variant", "stack_merge")
+        if parallel:
+            builder.add_edge("intent", "stacks")
+            joined.append("stack_merge")
+
+    def _finish(*last: str) -> None:
+        if compare_languages and not parallel:
+            builder.add_edge(list(last) if len(last) > 1 else last[0], "stacks")
+            builder.add_edge("stack_merge", "assembler")
+        else:
+            targets = [*last, *joined]
+            builder.add_edge(targets if len(targets) > 1 else targets[0], "assembler")
+
+    builder.set_entry_point("language")
+    builder.add_edge("language", "intent")
+    if fused:
+        builder.add_edge("intent", "features")
+        if parallel:
+            builder.add_edge("intent", "architecture")
+            builder.add_edge([features_done, "architecture"], "fused")
+        else:
+            builder.add_edge(features_done, "architecture")
+            builder.add_edge("architecture", "fused")
+        _finish("fused")
+    elif parallel:
+        builder.add_edge("intent", "features")
+        builder.add_edge("intent", "architecture")
+        builder.add_edge(features_done, "datamodel")
+        builder.add_edge("datamodel", "api")
+        builder.add_edge("architecture", "nfr")
+        _finish(api_done, "nfr")
+    else:
+        builder.add_edge("intent", "features")
+        builder.add_edge(features_done, "architecture")
+        builder.add_edge("architecture", "datamodel")
+        builder.add_edge("datamodel", "api")
+        builder.add_edge(api_done, "nfr")
+        _finish("nfr")
+
+    return builder.compile(checkpointer=checkpointer)
+
+
+@lru_cache(maxsize=8)
+def _compiled_graph(
+    parallel: bool,
+    speculative: bool,
+    checkpointer: BaseCheckpointSaver | None,
+    feature_fanout: bool,
+    api_shard_size: int,
+    fused: bool,
+    compare_languages: bool,
+) -> StateGraph:
+    return build_graph(
+        parallel=parallel,
+        speculative=speculative,
+        checkpointer=checkpointer,
+        feature_fanout=feature_fanout,
+        api_shard_size=api_shard_size,
+        fused=fused,
+        compare_languages=compare_languages,
+    )
+
+
+def _shared_graph(
+    *,
+    parallel: bool,
+    speculative: bool,
+    checkpointer: BaseCheckpointSaver | None = None,
+    feature_fanout: bool = False,
+    api_shard_size: int = 0,
+    fused: bool = False,
+    compare_languages: bool = False,
+) -> StateGraph:
+    """The compiled graph for these options, built once per combination.
+
+    The cache is keyed positionally on every option, so callers that leave
+    some at their defaults or name them in another order share the graph.
+    """
+    return _compiled_graph(
+        parallel, speculative, checkpointer, feature_fanout, api_shard_size, fused, compare_languages
+    )
+
+
+def _run_config(thread_id: str | None) -> Optional[Dict[str, Any]]:
+    return {"configurable": {"thread_id": thread_id}} if thread_id else None
+
+
+def _resume_payload(
+    snapshot: StateSnapshot, resume: bool | None, initial: PRDState, thread_id: str
+) -> Optional[PRDState]:
+    """``None`` tells LangGraph to continue the thread from its last checkpoint.
+
+    ``resume=None`` resumes only an unfinished thread and otherwise starts
+    fresh; ``resume=True`` insists on an existing checkpoint.
+    """
+    if resume is False:
+        return initial
+    if snapshot.values and (snapshot.next or resume):
+        return None
+    if resume:
+        raise ValueError(f"线程 {thread_id} 没有可恢复的检查点")
+    return initial
+
+
+# Sections a near-duplicate requirement can hand over; the rest depend on details.
+REUSABLE_NODES = SECTION_NODES[:3]
+
+
+def _same(left: Any, right: Any) -> bool:
+    if isinstance(left, str) and isinstance(right, str):
+        return left.strip().casefold() == right.strip().casefold()
+    return left == right
+
+
+def _prefill_from_index(index: DedupIndex, state: PRDState) -> PRDState:
+    """Carry over sections from the closest past requirement above the threshold.
+
+    Sections are taken in pipeline order and only while each node's inputs
+    (other than the fuzzy-matched ``user_input``) equal the earlier run's,
+    e.g. a different ``tech_stack`` stops reuse at ``architecture``. Carried
+    sections get a fingerprint of the current inputs, so those nodes skip
+    their call; the rest regenerate.
+    """
+    match = index.lookup(state.get("user_input", ""))
+    if match is None:
+        return state
+    previous = match["state"]
+    merged: Dict[str, Any] = dict(state)
+    fingerprints: Dict[str, str] = {}
+    for node in REUSABLE_NODES:
+        inputs = [key for key in node.input_keys if key != "user_input"]
+        if any(not _same(merged.get(key), previous.get(key)) for key in inputs):
+            break
+        if any(key not in previous for key in node.output_keys):
+            break
+        merged.update({key: previous[key] for key in node.output_keys})
+        fingerprints[node.name] = node.fingerprint(merged)  # type: ignore[arg-type]
+    if not fingerprints:
+        return state
+    merged["section_fingerprints"] = fingerprints
+    merged["reuse_similarity"] = match["similarity"]
+    return merged  # type: ignore[return-value]
+
+
+def _remember(index: DedupIndex, user_input: str, final: PRDState) -> None:
+    if final.get("reused_sections") or not final.get("project_name"):
+        return
+    keys = {key for node in SECTION_NODES for key in node.output_keys}
+    index.add(user_input, {key: value for key, value in final.items() if key in keys})
+
+
+def _initial_state(
+    user_input: str, language: str | Sequence[str] | None, output_path: str | None
+) -> PRDState:
+    # Explicitly empty so a rerun on a checkpointed thread never skips a section.
+    state: PRDState = {"user_input": user_input, "section_fingerprints": {}}
+    languages = parse_languages(language)
+    if languages:
+        state["tech_stack"] = languages[0]
+    if len(languages) > 1:
+        state["languages"] = languages
+    if output_path:
+        state["output_path"] = output_path
+    return state
+
+
+def _run_scope() -> ContextManager[None]:
+    """Give every run an id (unless the caller set one) so per-run budgets apply per PRD."""
+    return run_context(current_run_id() or uuid.uuid4().hex[:12])
+
+
+def _finalize(final: PRDState) -> PRDState:
+    return {**final, "reused_sections": reused_sections(final)}
+
+
+# Checkpoints of runs that have no checkpointer of their own but may stop at the
+# language question; each such run gets a throwaway thread, deleted when it ends.
+_QUESTION_SAVER = InMemorySaver()
+
+
+@contextmanager
+def _question_thread(
+    checkpointer: BaseCheckpointSaver | None, thread_id: str | None, may_ask: bool
+) -> Iterator[Tuple[BaseCheckpointSaver | None, str | None]]:
+    """The checkpointer and thread a run uses (an interrupt needs both)."""
+    if checkpointer is not None or not may_ask:
+        yield checkpointer, thread_id
+        return
+    thread_id = f"question-{uuid.uuid4().hex}"
+    try:
+        yield _QUESTION_SAVER, thread_id
+    finally:
+        _QUESTION_SAVER.delete_thread(thread_id)
+
+
+def _question(result: Dict[str, Any]) -> Optional[str]:
+    interrupts = result.get("__interrupt__")
+    return str(interrupts[0].value) if interrupts else None
+
+
+def _invoke(
+    graph: Any,
+    payload: Any,
+    config: Optional[Dict[str, Any]],
+    ask: Callable[[str], str],
+    on_event: Callable[[str, Any], None] | None = None,
+) -> PRDState:
+    """Run to the end, answering each interrupt with ``ask`` and resuming.
+
+    ``on_event(mode, chunk)`` gets every ``updates`` and ``custom`` chunk
+    except the interrupts themselves.
+    """
+    while True:
+        final: PRDState = {}
+        if on_event is None:
+            final = graph.invoke(payload, config)
+        else:
+            for mode, chunk in graph.stream(
+                payload, config, stream_mode=["values", "updates", "custom"]
+            ):
+                if mode == "values":
+                    final = chunk
+                elif not (mode == "updates" and "__interrupt__" in chunk):
+                    on_event(mode, chunk)
+        question = _question(final)
+        if question is None:
+            return final
+        payload = Command(resume=ask(question))
+
+
+async def _ainvoke(
+    graph: Any,
+    payload: Any,
+    config: Optional[Dict[str, Any]],
+    ask: Callable[[str], str],
+    on_event: Callable[[str, Any], None] | None,
+) -> PRDState:
+    """Async :func:`_invoke`."""
+    while True:
+        final: PRDState = {}
+        if on_event is None:
+            final = await graph.ainvoke(payload, config)
+        else:
+            async for mode, chunk in graph.astream(
+                payload, config, stream_mode=["values", "updates", "custom"]
+            ):
+                if mode == "values":
+                    final = chunk
+                elif not (mode == "updates" and "__interrupt__" in chunk):
+                    on_event(mode, chunk)
+        question = _question(final)
+        if question is None:
+            return final
+        payload = Command(resume=await asyncio.to_thread(ask, question))
+
+
+def generate_prd(
+    user_input: str,
+    language: str | Sequence[str] | None = None,
+    parallel: bool = False,
+    output_path: str | None = None,
+    speculative: bool = False,
+    checkpointer: BaseCheckpointSaver | None = None,
+    thread_id: str | None = None,
+    resume: bool | None = False,
+    feature_fanout: bool = False,
+    api_shard_size: int = 0,
+    dedup: DedupIndex | None = None,
+    fused: bool = False,
+    ask: Callable[[str], str] = input,
+    on_event: Callable[[str, Any], None] | None = None,
+) -> PRDState:
+    """Run the pipeline once on a shared compiled graph and return the final state.
+
+    With a ``checkpointer`` and ``thread_id`` every finished node is persisted;
+    see :func:`_resume_payload` for the ``resume`` semantics. With a ``dedup``
+    index, sections of a near-duplicate earlier requirement are reused (see
+    :func:`_prefill_from_index`) and fresh results are added to the index.
+    Without a ``language`` the run stops at the language question, which is
+    answered by ``ask(prompt)`` before the run resumes. Several languages
+    (a list, or ``"python,java,go"``) share every upstream section and add a
+    side-by-side comparison of each language's architecture and NFRs; the
+    first one is the PRD's own stack. A resumed run needs the same
+    ``language`` as the run it continues. A new (not resumed)
+    run starts by laying out the output file, which then fills in section by
+    section; ``on_event`` is as in :func:`agenerate_prd`.
+    """
+    payload: Optional[PRDState] = _initial_state(user_input, language, output_path)
+    compare = len(payload.get("languages", [])) > 1
+    with _question_thread(checkpointer, thread_id, not language) as (saver, thread):
+        graph = _shared_graph(
+            parallel=parallel,
+            speculative=speculative,
+            checkpointer=saver,
+            feature_fanout=feature_fanout,
+            api_shard_size=api_shard_size,
+            fused=fused,
+            compare_languages=compare,
+        )
+        config = _run_config(thread)
+        if checkpointer is not None and thread_id:
+            payload = _resume_payload(graph.get_state(config), resume, payload, thread_id)
+        if dedup is not None and payload is not None:
+            payload = _prefill_from_index(dedup, payload)
+        if payload is not None:
+            AssemblerNode().start(payload)
+        with _run_scope():
+            final = _finalize(_invoke(graph, payload, config, ask, on_event))
+    if dedup is not None:
+        _remember(dedup, final.get("user_input", user_input), final)
+    return final
+
+
+async def agenerate_prd(
+    user_input: str,
+    language: str | Sequence[str] | None = None,
+    parallel: bool = False,
+    output_path: str | None = None,
+    speculative: bool = False,
+    checkpointer: BaseCheckpointSaver | None = None,
+    thread_id: str | None = None,
+    resume: bool | None = False,
+    feature_fanout: bool = False,
+    api_shard_size: int = 0,
+    on_event: Callable[[str, Any], None] | None = None,
+    dedup: DedupIndex | None = None,
+    fused: bool = False,
+    ask: Callable[[str], str] = input,
+) -> PRDState:
+    """Async counterpart of :func:`generate_prd`; every node awaits ``ainvoke``.
+
+    ``on_event(mode, chunk)`` receives LangGraph ``updates`` (one per finished
+    node) and ``custom`` chunks (keys parsed from a still-streaming reply, and
+    ``{"sections": [...], "path": ...}`` whenever PRD sections are written) as
+    they happen, for callers that report progress. ``ask`` runs in a worker
+    thread so the event loop keeps serving other runs while it waits.
+    """
+    payload: Optional[PRDState] = _initial_state(user_input, language, output_path)
+    compare = len(payload.get("languages", [])) > 1
+    with _question_thread(checkpointer, thread_id, not language) as (saver, thread):
+        graph = _shared_graph(
+            parallel=parallel,
+            speculative=speculative,
+            checkpointer=saver,
+            feature_fanout=feature_fanout,
+            api_shard_size=api_shard_size,
+            fused=fused,
+            compare_languages=compare,
+        )
+        config = _run_config(thread)
+        if checkpointer is not None and thread_id:
+            payload = _resume_payload(await graph.aget_state(config), resume, payload, thread_id)
+        if dedup is not None and payload is not None:
+            payload = _prefill_from_index(dedup, payload)
+        if payload is not None:
+            await asyncio.to_thread(AssemblerNode().start, payload)
+        with _run_scope():
+            final = _finalize(await _ainvoke(graph, payload, config, ask, on_event))
+    if dedup is not None:
+        _remember(dedup, final.get("user_input", user_input), final)
+    return final
+
+
+def regenerate_prd(
+    prd_path: str,
+    language: str | Sequence[str] | None = None,
+    user_input: str | None = None,
+    parallel: bool = False,
+    speculative: bool = False,
+    feature_fanout: bool = False,
+    api_shard_size: int = 0,
+    fused: bool = False,
+    ask: Callable[[str], str] = input,
+) -> PRDState:
+    """Rerun only the sections whose inputs changed since the run that wrote ``prd_path``.
+
+    The previous state and per-section fingerprints come from the snapshot
+    next to the PRD (see :mod:`src.incremental`). ``language`` and
+    ``user_input`` replace the stored values (a single language replaces
+    only the primary stack of a comparison); every node whose inputs still
+    hash the same is skipped, stack variants included, and the assembler
+    rewrites only the markdown sections of the nodes that ran.
+    """
+    payload = load_snapshot(snapshot_path(prd_path))
+    languages = parse_languages(language)
+    if len(languages) == 1 and payload.get("languages"):
+        # One language swaps the primary stack; the compared alternatives stay.
+        languages += [other for other in payload["languages"][1:] if other != languages[0]]
+    if languages:
+        payload["tech_stack"] = languages[0]
+        if len(languages) > 1:
+            payload["languages"] = languages
+        else:
+            payload.pop("languages", None)
+    if user_input:
+        payload["user_input"] = user_input
+    payload["output_path"] = str(prd_path)
+    with _question_thread(None, None, not payload.get("tech_stack")) as (saver, thread):
+        graph = _shared_graph(
+            parallel=parallel,
+            speculative=speculative,
+            checkpointer=saver,
+            feature_fanout=feature_fanout,
+            api_shard_size=api_shard_size,
+            fused=fused,
+            compare_languages=len(payload.get("languages", [])) > 1,
+        )
+        with _run_scope():
+            return _finalize(_invoke(graph, payload, _run_config(thread), ask))
+
+
+__all__ = ["agenerate_prd", "build_graph", "generate_prd", "regenerate_prd"]
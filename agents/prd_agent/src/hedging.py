@@ -0,0 +1,290 @@
+"""Hedged LLM calls: race a duplicate request when the first one runs past its usual latency."""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import queue
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessageChunk, BaseMessage
+
+from src.proxy import ChatModelProxy, chunk_to_message
+from src.routing import LatencyTracker
+from src.telemetry import current_run_id
+
+
+@dataclass
+class HedgePolicy:
+    """Hedge once the first chunk is later than this ``percentile`` of the node's recent ones.
+
+    ``max_per_run`` caps the duplicate requests one PRD run may send (runs
+    are told apart by :func:`src.telemetry.run_context`).
+    """
+
+    percentile: float = 95.0
+    max_per_run: int = 2
+    min_delay_s: float = 0.0
+
+
+class Hedger:
+    """Shared policy, per-run budgets and fired/won counters for every hedged client."""
+
+    def __init__(self, policy: HedgePolicy, tracker: LatencyTracker, max_runs: int = 4096) -> None:
+        self.policy = policy
+        self.tracker = tracker
+        self.max_runs = max_runs
+        self._lock = threading.Lock()
+        self._spent: "OrderedDict[Optional[str], int]" = OrderedDict()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def delay(self, key: str) -> Optional[float]:
+        """Seconds to wait before hedging, ``None`` when there is no history or budget."""
+        if not self.has_budget():
+            return None
+        observed = self.tracker.percentile(key, self.policy.percentile)
+        if observed is None:
+            return None
+        return max(self.policy.min_delay_s, observed)
+
+    def has_budget(self) -> bool:
+        with self._lock:
+            return self._spent.get(current_run_id(), 0) < self.policy.max_per_run
+
+    def acquire(self) -> bool:
+        run_id = current_run_id()
+        with self._lock:
+            spent = self._spent.pop(run_id, 0)
+            self._spent[run_id] = spent  # most recently used last
+            if spent >= self.policy.max_per_run:
+                return False
+            self._spent[run_id] = spent + 1
+            while len(self._spent) > self.max_runs:
+                self._spent.popitem(last=False)
+            return True
+
+    def record(self, node: str, event: str) -> None:
+        with self._lock:
+            counters = self._counters.setdefault(node, {"fired": 0, "won": 0})
+            counters[event] += 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {node: dict(counters) for node, counters in self._counters.items()}
+
+
+# Queue marker for an attempt whose stream ended.
+_DONE = object()
+
+
+class _Attempt:
+    """One request of a sync race, streamed into the shared queue by its own thread."""
+
+    def __init__(self) -> None:
+        self.cancelled = threading.Event()
+        self.stream: Optional[Iterator[AIMessageChunk]] = None
+
+    def close(self) -> None:
+        """Stop the attempt; if it is mid-read, its thread closes the stream on the next chunk.
+
+        Until then the read only holds that attempt's own thread, never one
+        another call is waiting for.
+        """
+        self.cancelled.set()
+        stream = self.stream
+        if stream is not None and not getattr(stream, "gi_running", True):
+            try:
+                stream.close()  # type: ignore[attr-defined]
+            except ValueError:  # resumed by its thread in the meantime
+                pass
+
+
+class HedgedChatModel(ChatModelProxy):
+    """Races a second identical request once the first has no chunk by the hedging delay.
+
+    ``key`` names the node's time-to-first-chunk history (see
+    :func:`src.routing.ttft_key`), since a request is committed to once its
+    first chunk has been forwarded and only the wait for that chunk can be
+    hedged. Whichever request yields its first chunk first wins: its chunks are
+    forwarded as they arrive, so hedged streams keep their time to first
+    token, and the other request is cancelled (its stream closed), which
+    also keeps it out of the latency history. A request that fails before
+    yielding leaves the race to the other one. ``invoke`` runs the same race
+    and concatenates the winner's chunks.
+
+    Each sync attempt streams on a thread of its own, started the moment
+    the attempt is, so the primary is never queued behind other calls (the
+    wait would eat into the hedging delay and fire spurious hedges).
+    """
+
+    def __init__(self, inner: Any, hedger: Hedger, node: str, key: str) -> None:
+        super().__init__(inner)
+        self.hedger = hedger
+        self.node = node
+        self.key = key
+
+    def _pump(
+        self,
+        attempt: _Attempt,
+        messages: Sequence[BaseMessage],
+        kwargs: Dict[str, Any],
+        events: "queue.Queue[Tuple[_Attempt, Any]]",
+    ) -> None:
+        stream: Optional[Iterator[AIMessageChunk]] = None
+        try:
+            stream = attempt.stream = self.inner.stream(messages, **kwargs)
+            for chunk in stream:
+                if attempt.cancelled.is_set():
+                    return
+                events.put((attempt, chunk))
+            events.put((attempt, _DONE))
+        except Exception as exc:  # noqa: BLE001 - handed to the consuming thread
+            if not attempt.cancelled.is_set():
+                events.put((attempt, exc))
+        finally:
+            if stream is not None:
+                try:
+                    stream.close()  # type: ignore[attr-defined]
+                except ValueError:
+                    pass
+
+    def _start(
+        self,
+        messages: Sequence[BaseMessage],
+        kwargs: Dict[str, Any],
+        events: "queue.Queue[Tuple[_Attempt, Any]]",
+    ) -> _Attempt:
+        attempt = _Attempt()
+        context = contextvars.copy_context()
+        threading.Thread(
+            target=context.run,
+            args=(self._pump, attempt, messages, kwargs, events),
+            name=f"llm-hedge-{self.node}",
+            daemon=True,
+        ).start()
+        return attempt
+
+    def _race(
+        self, messages: Sequence[BaseMessage], kwargs: Dict[str, Any], delay: float
+    ) -> Iterator[AIMessageChunk]:
+        events: "queue.Queue[Tuple[_Attempt, Any]]" = queue.Queue()
+        primary = self._start(messages, kwargs, events)
+        attempts = [primary]
+        try:
+            try:
+                event = events.get(timeout=delay)
+            except queue.Empty:
+                if self.hedger.acquire():
+                    self.hedger.record(self.node, "fired")
+                    attempts.append(self._start(messages, kwargs, events))
+                event = events.get()
+            live = set(attempts)
+            while isinstance(event[1], Exception):
+                live.discard(event[0])
+                if not live:
+                    raise event[1]
+                event = events.get()
+            winner, item = event
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.close()
+            if winner is not primary:
+                self.hedger.record(self.node, "won")
+            while item is not _DONE:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+                attempt, item = events.get()
+                while attempt is not winner:
+                    attempt, item = events.get()
+        finally:
+            for attempt in attempts:
+                attempt.close()
+
+    async def _arace(
+        self, messages: Sequence[BaseMessage], kwargs: Dict[str, Any], delay: float
+    ) -> AsyncIterator[AIMessageChunk]:
+        events: "asyncio.Queue[Tuple[int, Any]]" = asyncio.Queue()
+
+        async def _pump(index: int) -> None:
+            try:
+                async for chunk in self.inner.astream(messages, **kwargs):
+                    await events.put((index, chunk))
+                await events.put((index, _DONE))
+            except Exception as exc:  # noqa: BLE001 - handed to the consuming task
+                await events.put((index, exc))
+
+        tasks = [asyncio.ensure_future(_pump(0))]
+        first = asyncio.ensure_future(events.get())
+        try:
+            await asyncio.wait({first}, timeout=delay)
+            if not first.done() and self.hedger.acquire():
+                self.hedger.record(self.node, "fired")
+                tasks.append(asyncio.ensure_future(_pump(1)))
+            event = await first
+            live = set(range(len(tasks)))
+            while isinstance(event[1], Exception):
+                live.discard(event[0])
+                if not live:
+                    raise event[1]
+                event = await events.get()
+            winner, item = event
+            for index, task in enumerate(tasks):
+                if index != winner:
+                    task.cancel()
+            if winner:
+                self.hedger.record(self.node, "won")
+            while item is not _DONE:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+                index, item = await events.get()
+                while index != winner:
+                    index, item = await events.get()
+        finally:
+            if not first.done():
+                first.cancel()
+            for task in tasks:
+                task.cancel()
+
+    def invoke(self, messages: Sequence[BaseMessage], **kwargs: Any) -> BaseMessage:
+        delay = self.hedger.delay(self.key)
+        if delay is None:
+            return self.inner.invoke(messages, **kwargs)
+        reply: Optional[AIMessageChunk] = None
+        for chunk in self._race(messages, kwargs, delay):
+            reply = chunk if reply is None else reply + chunk
+        return chunk_to_message(reply or AIMessageChunk(content=""))
+
+    async def ainvoke(self, messages: Sequence[BaseMessage], **kwargs: Any) -> BaseMessage:
+        delay = self.hedger.delay(self.key)
+        if delay is None:
+            return await self.inner.ainvoke(messages, **kwargs)
+        reply: Optional[AIMessageChunk] = None
+        async for chunk in self._arace(messages, kwargs, delay):
+            reply = chunk if reply is None else reply + chunk
+        return chunk_to_message(reply or AIMessageChunk(content=""))
+
+    def stream(self, messages: Sequence[BaseMessage], **kwargs: Any) -> Iterator[AIMessageChunk]:
+        delay = self.hedger.delay(self.key)
+        if delay is None:
+            yield from self.inner.stream(messages, **kwargs)
+            return
+        yield from self._race(messages, kwargs, delay)
+
+    async def astream(
+        self, messages: Sequence[BaseMessage], **kwargs: Any
+    ) -> AsyncIterator[AIMessageChunk]:
+        delay = self.hedger.delay(self.key)
+        source = (
+            self.inner.astream(messages, **kwargs)
+            if delay is None
+            else self._arace(messages, kwargs, delay)
+        )
+        async for chunk in source:
+            yield chunk
+
+
+__all__ = ["HedgePolicy", "HedgedChatModel", "Hedger"]
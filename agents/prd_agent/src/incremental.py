@@ -0,0 +1,109 @@
+"""Per-section input fingerprints and the state snapshot used for incremental regeneration.
+
+Every finished run leaves ``<prd>.state.json`` next to the markdown: the
+section outputs plus, for each LLM node, a fingerprint of the inputs it was
+called with. Regenerating from that snapshot seeds ``section_fingerprints``
+so nodes whose inputs hash the same return immediately (see
+:meth:`LLMNode.is_reused`) and only the changed sections are recomputed and
+rewritten.
+"""
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from src.nodes.api import ApiNode
+from src.nodes.architecture import ArchitectureNode
+from src.nodes.base import LLMNode
+from src.nodes.datamodel import DataModelNode
+from src.nodes.features import FeatureNode
+from src.nodes.intent import IntentNode
+from src.nodes.nfr import NfrNode
+from src.nodes.stacks import variant_fingerprints
+from src.state import PRDState
+
+SNAPSHOT_VERSION = 1
+
+# State kept in the snapshot besides the sections' own keys: the stack comparison.
+_SNAPSHOT_EXTRAS = ("languages", "stack_comparison")
+
+# Pipeline order: a node only reads keys written by nodes before it.
+SECTION_NODES: Tuple[LLMNode, ...] = (
+    IntentNode(),
+    FeatureNode(),
+    ArchitectureNode(),
+    DataModelNode(),
+    ApiNode(),
+    NfrNode(),
+)
+
+
+def section_fingerprints(state: PRDState) -> Dict[str, str]:
+    """Fingerprint of every section's inputs as they stand in a finished state.
+
+    Each key has a single writer upstream of its readers, so the final state
+    holds exactly the inputs every node was called with. The variants of a
+    stack comparison are included under their own node names.
+    """
+    fingerprints = {node.name: node.fingerprint(state) for node in SECTION_NODES}
+    fingerprints.update(variant_fingerprints(state))
+    return fingerprints
+
+
+def reused_sections(state: PRDState) -> List[str]:
+    """Sections that were skipped because their inputs matched the seeded fingerprints."""
+    return [node.name for node in SECTION_NODES if node.is_reused(state)]
+
+
+def snapshot_path(output_path: str | Path) -> Path:
+    """``outputs/prd.md`` -> ``outputs/prd.state.json``."""
+    return Path(output_path).with_suffix(".state.json")
+
+
+def save_snapshot(state: PRDState, path: str | Path) -> Path:
+    """Write the section outputs and their input fingerprints atomically."""
+    keys = {key for node in SECTION_NODES for key in (*node.input_keys, *node.output_keys)}
+    keys.update(_SNAPSHOT_EXTRAS)
+    payload: Dict[str, Any] = {
+        "version": SNAPSHOT_VERSION,
+        "fingerprints": section_fingerprints(state),
+        "state": {key: value for key, value in state.items() if key in keys},
+    }
+    target = Path(path)
+    # A unique temp name: concurrent runs may target the same PRD.
+    fd, tmp = tempfile.mkstemp(prefix=f".{target.name}.", suffix=".tmp", dir=target.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            # Compact on purpose: indent= falls back to the pure-Python encoder on large states.
+            json.dump(payload, handle, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return target
+
+
+def load_snapshot(path: str | Path) -> PRDState:
+    """State of a previous run with ``section_fingerprints`` seeded from it."""
+    target = Path(path)
+    if not target.exists():
+        raise ValueError(f"找不到上一次运行的状态文件：{target}")
+    payload = json.loads(target.read_text(encoding="utf-8"))
+    if payload.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"状态文件版本不受支持：{target}")
+    state: Dict[str, Any] = dict(payload.get("state", {}))
+    state["section_fingerprints"] = dict(payload.get("fingerprints", {}))
+    return state  # type: ignore[return-value]
+
+
+__all__ = [
+    "SECTION_NODES",
+    "load_snapshot",
+    "reused_sections",
+    "save_snapshot",
+    "section_fingerprints",
+    "snapshot_path",
+]
@@ -2,49 +2,293 @@
 
 from __future__ import annotations
 
+import hashlib
+import importlib
 import os
 from functools import lru_cache
-from typing import Any, Dict, Optional
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
 
+import openai
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_openai import ChatOpenAI
 
+from src.budget import ContextBudgeter, load_budgets
+from src.cache import CachedChatModel, ResponseCache
+from src.cassette import Cassette, RecordingChatModel, ReplayChatModel
+from src.hedging import HedgedChatModel, Hedger, HedgePolicy
+from src.proxy import ChatModelProxy
+from src.ratelimit import RateLimitedChatModel, RetryPolicy, buckets_from_env
+from src.routing import (
+    DEFAULT_ROUTE,
+    ModelRouter,
+    ObservedChatModel,
+    latency_key,
+    load_routes,
+    ttft_key,
+)
+from src.singleflight import SingleFlight, SingleFlightChatModel
+
 _MODEL_OVERRIDE: Optional[str] = None
 _TEMPERATURE_OVERRIDE: Optional[float] = None
+_CACHE_DIR_OVERRIDE: Optional[str] = None
+_CACHE_DISABLED = False
+_CLIENT_OVERRIDE: Optional[BaseChatModel] = None
+_KEEPALIVE_S: Optional[float] = None
+_ROUTES_OVERRIDE: Optional[str] = None
+_HEDGE_POLICY: Optional[HedgePolicy] = None
+_SINGLE_FLIGHT_DISABLED = False
+_BUDGETS_OVERRIDE: Optional[str] = None
+_RECORD_PATH: Optional[str] = None
+_REPLAY_PATH: Optional[str] = None
+_REPLAY_SCALE: Optional[float] = None
+
 
+def configure_llm(
+    model: str | None = None,
+    temperature: float | None = None,
+    cache_dir: str | None = None,
+    cache: bool | None = None,
+    client: BaseChatModel | None = None,
+    keepalive_s: float | None = None,
+    routes: str | None = None,
+    hedge: HedgePolicy | None = None,
+    single_flight: bool | None = None,
+    budgets: str | None = None,
+    record: str | None = None,
+    replay: str | None = None,
+    replay_scale: float | None = None,
+) -> None:
+    """Allow CLI or tests to override the default LLM settings.
 
-def configure_llm(model: str | None = None, temperature: float | None = None) -> None:
-    """Allow CLI or tests to override the default LLM settings."""
-    global _MODEL_OVERRIDE, _TEMPERATURE_OVERRIDE
+    The response cache is opt-in: it is enabled by ``cache_dir`` (or the
+    ``LLM_CACHE_DIR`` env) and ``cache=False`` turns it off regardless.
+    ``client`` replaces ``ChatOpenAI`` (e.g. with a scripted fake model) while
+    keeping the retry/cache layers on top of it. ``keepalive_s`` gives
+    ``ChatOpenAI`` explicit pooled HTTP clients whose idle connections live
+    that long, so a long-lived process skips most TLS handshakes. ``routes``
+    is a JSON file of per-node models (see :mod:`src.routing`); ``hedge``
+    turns on hedged requests (also enabled by ``LLM_HEDGE_PERCENTILE``).
+    ``single_flight=False`` (or ``LLM_SINGLE_FLIGHT=0``) stops identical
+    concurrent calls from sharing one request. ``budgets`` is a JSON file of
+    per-node context token budgets (see :mod:`src.budget`). ``record`` writes
+    every provider call to a cassette file and ``replay`` answers every call
+    from one instead of the provider, waiting the recorded latencies times
+    ``replay_scale`` (see :mod:`src.cassette`).
+    """
+    global _MODEL_OVERRIDE, _TEMPERATURE_OVERRIDE, _CACHE_DIR_OVERRIDE, _CACHE_DISABLED
+    global _CLIENT_OVERRIDE, _KEEPALIVE_S, _ROUTES_OVERRIDE, _HEDGE_POLICY, _SINGLE_FLIGHT_DISABLED
+    global _BUDGETS_OVERRIDE, _RECORD_PATH, _REPLAY_PATH, _REPLAY_SCALE
     if model:
         _MODEL_OVERRIDE = model
     if temperature is not None:
         _TEMPERATURE_OVERRIDE = temperature
-    get_llm.cache_clear()  # type: ignore[attr-defined]
+    if cache_dir:
+        _CACHE_DIR_OVERRIDE = cache_dir
+    if cache is not None:
+        _CACHE_DISABLED = not cache
+    if client is not None:
+        _CLIENT_OVERRIDE = client
+    if keepalive_s is not None:
+        _KEEPALIVE_S = keepalive_s
+    if routes:
+        _ROUTES_OVERRIDE = routes
+    if hedge is not None:
+        _HEDGE_POLICY = hedge
+    if single_flight is not None:
+        _SINGLE_FLIGHT_DISABLED = not single_flight
+    if budgets:
+        _BUDGETS_OVERRIDE = budgets
+    if record:
+        _RECORD_PATH = record
+    if replay:
+        _REPLAY_PATH = replay
+    if replay_scale is not None:
+        _REPLAY_SCALE = replay_scale
+    get_router.cache_clear()
+    get_hedger.cache_clear()
+    get_single_flight.cache_clear()
+    get_budgeter.cache_clear()
+    get_cassette.cache_clear()
+    _build_llm.cache_clear()
+
+
+@lru_cache(maxsize=1)
+def get_budgeter() -> ContextBudgeter:
+    """Per-node context budgets from ``--budgets``/``LLM_BUDGETS_FILE``."""
+    return ContextBudgeter(load_budgets(_BUDGETS_OVERRIDE or os.getenv("LLM_BUDGETS_FILE")))
+
+
+@lru_cache(maxsize=1)
+def get_cassette() -> Optional[Cassette]:
+    """The cassette being replayed (``LLM_REPLAY_CASSETTE``) or recorded (``LLM_RECORD_CASSETTE``)."""
+    replay = _REPLAY_PATH or os.getenv("LLM_REPLAY_CASSETTE")
+    if replay:
+        scale = _REPLAY_SCALE if _REPLAY_SCALE is not None else float(os.getenv("LLM_REPLAY_SCALE", "1"))
+        return Cassette(replay, replay=True, scale=scale)
+    record = _RECORD_PATH or os.getenv("LLM_RECORD_CASSETTE")
+    return Cassette(record) if record else None
+
+
+@lru_cache(maxsize=None)
+def _open_cache(path: str, max_bytes: int, ttl_seconds: float | None) -> ResponseCache:
+    return ResponseCache(path, max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+
+
+def get_cache() -> Optional[ResponseCache]:
+    """Return the active response cache, or ``None`` when caching is off."""
+    cache_dir = _CACHE_DIR_OVERRIDE or os.getenv("LLM_CACHE_DIR")
+    if _CACHE_DISABLED or not cache_dir:
+        return None
+    ttl = os.getenv("LLM_CACHE_TTL")
+    return _open_cache(
+        str(Path(cache_dir) / "responses.sqlite3"),
+        int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024),
+        float(ttl) if ttl else None,
+    )
+
+
+@lru_cache(maxsize=4)
+def _pooled_http_clients(keepalive_s: float, max_connections: int) -> Tuple[Any, Any]:
+    """Sync and async keep-alive pools built on the httpx flavour the openai SDK uses."""
+    base = next(cls for cls in openai.DefaultHttpxClient.__mro__[1:] if cls.__name__ == "Client")
+    httpx = importlib.import_module(base.__module__.split(".")[0])
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=keepalive_s,
+    )
+    return openai.DefaultHttpxClient(limits=limits), openai.DefaultAsyncHttpxClient(limits=limits)
+
+
+def _http_client_kwargs() -> Dict[str, Any]:
+    keepalive = _KEEPALIVE_S if _KEEPALIVE_S is not None else os.getenv("LLM_KEEPALIVE_S")
+    if keepalive is None:
+        return {}
+    sync_client, async_client = _pooled_http_clients(
+        float(keepalive), int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    )
+    return {"http_client": sync_client, "http_async_client": async_client}
 
 
 @lru_cache(maxsize=1)
-def get_llm() -> BaseChatModel:
-    """Return a cached ChatOpenAI instance configured via env/CLI overrides."""
-    model = _MODEL_OVERRIDE or os.getenv("LLM_MODEL", "gpt-4o-mini")
-    temperature = (
-        _TEMPERATURE_OVERRIDE
-        if _TEMPERATURE_OVERRIDE is not None
-        else float(os.getenv("LLM_TEMPERATURE", "0.15"))
+def get_router() -> ModelRouter:
+    """Routes from ``--routes``/``LLM_ROUTES_FILE``; CLI ``--model``/``--temperature`` set the default."""
+    routes = load_routes(_ROUTES_OVERRIDE or os.getenv("LLM_ROUTES_FILE"))
+    default = dict(routes.get(DEFAULT_ROUTE, {}))
+    if _MODEL_OVERRIDE:
+        default["model"] = _MODEL_OVERRIDE
+    if _TEMPERATURE_OVERRIDE is not None:
+        default["temperature"] = _TEMPERATURE_OVERRIDE
+    return ModelRouter(
+        default_model=os.getenv("LLM_MODEL", "gpt-4o-mini"),
+        default_temperature=float(os.getenv("LLM_TEMPERATURE", "0.15")),
+        routes={**routes, DEFAULT_ROUTE: default},
     )
+
+
+@lru_cache(maxsize=1)
+def get_hedger() -> Optional[Hedger]:
+    """The process-wide hedging controller, or ``None`` when hedging is off."""
+    policy = _HEDGE_POLICY
+    if policy is None and os.getenv("LLM_HEDGE_PERCENTILE"):
+        policy = HedgePolicy(
+            percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+            max_per_run=int(os.getenv("LLM_HEDGE_MAX_PER_RUN", "2")),
+        )
+    if policy is None:
+        return None
+    return Hedger(policy, get_router().tracker)
+
+
+@lru_cache(maxsize=1)
+def get_single_flight() -> Optional[SingleFlight]:
+    """The process-wide in-flight call table, or ``None`` when de-duplication is off."""
+    if _SINGLE_FLIGHT_DISABLED or os.getenv("LLM_SINGLE_FLIGHT", "1") == "0":
+        return None
+    return SingleFlight(wait_s=float(os.getenv("LLM_SINGLE_FLIGHT_WAIT_S", "120")))
+
+
+@lru_cache(maxsize=None)
+def _rate_buckets(scope: str) -> Tuple[Any, Any]:
+    # One pair per endpoint+model, shared by every node routed there.
+    return buckets_from_env(scope)
+
+
+@lru_cache(maxsize=None)
+def _build_llm(node: str, model: str, temperature: float) -> BaseChatModel | ChatModelProxy:
+    """One client stack per distinct ``(node, model, temperature)``."""
     base_url = os.getenv("OPENAI_BASE_URL")
     api_key = os.getenv("OPENAI_API_KEY")
     default_headers: Dict[str, str] = {}
     if not api_key:
         # Allow LangSmith style API key mapping if running against self-hosted endpoints.
         api_key = os.getenv("LANGCHAIN_API_KEY", "")
-    return ChatOpenAI(
-        model=model,
-        temperature=temperature,
-        base_url=base_url,
-        api_key=api_key or None,
-        default_headers=default_headers or None,
+    cassette = get_cassette()
+    llm: Any
+    if cassette is not None and cassette.replay:
+        llm = ReplayChatModel(cassette, node, model, temperature)
+    else:
+        llm = _CLIENT_OVERRIDE or ChatOpenAI(
+            model=model,
+            temperature=temperature,
+            base_url=base_url,
+            api_key=api_key or None,
+            default_headers=default_headers or None,
+            # Retries are handled by RateLimitedChatModel so they share the buckets.
+            max_retries=0,
+            # Report token usage on streamed replies too (nodes stream for TTFT).
+            stream_usage=True,
+            **_http_client_kwargs(),
+        )
+        if cassette is not None:
+            # Right around the provider: the cassette keeps its latency, not our queueing.
+            llm = RecordingChatModel(llm, cassette, node, model, temperature)
+    # Observed below the limiter: the fallback policy judges the model, not our own queueing.
+    llm = ObservedChatModel(llm, get_router().tracker, latency_key(node, model))
+    scope = hashlib.sha1(f"{base_url or 'openai'}|{model}".encode("utf-8")).hexdigest()[:12]
+    requests_bucket, tokens_bucket = _rate_buckets(scope)
+    llm = RateLimitedChatModel(
+        llm,
+        requests=requests_bucket,
+        tokens=tokens_bucket,
+        retry=RetryPolicy(max_retries=int(os.getenv("LLM_MAX_RETRIES", "3"))),
     )
+    hedger = get_hedger()
+    if hedger is not None:
+        # Above the limiter so the duplicate request is rate limited and retried on its own.
+        llm = HedgedChatModel(llm, hedger, node, ttft_key(latency_key(node, model)))
+    group = get_single_flight()
+    if group is not None:
+        # Above hedging so followers neither wait on nor spend the leader's hedge budget.
+        llm = SingleFlightChatModel(
+            llm, group, node, model=model, temperature=temperature, base_url=base_url
+        )
+    cache = get_cache()
+    if cache is not None:
+        llm = CachedChatModel(
+            llm, cache, model=model, temperature=temperature, base_url=base_url
+        )
+    return llm
+
+
+def get_llm(node: str | None = None) -> BaseChatModel | ChatModelProxy:
+    """Return the cached client stack for ``node``'s route (the default route if ``None``).
+
+    The model may change between calls when the route has a ``fallback``
+    and the primary's recent p95 for this node is above its threshold.
+    """
+    model, temperature = get_router().select(node)
+    return _build_llm(node or DEFAULT_ROUTE, model, temperature)
 
 
-__all__ = ["configure_llm", "get_llm"]
+__all__ = [
+    "configure_llm",
+    "get_budgeter",
+    "get_cache",
+    "get_cassette",
+    "get_hedger",
+    "get_llm",
+    "get_router",
+    "get_single_flight",
+]
@@ -1,11 +1,13 @@
 """API contract planning node using an LLM."""
 from __future__ import annotations
 
-from langchain_core.messages import HumanMessage, SystemMessage
+import re
+from typing import Any, Callable, Dict, List, Tuple
 
-from src.llm import get_llm
-from src.state import ApiSpec, PRDState
-from src.utils import extract_json, message_to_str
+from langgraph.types import Send
+
+from src.nodes.base import LLMNode
+from src.state import ApiShard, ApiSpec, PRDState
 
 SYSTEM_PROMPT = (
     "You are an API designer. Produce representative endpoints following RESTful style. "
@@ -23,24 +25,106 @@ SYSTEM_PROMPT = (
 )
 
 
-class ApiNode:
+class ApiNode(LLMNode):
     """Produces API contracts via the LLM."""
 
-    def __call__(self, state: PRDState) -> PRDState:
-        llm = get_llm()
-        feature_names = [feature["name"] for feature in state.get("features", [])]
-        context = (
-            f"Project: {state.get('project_name')}\n"
-            f"Domain: {state.get('domain')}\n"
-            f"Features: {feature_names}\n"
-            f"Entities: {state.get('core_entities', [])}\n"
-        )
-        result = llm.invoke(
-            [
-                SystemMessage(content=SYSTEM_PROMPT),
-                HumanMessage(content=f"{context}\nRespond ONLY with JSON."),
-            ]
-        )
-        payload = extract_json(message_to_str(result))
+    name = "api"
+    system_prompt = SYSTEM_PROMPT
+    input_keys = ("project_name", "domain", "features", "core_entities")
+    output_keys = ("apis",)
+
+    reply_schema = {"apis": List[ApiSpec]}
+
+    def parse(self, state: PRDState, payload: Dict[str, Any]) -> PRDState:
         apis: list[ApiSpec] = payload.get("apis", [])
-        return {**state, "apis": apis}
+        return {"apis": apis}
+
+
+SHARD_PROMPT = (
+    SYSTEM_PROMPT
+    + "\nYou are designing ONE shard of a larger API: cover only the entities listed under "
+    "`Shard entities`; the remaining entities are designed by other shards."
+)
+
+
+class ApiShardTask(PRDState, total=False):
+    """Payload sent to one :class:`ApiShardNode` invocation."""
+
+    shard_index: int
+    shard_entities: List[str]
+
+
+class ApiShardNode(ApiNode):
+    """Designs the endpoints for one group of entities; one instance runs per shard."""
+
+    name = "api_shard"
+    system_prompt = SHARD_PROMPT
+    input_keys = ("project_name", "domain", "features", "core_entities", "shard_entities")
+
+    def build_task(self, state: PRDState) -> str:
+        task: ApiShardTask = state  # type: ignore[assignment]
+        return f"Shard entities: {task.get('shard_entities', [])}"
+
+    def parse(self, state: PRDState, payload: Dict[str, Any]) -> PRDState:
+        task: ApiShardTask = state  # type: ignore[assignment]
+        apis = [api for api in payload.get("apis", []) if isinstance(api, dict)]
+        return {"api_shards": [{"index": task["shard_index"], "apis": apis}]}
+
+
+def plan_api_shards(state: PRDState) -> PRDState:
+    """Entry of the sharded API phase; clears shards left by a previous run."""
+    return {"api_shards": None}  # type: ignore[typeddict-item]
+
+
+def shard_entities(entities: List[str], shard_size: int) -> List[List[str]]:
+    if not entities:
+        return [[]]
+    size = max(1, shard_size)
+    return [entities[start : start + size] for start in range(0, len(entities), size)]
+
+
+def fan_out_apis(shard_size: int) -> Callable[[PRDState], List[Send] | str]:
+    """Conditional edge that sends each group of ``shard_size`` entities to its own call."""
+
+    def _fan_out(state: PRDState) -> List[Send] | str:
+        if ApiNode().is_reused(state):
+            return "api_merge"
+        base = {
+            "project_name": state.get("project_name", ""),
+            "domain": state.get("domain", ""),
+            "features": state.get("features", []),
+            "core_entities": state.get("core_entities", []),
+        }
+        shards = shard_entities(list(state.get("core_entities", [])), shard_size)
+        return [
+            Send("api_shard", {**base, "shard_index": index, "shard_entities": entities})
+            for index, entities in enumerate(shards)
+        ]
+
+    return _fan_out
+
+
+_PATH_PARAM = re.compile(r"\{[^}/]*\}|<[^>/]*>|(?<=/):[^/]+")
+
+
+def endpoint_key(api: ApiSpec) -> Tuple[str, str]:
+    """``(METHOD, url)`` with path parameters and trailing slashes normalized."""
+    url = str(api.get("url", "")).strip().split("?", 1)[0].rstrip("/") or "/"
+    return str(api.get("method", "")).strip().upper(), _PATH_PARAM.sub("{}", url.lower())
+
+
+def merge_apis(state: PRDState) -> PRDState:
+    """Reduce the shards into one ``apis`` list in shard order, first endpoint wins."""
+    if ApiNode().is_reused(state):
+        return {}
+    seen: set[Tuple[str, str]] = set()
+    apis: List[ApiSpec] = []
+    shards: List[ApiShard] = sorted(state.get("api_shards", []), key=lambda shard: shard["index"])
+    for shard in shards:
+        for api in shard["apis"]:
+            key = endpoint_key(api)
+            if key in seen:
+                continue
+            seen.add(key)
+            apis.append(api)
+    return {"apis": apis}
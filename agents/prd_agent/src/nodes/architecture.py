@@ -1,14 +1,11 @@
 """Architecture planning node leveraging an LLM."""
 from __future__ import annotations
 
-from textwrap import dedent
-from typing import Callable, Dict
+from typing import Any, Dict
 
-from langchain_core.messages import HumanMessage, SystemMessage
-
-from src.llm import get_llm
-from src.state import PRDState
-from src.utils import extract_json, message_to_str
+from src.nodes.base import LLMNode
+from src.nodes.language import normalize_language
+from src.state import FrameworkInsight, PRDState
 
 SYSTEM_PROMPT = (
     "You are a software architect. Given the product context and preferred programming "
@@ -31,53 +28,39 @@ SYSTEM_PROMPT = (
 )
 
 
-class ArchitectureNode:
-    """Prompts the user for a tech stack (if needed) and calls the LLM."""
+class ArchitectureNode(LLMNode):
+    """Recommends frameworks for the ``tech_stack`` settled by :class:`LanguageNode`."""
 
-    _LANGUAGE_ALIASES: Dict[str, tuple[str, ...]] = {
-        "python": ("python", "py"),
-        "javascript": ("javascript", "js", "typescript", "ts", "node"),
-        "java": ("java",),
-        "go": ("go", "golang"),
+    name = "architecture"
+    system_prompt = SYSTEM_PROMPT
+    input_keys = ("project_name", "domain", "project_goal", "tech_stack")
+    output_keys = (
+        "tech_stack",
+        "frameworks",
+        "business_architecture",
+        "technical_architecture",
+        "data_flow",
+        "scalability",
+    )
+    reply_schema = {
+        "business_architecture": str,
+        "technical_architecture": str,
+        "data_flow": str,
+        "scalability": str,
+        "frameworks": FrameworkInsight,
     }
 
-    def __init__(self, ask_fn: Callable[[str], str] | None = None) -> None:
-        self._ask_fn = ask_fn or (lambda prompt: input(prompt))
-
-    def _normalize_language(self, raw: str) -> str:
-        candidate = raw.strip().lower()
-        if not candidate:
-            return "python"
-        for lang, aliases in self._LANGUAGE_ALIASES.items():
-            if candidate in aliases:
-                return lang
-        return candidate
-
-    def __call__(self, state: PRDState) -> PRDState:
-        raw_lang = state.get("tech_stack") or self._ask_fn("你想用什么语言开发？(默认 Python)：")
-        normalized_lang = self._normalize_language(raw_lang)
-        llm = get_llm()
+    def fingerprint(self, state: PRDState) -> str:
+        # "Golang" and "go" produce the same section; a missing language never matches.
+        if state.get("tech_stack"):
+            state = {**state, "tech_stack": normalize_language(state["tech_stack"])}
+        return super().fingerprint(state)
 
-        context = dedent(
-            f"""
-            Project: {state.get('project_name')}
-            Domain: {state.get('domain')}
-            Goal: {state.get('project_goal')}
-            Preferred Language: {normalized_lang}
-            """
-        ).strip()
-        result = llm.invoke(
-            [
-                SystemMessage(content=SYSTEM_PROMPT),
-                HumanMessage(content=f"{context}\nRespond ONLY with JSON."),
-            ]
-        )
-        payload = extract_json(message_to_str(result))
+    def parse(self, state: PRDState, payload: Dict[str, Any]) -> PRDState:
         frameworks = payload.get("frameworks", {})
 
         return {
-            **state,
-            "tech_stack": normalized_lang,
+            "tech_stack": state.get("tech_stack"),
             "frameworks": frameworks,
             "business_architecture": payload.get("business_architecture", ""),
             "technical_architecture": payload.get("technical_architecture", ""),
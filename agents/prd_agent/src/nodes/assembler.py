@@ -1,188 +1,415 @@
-"""Assembler node writes the final PRD to disk."""
+"""Assembler: renders the PRD sections and writes them to disk as they become available."""
 from __future__ import annotations
 
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
 
-from src.state import PRDState, TableSchema
+from src.incremental import SECTION_NODES, save_snapshot, snapshot_path
+from src.nodes.stacks import VARIANT_KEYS
+from src.state import PRDState, StackVariant, TableSchema
+from src.telemetry import get_tracer
+
+try:  # pragma: no cover - depends on langgraph version
+    from langgraph.config import get_stream_writer
+except ImportError:  # pragma: no cover - older langgraph
+    get_stream_writer = None  # type: ignore[assignment]
+
+DEFAULT_OUTPUT = "outputs/prd.md"
+
+# Body of a section whose node has not finished yet.
+PLACEHOLDER = "_（生成中）_"
+
+SECTION_TITLES: Dict[str, str] = {
+    "intent": "项目背景与目标",
+    "architecture": "总体架构设计",
+    "comparison": "技术栈对比",
+    "features": "功能列表",
+    "datamodel": "数据模型设计",
+    "api": "接口设计",
+    "nfr": "非功能性需求",
+}
+
+# Each section is fenced by HTML comments on their own lines so it can be replaced in place.
+_OPEN = re.compile(r"<!-- prd:(?P<name>\w+) -->")
+
+# Path -> (lock, writers holding or waiting for it); an entry lives only while it is in use.
+_LOCKS: Dict[str, Tuple[threading.Lock, int]] = {}
+_LOCKS_GUARD = threading.Lock()
+
+
+def _closing(name: str) -> str:
+    return f"<!-- /prd:{name} -->"
+
+
+@contextmanager
+def _path_lock(path: Path) -> Iterator[None]:
+    # Parallel branches of one run publish into the same file.
+    key = str(path.resolve())
+    with _LOCKS_GUARD:
+        lock, users = _LOCKS.get(key) or (threading.Lock(), 0)
+        _LOCKS[key] = (lock, users + 1)
+    try:
+        with lock:
+            yield
+    finally:
+        with _LOCKS_GUARD:
+            users = _LOCKS[key][1] - 1
+            if users:
+                _LOCKS[key] = (lock, users)
+            else:
+                del _LOCKS[key]
+
+
+def _bullets(items: Iterable[str]) -> Iterator[str]:
+    yield "- " + "\n- ".join(items)
+
+
+def _cell(value: Any) -> str:
+    text = ", ".join(map(str, value)) if isinstance(value, list) else str(value or "")
+    return (text or "-").replace("|", "\\|").replace("\n", "<br>")
+
+
+# Keys whose arrival can complete the comparison: the variants and the primary stack's sections.
+_COMPARISON_KEYS = frozenset(("stack_comparison", *VARIANT_KEYS))
+
+
+def _comparison_ready(state: PRDState) -> bool:
+    return "stack_comparison" in state and all(key in state for key in ("frameworks", "nfr"))
+
+
+def prd_path(state: PRDState, default: str | Path = DEFAULT_OUTPUT) -> Path:
+    """The document ``state`` is written to: its ``output_path``, else ``default``."""
+    return Path(state.get("output_path") or default)
 
 
 class AssemblerNode:
-    """Serializes the PRD sections and writes a markdown artifact."""
+    """Writes the PRD markdown section by section.
+
+    :meth:`start` lays out a fresh document with a placeholder per section,
+    :meth:`publish` (called as each section's node returns) replaces that
+    section in place, and the node itself, run last, fills whatever is still
+    a placeholder, saves the state snapshot and returns the names of the
+    sections it filled as ``assembled_sections``; callers read the document
+    from ``output_path``. Every write streams the rendered lines into a temp
+    file next to the PRD and swaps it in with ``os.replace``, so readers
+    never see a half-written file and no complete copy of the document is
+    held in memory while sections are being written.
+    """
 
-    def __init__(self, output_path: str = "outputs/prd.md") -> None:
+    def __init__(self, output_path: str = DEFAULT_OUTPUT) -> None:
         self.output_path = Path(output_path)
 
-    def _render_features(self, state: PRDState) -> str:
-        features = state.get("features", [])
-        lines: List[str] = ["## 功能列表（Feature List)"]
-        for idx, feature in enumerate(features, start=1):
-            lines.append(f"### 功能 {idx}: {feature['name']}")
-            lines.append(f"- 功能描述：{feature['description']}")
-            lines.append(f"- 输入：{', '.join(feature['inputs'])}")
-            lines.append(f"- 输出：{', '.join(feature['outputs'])}")
-            lines.append(f"- 前置条件：{', '.join(feature['preconditions'])}")
-            lines.append(f"- 后置条件：{', '.join(feature['postconditions'])}")
-            lines.append(f"- 边界场景：{', '.join(feature['edge_cases'])}")
-            lines.append(f"- 依赖：{', '.join(feature['dependencies'])}")
-            lines.append("")
-        return "\n".join(lines)
-
-    def _render_tables(self, tables: List[TableSchema]) -> str:
-        parts: List[str] = []
+    def _render_comparison(self, state: PRDState) -> Iterator[str]:
+        if not _comparison_ready(state):
+            yield PLACEHOLDER
+            return
+        primary: StackVariant = {key: state[key] for key in VARIANT_KEYS if key in state}  # type: ignore[misc]
+        stacks: List[StackVariant] = [primary, *state["stack_comparison"]]
+        frameworks = [stack.get("frameworks") or {} for stack in stacks]
+        nfrs = [stack.get("nfr") or {} for stack in stacks]
+        rows = [
+            ("后端栈", [item.get("backend", []) for item in frameworks]),
+            ("前端栈", [item.get("frontend", []) for item in frameworks]),
+            ("编排与集成", [item.get("orchestration", []) for item in frameworks]),
+            ("选型说明", [item.get("rationale", "") for item in frameworks]),
+            ("技术架构", [stack.get("technical_architecture", "") for stack in stacks]),
+            ("扩展性", [stack.get("scalability", "") for stack in stacks]),
+            ("性能", [nfr.get("performance", "") for nfr in nfrs]),
+            ("安全", [nfr.get("security", "") for nfr in nfrs]),
+            ("可观测性", [nfr.get("observability", "") for nfr in nfrs]),
+        ]
+        names = [str(stack.get("tech_stack") or "-") for stack in stacks]
+        yield "## 技术栈对比"
+        yield f"本 PRD 以 {names[0]} 为主方案，下表并排列出各候选语言的架构与非功能性需求。"
+        yield ""
+        headers = [f"{names[0]}（主方案）", *names[1:]]
+        yield "| 维度 | " + " | ".join(headers) + " |"
+        yield "| --- |" + " --- |" * len(names)
+        for label, values in rows:
+            yield f"| {label} | " + " | ".join(_cell(value) for value in values) + " |"
+        yield ""
+        yield "### 各方案的主要风险"
+        for name, stack in zip(names, stacks):
+            yield f"- {name}：{'；'.join(stack.get('risks', [])) or '-'}"
+
+    def _render_features(self, state: PRDState) -> Iterator[str]:
+        yield "## 功能列表（Feature List)"
+        for idx, feature in enumerate(state.get("features", []), start=1):
+            yield f"### 功能 {idx}: {feature['name']}"
+            yield f"- 功能描述：{feature['description']}"
+            yield f"- 输入：{', '.join(feature['inputs'])}"
+            yield f"- 输出：{', '.join(feature['outputs'])}"
+            yield f"- 前置条件：{', '.join(feature['preconditions'])}"
+            yield f"- 后置条件：{', '.join(feature['postconditions'])}"
+            yield f"- 边界场景：{', '.join(feature['edge_cases'])}"
+            yield f"- 依赖：{', '.join(feature['dependencies'])}"
+            yield ""
+
+    def _render_tables(self, tables: List[TableSchema]) -> Iterator[str]:
         for table in tables:
-            parts.append(f"### {table['name']}")
-            parts.append(f"描述：{table['description']}")
-            parts.append(f"主键策略：{table['primary_key']}")
-            parts.append("字段说明：")
-            parts.append("| 字段 | 类型 | 描述 | 约束 |")
-            parts.append("| --- | --- | --- | --- |")
+            yield f"### {table['name']}"
+            yield f"描述：{table['description']}"
+            yield f"主键策略：{table['primary_key']}"
+            yield "字段说明："
+            yield "| 字段 | 类型 | 描述 | 约束 |"
+            yield "| --- | --- | --- | --- |"
             for field in table["fields"]:
-                parts.append(
-                    f"| {field['name']} | {field['type']} | {field['description']} | {field['constraints']} |"
-                )
-            parts.append("")
-        return "\n".join(parts)
-
-    def _render_api(self, state: PRDState) -> str:
-        apis = state.get("apis", [])
-        chunks: List[str] = ["## 接口设计（API Contract)"]
-        for api in apis:
-            chunks.append(f"### {api['name']}")
-            chunks.append(f"- URL：`{api['url']}`")
-            chunks.append(f"- Method：{api['method']}")
-            chunks.append("- Request：")
-            chunks.append("| 字段 | 类型 | 必填 | 说明 |")
-            chunks.append("| --- | --- | --- | --- |")
-            for field in api.get("request", []):
-                required = "是" if field.get("required") else "否"
-                chunks.append(
-                    f"| {field.get('name','-')} | {field.get('type','-')} | {required} | {field.get('description','')} |"
-                )
-            chunks.append("- Response：")
-            chunks.append("| 字段 | 类型 | 必填 | 说明 |")
-            chunks.append("| --- | --- | --- | --- |")
-            for field in api.get("response", []):
-                required = "是" if field.get("required") else "否"
-                chunks.append(
-                    f"| {field.get('name','-')} | {field.get('type','-')} | {required} | {field.get('description','')} |"
-                )
+                yield f"| {field['name']} | {field['type']} | {field['description']} | {field['constraints']} |"
+            yield ""
+
+    def _render_fields(self, fields: List[Dict[str, Any]]) -> Iterator[str]:
+        yield "| 字段 | 类型 | 必填 | 说明 |"
+        yield "| --- | --- | --- | --- |"
+        for field in fields:
+            required = "是" if field.get("required") else "否"
+            yield f"| {field.get('name','-')} | {field.get('type','-')} | {required} | {field.get('description','')} |"
+
+    def _render_api(self, state: PRDState) -> Iterator[str]:
+        yield "## 接口设计（API Contract)"
+        for api in state.get("apis", []):
+            yield f"### {api['name']}"
+            yield f"- URL：`{api['url']}`"
+            yield f"- Method：{api['method']}"
+            yield "- Request："
+            yield from self._render_fields(api.get("request", []))
+            yield "- Response："
+            yield from self._render_fields(api.get("response", []))
             if api.get("errors"):
-                chunks.append("- 错误码：")
+                yield "- 错误码："
                 for code, desc in api.get("errors", {}).items():
-                    chunks.append(f"  - {code}：{desc}")
+                    yield f"  - {code}：{desc}"
             if api.get("example"):
-                chunks.append("- 样例：")
-                chunks.append("```json")
-                chunks.append(str(api["example"]))
-                chunks.append("```")
-            chunks.append("")
-        return "\n".join(chunks)
-
-    def _render_dtos(self, state: PRDState) -> str:
-        dtos = state.get("dto_contracts", [])
-        lines: List[str] = ["### 服务之间的数据契约（DTO)"]
-        for dto in dtos:
-            lines.append(
-                f"- {dto['provider']} -> {dto['consumer']}：载荷 {dto['payload']}，备注：{dto['notes']}"
-            )
-        return "\n".join(lines)
+                yield "- 样例："
+                yield "```json"
+                yield str(api["example"])
+                yield "```"
+            yield ""
 
-    def __call__(self, state: PRDState) -> PRDState:
-        self.output_path.parent.mkdir(parents=True, exist_ok=True)
-        title = f"# {state.get('project_name', '产品')} PRD"
-        intro = "\n".join(
-            [
-                "## 项目背景与目标",
-                f"### 背景\n{state.get('background', '')}",
-                f"### 价值\n{state.get('value', '')}",
-                "### 用户群体",
-                "- " + "\n- ".join(state.get("user_segments", [])),
-                f"### 未来愿景\n{state.get('vision', '')}",
-            ]
-        )
+    def _render_dtos(self, state: PRDState) -> Iterator[str]:
+        yield "### 服务之间的数据契约（DTO)"
+        for dto in state.get("dto_contracts", []):
+            yield f"- {dto['provider']} -> {dto['consumer']}：载荷 {dto['payload']}，备注：{dto['notes']}"
+
+    def _render_intent(self, state: PRDState) -> Iterator[str]:
+        yield f"# {state.get('project_name', '产品')} PRD"
+        yield ""
+        yield "## 项目背景与目标"
+        yield f"### 背景\n{state.get('background', '')}"
+        yield f"### 价值\n{state.get('value', '')}"
+        yield "### 用户群体"
+        yield from _bullets(state.get("user_segments", []))
+        yield f"### 未来愿景\n{state.get('vision', '')}"
+
+    def _render_architecture(self, state: PRDState) -> Iterator[str]:
+        yield "## 总体架构设计"
+        yield f"### 业务架构\n{state.get('business_architecture', '')}"
+        yield f"### 技术架构\n{state.get('technical_architecture', '')}"
         frameworks = state.get("frameworks", {})
-        framework_lines = ""
         if frameworks:
-            items = []
+            yield "### 技术栈推荐"
             backend = ", ".join(frameworks.get("backend", []))
             frontend = ", ".join(frameworks.get("frontend", []))
             orchestration = ", ".join(frameworks.get("orchestration", []))
             if backend:
-                items.append(f"- 后端栈：{backend}")
+                yield f"- 后端栈：{backend}"
             if frontend:
-                items.append(f"- 前端栈：{frontend}")
+                yield f"- 前端栈：{frontend}"
             if orchestration:
-                items.append(f"- 编排与集成：{orchestration}")
+                yield f"- 编排与集成：{orchestration}"
             rationale = frameworks.get("rationale")
             if rationale:
-                items.append(f"- 选型说明：{rationale}")
-            framework_lines = "\n".join(["### 技术栈推荐"] + items)
+                yield f"- 选型说明：{rationale}"
+        yield f"### 数据流/调用链\n{state.get('data_flow', '')}"
+        yield f"### 扩展性考虑\n{state.get('scalability', '')}"
 
-        architecture_sections = [
-            "## 总体架构设计",
-            f"### 业务架构\n{state.get('business_architecture', '')}",
-            f"### 技术架构\n{state.get('technical_architecture', '')}",
-        ]
-        if framework_lines:
-            architecture_sections.append(framework_lines)
-        architecture_sections.extend(
-            [
-                f"### 数据流/调用链\n{state.get('data_flow', '')}",
-                f"### 扩展性考虑\n{state.get('scalability', '')}",
-            ]
-        )
-        architecture = "\n".join(architecture_sections)
-        feature_section = self._render_features(state)
-        data_model = "\n".join(
-            [
-                "## 数据模型设计",
-                "### 核心数据实体",
-                "- " + "\n- ".join(state.get("core_entities", [])),
-                "### 数据表结构",
-                self._render_tables(state.get("tables", [])),
-                self._render_dtos(state),
-            ]
-        )
-        api_section = self._render_api(state)
+    def _render_data_model(self, state: PRDState) -> Iterator[str]:
+        yield "## 数据模型设计"
+        yield "### 核心数据实体"
+        yield from _bullets(state.get("core_entities", []))
+        yield "### 数据表结构"
+        yield from self._render_tables(state.get("tables", []))
+        yield from self._render_dtos(state)
+
+    def _render_nfr(self, state: PRDState) -> Iterator[str]:
         nfr = state.get("nfr", {})
-        nfr_section = "\n".join(
-            [
-                "## 非功能性需求（NFR)",
-                f"- 性能：{nfr.get('performance', '')}",
-                f"- 安全：{nfr.get('security', '')}",
-                f"- 可扩展性：{nfr.get('scalability', '')}",
-                f"- 可观测性：{nfr.get('observability', '')}",
-                f"- 国际化：{nfr.get('internationalization', '')}",
-                f"- 依赖外部服务：{nfr.get('external_services', '')}",
-            ]
-        )
-        risks = "\n".join(
-            [
-                "## 风险与难点分析",
-                "- " + "\n- ".join(state.get("risks", [])),
-            ]
-        )
-        glossary = "\n".join(
-            [
-                "## 附录",
-                "### 术语表",
-                "- " + "\n- ".join(state.get("glossary", [])),
-            ]
-        )
-
-        content = "\n\n".join(
-            [
-                title,
-                intro,
-                architecture,
-                feature_section,
-                data_model,
-                api_section,
-                nfr_section,
-                risks,
-                glossary,
-            ]
-        )
-        self.output_path.write_text(content, encoding="utf-8")
-        return {**state, "prd_markdown": content}
+        yield "## 非功能性需求（NFR)"
+        yield f"- 性能：{nfr.get('performance', '')}"
+        yield f"- 安全：{nfr.get('security', '')}"
+        yield f"- 可扩展性：{nfr.get('scalability', '')}"
+        yield f"- 可观测性：{nfr.get('observability', '')}"
+        yield f"- 国际化：{nfr.get('internationalization', '')}"
+        yield f"- 依赖外部服务：{nfr.get('external_services', '')}"
+        yield ""
+        yield "## 风险与难点分析"
+        yield from _bullets(state.get("risks", []))
+        yield ""
+        yield "## 附录"
+        yield "### 术语表"
+        yield from _bullets(state.get("glossary", []))
+
+    def _renderers(self) -> Dict[str, Callable[[PRDState], Iterator[str]]]:
+        # Document order; keys are the names of the nodes that own each part.
+        return {
+            "intent": self._render_intent,
+            "architecture": self._render_architecture,
+            "comparison": self._render_comparison,
+            "features": self._render_features,
+            "datamodel": self._render_data_model,
+            "api": self._render_api,
+            "nfr": self._render_nfr,
+        }
+
+    def _sections(self, state: PRDState) -> List[str]:
+        """The sections of ``state``'s document, in order; the comparison needs several languages."""
+        compare = len(state.get("languages", [])) > 1
+        return [name for name in self._renderers() if name != "comparison" or compare]
+
+    def _emit(self, out: TextIO, name: str, lines: Iterable[str]) -> None:
+        out.write(f"<!-- prd:{name} -->\n")
+        for line in lines:
+            out.write(f"{line}\n")
+        out.write(f"{_closing(name)}\n")
+
+    def _layout(self, out: TextIO, state: PRDState, render: Set[str]) -> None:
+        renderers = self._renderers()
+        for position, name in enumerate(self._sections(state)):
+            if position:
+                out.write("\n")
+            self._emit(out, name, renderers[name](state) if name in render else [PLACEHOLDER])
+
+    def _copy(
+        self,
+        source: Iterator[str],
+        out: TextIO,
+        state: PRDState,
+        render: Set[str],
+        fill: bool,
+        written: List[str],
+    ) -> Set[str]:
+        """Copy an earlier PRD line by line, re-rendering ``render`` (and placeholders if ``fill``).
+
+        Re-rendered sections are appended to ``written``. Returns the anchored
+        sections found, so a document missing some of them can be laid out
+        from scratch instead.
+        """
+        renderers = self._renderers()
+        found: Set[str] = set()
+        for line in source:
+            match = _OPEN.fullmatch(line)
+            if match is None or match["name"] not in renderers:
+                out.write(f"{line}\n")
+                continue
+            name, closing = match["name"], _closing(match["name"])
+            found.add(name)
+            head: List[str] = []
+            for body in source:
+                head.append(body)
+                if body == closing or body != PLACEHOLDER or len(head) == 2:
+                    break
+            if name in render or (fill and head == [PLACEHOLDER, closing]):
+                self._emit(out, name, renderers[name](state))
+                written.append(name)
+                if closing not in head:
+                    for body in source:
+                        if body == closing:
+                            break
+                continue
+            out.write(f"{line}\n")
+            for body in head:
+                out.write(f"{body}\n")
+            if closing not in head:
+                for body in source:
+                    out.write(f"{body}\n")
+                    if body == closing:
+                        break
+        return found
+
+    def _patch(
+        self, path: Path, out: TextIO, state: PRDState, render: Set[str], fill: bool, written: List[str]
+    ) -> bool:
+        with path.open(encoding="utf-8") as src:
+            found = self._copy((line.rstrip("\n") for line in src), out, state, render, fill, written)
+        # Extra anchors are kept: a regeneration carries over the earlier comparison.
+        return found >= set(self._sections(state))
+
+    def _write(
+        self, path: Path, state: PRDState, render: Set[str], fill: bool, fresh: bool
+    ) -> List[str]:
+        """Write ``path`` and return the sections rendered into it, in document order."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        written: List[str] = []
+        with _path_lock(path):
+            fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as out:
+                    if fresh or not path.exists() or not self._patch(path, out, state, render, fill, written):
+                        out.seek(0)
+                        out.truncate()
+                        render = set(self._sections(state)) if fill else render
+                        self._layout(out, state, render)
+                        written = [name for name in self._sections(state) if name in render]
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        return written
+
+    def start(self, state: PRDState) -> None:
+        """Lay out a fresh document; sections already in ``state`` (reused ones) are rendered."""
+        ready = {
+            node.name
+            for node in SECTION_NODES
+            if all(key in state for key in node.output_keys if key != "tech_stack")
+        }
+        self._write(prd_path(state, self.output_path), state, ready, fill=False, fresh=True)
+
+    def sections_in(self, update: Optional[PRDState]) -> List[str]:
+        """Sections owned by the keys in a node's ``update``, in document order."""
+        if not update:
+            return []
+        owners = {
+            node.name for node in SECTION_NODES if any(key in update for key in node.output_keys)
+        }
+        if any(key in update for key in _COMPARISON_KEYS):
+            owners.add("comparison")
+        return [name for name in self._renderers() if name in owners]
+
+    def publish(self, state: PRDState, update: Optional[PRDState]) -> List[str]:
+        """Rewrite the sections a finished node produced; a no-op for other nodes."""
+        merged: PRDState = {**state, **(update or {})}  # type: ignore[typeddict-item]
+        present = self._sections(merged)
+        sections = [name for name in self.sections_in(update) if name in present]
+        if "comparison" in sections and not _comparison_ready(merged):
+            # Written once both the variants and the primary stack's sections are in.
+            sections.remove("comparison")
+        if not sections:
+            return []
+        path = prd_path(state, self.output_path)
+        self._write(path, merged, set(sections), fill=False, fresh=False)
+        if get_stream_writer is not None:
+            try:
+                writer = get_stream_writer()
+            except RuntimeError:
+                return sections
+            writer({"sections": sections, "path": str(path)})
+        return sections
+
+    def __call__(self, state: PRDState) -> PRDState:
+        with get_tracer().span("assembler"):
+            return self._assemble(state)
+
+    def _assemble(self, state: PRDState) -> PRDState:
+        path = prd_path(state, self.output_path)
+        # Published sections (and, on regeneration, unchanged ones, manual edits
+        # included) keep their text; only placeholders are filled in.
+        written = self._write(path, state, set(), fill=True, fresh=False)
+        save_snapshot(state, snapshot_path(path))
+        return {"assembled_sections": written}
+
+
+__all__ = ["AssemblerNode", "DEFAULT_OUTPUT", "PLACEHOLDER", "SECTION_TITLES", "prd_path"]
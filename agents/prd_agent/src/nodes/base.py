@@ -0,0 +1,378 @@
+"""Shared base class for nodes that make a single LLM round trip."""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+from concurrent.futures import Future
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
+
+from src.llm import get_budgeter, get_llm
+from src.prefetch import get_prefetcher
+from src.state import PRDState
+from src.telemetry import NodeSpan, get_tracer
+from src.utils import (
+    PARSE_EMPTY,
+    PARSE_PARTIAL,
+    StreamingJsonParser,
+    extract_json_with_outcome,
+    message_to_str,
+)
+from src.validation import Problem, drop_invalid_items, merge_repair, repair_request, validate_reply
+
+try:
+    from langgraph.config import get_stream_writer
+except ImportError:  # pragma: no cover - older langgraph
+    get_stream_writer = None  # type: ignore[assignment]
+
+# Prompt layout, built for provider prompt-prefix caching (OpenAI-compatible backends
+# reuse the longest previously seen prefix of 1024+ tokens): the PREAMBLE every node
+# sends byte for byte, the context rendered in CONTEXT_FIELDS order, the node's own
+# instructions and last the per-call task. Nodes reading the same leading values
+# (datamodel, api and fused all read the feature list) share the context prefix, and
+# fan-out siblings share everything up to their task line.
+PREAMBLE = (
+    "You write one part of a structured Product Requirement Document (PRD); the other parts "
+    "are written by separate requests. Reply with a single JSON object using exactly the keys "
+    "of the schema for your part, with no markdown or other text, and stay consistent with "
+    "the context."
+)
+
+# Shared context values and their labels, in render order: values that many calls have
+# in common come before the ones that differ.
+CONTEXT_FIELDS: Tuple[Tuple[str, str], ...] = (
+    ("user_input", "Requirement"),
+    ("project_name", "Project"),
+    ("domain", "Domain"),
+    ("features", "Features"),
+    ("core_entities", "Entities"),
+    ("project_goal", "Goal"),
+    ("tech_stack", "Preferred Language"),
+    ("frameworks", "Architecture frameworks"),
+)
+
+
+def _context_value(key: str, value: Any) -> Any:
+    if key == "features":
+        return [item["name"] if isinstance(item, dict) else item for item in value or []]
+    return value
+
+
+def _render_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+def _render_lines(values: Mapping[str, Any]) -> str:
+    return "\n".join(
+        f"{label}: {_render_value(values[key])}" for key, label in CONTEXT_FIELDS if key in values
+    )
+
+
+def render_context(state: PRDState, keys: Sequence[str], node: str | None = None) -> str:
+    """``Label: value`` lines for ``keys``, always in :data:`CONTEXT_FIELDS` order.
+
+    With ``node``, the context is held to that node's token budget (:mod:`src.budget`).
+    """
+    wanted = set(keys)
+    values = {key: _context_value(key, state.get(key)) for key, _ in CONTEXT_FIELDS if key in wanted}
+    if node is None:
+        return _render_lines(values)
+    return get_budgeter().fit(node, values, _render_lines)
+
+
+class LLMNode:
+    """Builds a prompt from state, calls the LLM and maps the JSON reply to state.
+
+    Subclasses provide ``name``, ``system_prompt`` (the node's instructions,
+    sent after the shared preamble and the context), ``input_keys``,
+    ``output_keys``, ``reply_schema`` and ``parse``, plus ``build_task`` for
+    whatever differs between sibling calls of a fan-out; the
+    sync (``__call__``) and async (``acall``) entry points share everything
+    but the transport call. Replies are streamed so each call's span records
+    time-to-first-token, and the stream is parsed incrementally: completed
+    top-level keys are published to the graph's ``custom`` stream and, for
+    nodes registered via :meth:`speculate`, used to start a follower's call as
+    soon as every key it reads is known. A reply that does not match
+    ``reply_schema`` (top-level key -> type from ``state.py``) gets one repair
+    call naming only the broken fields, instead of silently empty sections.
+    """
+
+    name: str = ""
+    system_prompt: str = ""
+    input_keys: Tuple[str, ...] = ()
+    output_keys: Tuple[str, ...] = ()
+    reply_schema: Dict[str, Any] = {}
+    _followers: Tuple["LLMNode", ...] = ()
+
+    def build_context(self, state: PRDState) -> str:
+        return render_context(state, self.input_keys, self.name)
+
+    def build_task(self, state: PRDState) -> str:
+        """Per-call details sent after the instructions (empty for single-call nodes)."""
+        return ""
+
+    def build_messages(self, state: PRDState) -> List[BaseMessage]:
+        parts = [self.build_context(state), f"Your part:\n{self.system_prompt}"]
+        task = self.build_task(state)
+        if task:
+            parts.append(task)
+        parts.append("Respond ONLY with JSON.")
+        return [SystemMessage(content=PREAMBLE), HumanMessage(content="\n\n".join(parts))]
+
+    def parse(self, state: PRDState, payload: Dict[str, Any]) -> PRDState:
+        raise NotImplementedError
+
+    def speculate(self, *followers: "LLMNode") -> "LLMNode":
+        """Start ``followers`` early once this node's stream has produced their inputs."""
+        self._followers = followers
+        return self
+
+    def _ready_followers(
+        self, state: PRDState, parser: StreamingJsonParser, waiting: List["LLMNode"]
+    ) -> Tuple[List[Tuple["LLMNode", PRDState]], List["LLMNode"]]:
+        partial: PRDState = {**state, **parser.members}  # type: ignore[typeddict-item]
+        ready: List[Tuple[LLMNode, PRDState]] = []
+        still_waiting: List[LLMNode] = []
+        for follower in waiting:
+            if all(key in partial for key in follower.input_keys):
+                if not follower.is_reused(partial):
+                    ready.append((follower, partial))
+            else:
+                still_waiting.append(follower)
+        return ready, still_waiting
+
+    def _on_members(self, completed: List[Tuple[str, Any]]) -> None:
+        if get_stream_writer is None:
+            return
+        try:
+            writer = get_stream_writer()
+        except RuntimeError:
+            return
+        writer({"node": self.name, "partial": dict(completed)})
+
+    def _stream_reply(
+        self,
+        state: PRDState,
+        messages: Sequence[BaseMessage],
+        span: NodeSpan,
+        speculative: bool = False,
+    ) -> AIMessageChunk | None:
+        parser = StreamingJsonParser()
+        waiting = list(self._followers)
+        reply: AIMessageChunk | None = None
+        for chunk in get_llm(self.name).stream(messages):
+            if chunk.content:
+                span.first_token()
+            reply = chunk if reply is None else reply + chunk
+            completed = parser.feed(message_to_str(chunk))
+            if completed:
+                # Only the real call publishes partial members, from inside the graph.
+                if not speculative:
+                    self._on_members(completed)
+                ready, waiting = self._ready_followers(state, parser, waiting)
+                for follower, partial in ready:
+                    follower._prefetch(partial)
+        return reply
+
+    async def _astream_reply(
+        self,
+        state: PRDState,
+        messages: Sequence[BaseMessage],
+        span: NodeSpan,
+        speculative: bool = False,
+    ) -> AIMessageChunk | None:
+        parser = StreamingJsonParser()
+        waiting = list(self._followers)
+        reply: AIMessageChunk | None = None
+        async for chunk in get_llm(self.name).astream(messages):
+            if chunk.content:
+                span.first_token()
+            reply = chunk if reply is None else reply + chunk
+            completed = parser.feed(message_to_str(chunk))
+            if completed:
+                if not speculative:
+                    self._on_members(completed)
+                ready, waiting = self._ready_followers(state, parser, waiting)
+                for follower, partial in ready:
+                    follower._aprefetch(partial)
+        return reply
+
+    def _speculative_reply(
+        self, state: PRDState, messages: Sequence[BaseMessage]
+    ) -> AIMessageChunk | None:
+        # Its own span owns the tokens, whether or not a node later takes the reply.
+        with get_tracer().span(f"{self.name}:prefetch") as span:
+            reply = self._stream_reply(state, messages, span, speculative=True)
+            span.record_response(reply)
+            return reply
+
+    async def _aspeculative_reply(
+        self, state: PRDState, messages: Sequence[BaseMessage]
+    ) -> AIMessageChunk | None:
+        with get_tracer().span(f"{self.name}:prefetch") as span:
+            reply = await self._astream_reply(state, messages, span, speculative=True)
+            span.record_response(reply)
+            return reply
+
+    def _prefetch(self, state: PRDState) -> None:
+        messages = self.build_messages(state)
+        get_prefetcher().submit(
+            get_prefetcher().key(messages), lambda: self._speculative_reply(state, messages)
+        )
+
+    def _aprefetch(self, state: PRDState) -> None:
+        messages = self.build_messages(state)
+        get_prefetcher().submit_async(
+            get_prefetcher().key(messages), lambda: self._aspeculative_reply(state, messages)
+        )
+
+    def _take_prefetched(self, messages: Sequence[BaseMessage]) -> Any:
+        prefetcher = get_prefetcher()
+        if not prefetcher.has_pending():
+            return None
+        return prefetcher.take(prefetcher.key(messages))
+
+    def _decode(self, span: NodeSpan, reply: AIMessageChunk | None) -> Dict[str, Any]:
+        if not span.extra.get("prefetched"):  # else already counted by the prefetch span
+            span.record_response(reply)
+        text = message_to_str(reply) if reply is not None else ""
+        payload, span.parse = extract_json_with_outcome(text)
+        if span.parse == PARSE_EMPTY:
+            # A truncated reply still carries every member that closed before the cut.
+            salvage = StreamingJsonParser()
+            salvage.feed(text)
+            if salvage.members:
+                payload, span.parse = salvage.members, PARSE_PARTIAL
+        return payload
+
+    def _repair_messages(
+        self, messages: Sequence[BaseMessage], payload: Dict[str, Any], problems: List[Problem]
+    ) -> List[BaseMessage]:
+        # The original prompt plus the problem list; the faulty reply itself is not resent.
+        return [*messages, HumanMessage(content=repair_request(problems, payload))]
+
+    def _settle(
+        self,
+        span: NodeSpan,
+        payload: Dict[str, Any],
+        problems: List[Problem],
+        fix: AIMessage | None,
+    ) -> Dict[str, Any]:
+        span.record_response(fix)
+        if fix is not None:
+            repaired, _ = extract_json_with_outcome(message_to_str(fix))
+            payload = merge_repair(self.reply_schema, payload, repaired, problems)
+            problems = validate_reply(self.reply_schema, payload)
+        if problems:
+            span.repair_failed = True
+            payload, span.dropped_items = drop_invalid_items(self.reply_schema, payload, problems)
+        return payload
+
+    def _finish(
+        self,
+        span: NodeSpan,
+        state: PRDState,
+        messages: Sequence[BaseMessage],
+        reply: AIMessageChunk | None,
+    ) -> PRDState:
+        """Decode, validate against ``reply_schema`` and, if needed, make one repair call."""
+        payload = self._decode(span, reply)
+        problems = validate_reply(self.reply_schema, payload)
+        if problems:
+            span.invalid_fields = len(problems)
+            span.repairs += 1
+            try:
+                fix = get_llm(self.name).invoke(self._repair_messages(messages, payload, problems))
+            except Exception:  # noqa: BLE001 - keep what the first reply produced
+                fix = None
+            payload = self._settle(span, payload, problems, fix)
+        return self.parse(state, payload)
+
+    async def _afinish(
+        self,
+        span: NodeSpan,
+        state: PRDState,
+        messages: Sequence[BaseMessage],
+        reply: AIMessageChunk | None,
+    ) -> PRDState:
+        payload = self._decode(span, reply)
+        problems = validate_reply(self.reply_schema, payload)
+        if problems:
+            span.invalid_fields = len(problems)
+            span.repairs += 1
+            try:
+                fix = await get_llm(self.name).ainvoke(
+                    self._repair_messages(messages, payload, problems)
+                )
+            except Exception:  # noqa: BLE001 - keep what the first reply produced
+                fix = None
+            payload = self._settle(span, payload, problems, fix)
+        return self.parse(state, payload)
+
+    def fingerprint(self, state: PRDState) -> str:
+        """Stable hash of the ``input_keys`` values this node would be called with."""
+        inputs = {key: state.get(key) for key in self.input_keys}
+        material = json.dumps([self.name, inputs], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+    def is_reused(self, state: PRDState) -> bool:
+        """Whether the section in ``state`` was produced from exactly these inputs.
+
+        ``section_fingerprints`` is seeded by incremental regeneration (the
+        previous run's fingerprints) and by near-duplicate reuse; a node whose
+        inputs still hash the same and whose outputs are present is skipped.
+        """
+        stored = state.get("section_fingerprints", {}).get(self.name)
+        if stored is None or stored != self.fingerprint(state):
+            return False
+        return all(key in state for key in self.output_keys)
+
+    def __call__(self, state: PRDState) -> PRDState:
+        if self.is_reused(state):
+            return {}
+        messages = self.build_messages(state)
+        with get_tracer().span(self.name) as span:
+            reply: AIMessageChunk | None = None
+            pending = self._take_prefetched(messages)
+            if isinstance(pending, Future):
+                try:
+                    reply = pending.result()
+                    span.extra["prefetched"] = True
+                except Exception:  # noqa: BLE001 - fall back to a regular call
+                    reply = None
+            if reply is None:
+                reply = self._stream_reply(state, messages, span)
+            return self._finish(span, state, messages, reply)
+
+    async def acall(self, state: PRDState) -> PRDState:
+        if self.is_reused(state):
+            return {}
+        messages = self.build_messages(state)
+        with get_tracer().span(self.name) as span:
+            reply: AIMessageChunk | None = None
+            pending = self._take_prefetched(messages)
+            if pending is not None:
+                try:
+                    reply = await (
+                        asyncio.wrap_future(pending) if isinstance(pending, Future) else pending
+                    )
+                    span.extra["prefetched"] = True
+                except Exception:  # noqa: BLE001 - fall back to a regular call
+                    reply = None
+            if reply is None:
+                reply = await self._astream_reply(state, messages, span)
+            return await self._afinish(span, state, messages, reply)
+
+    def as_runnable(self) -> RunnableLambda:
+        """Expose both entry points so ``graph.ainvoke`` never blocks a thread."""
+        return RunnableLambda(self, afunc=self.acall, name=type(self).__name__)
+
+
+__all__ = ["CONTEXT_FIELDS", "LLMNode", "PREAMBLE", "render_context"]
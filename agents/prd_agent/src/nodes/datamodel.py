@@ -1,11 +1,10 @@
 """Data model planning node driven by an LLM."""
 from __future__ import annotations
 
-from langchain_core.messages import HumanMessage, SystemMessage
+from typing import Any, Dict, List
 
-from src.llm import get_llm
-from src.state import PRDState, TableSchema
-from src.utils import extract_json, message_to_str
+from src.nodes.base import LLMNode
+from src.state import DTOContract, PRDState, TableSchema
 
 SYSTEM_PROMPT = (
     "You are a data architect. Provide a concise relational design for the product. "
@@ -30,25 +29,22 @@ SYSTEM_PROMPT = (
 )
 
 
-class DataModelNode:
+class DataModelNode(LLMNode):
     """Defines entities, tables, and DTO contracts using an LLM."""
 
-    def __call__(self, state: PRDState) -> PRDState:
-        llm = get_llm()
-        context = (
-            f"Project: {state.get('project_name')}\n"
-            f"Domain: {state.get('domain')}\n"
-            f"Key Features: {[feature['name'] for feature in state.get('features', [])]}\n"
-        )
-        result = llm.invoke(
-            [
-                SystemMessage(content=SYSTEM_PROMPT),
-                HumanMessage(content=f"{context}\nRespond ONLY with JSON."),
-            ]
-        )
-        payload = extract_json(message_to_str(result))
+    name = "datamodel"
+    system_prompt = SYSTEM_PROMPT
+    input_keys = ("project_name", "domain", "features")
+    output_keys = ("core_entities", "tables", "dto_contracts")
+
+    reply_schema = {
+        "core_entities": List[str],
+        "tables": List[TableSchema],
+        "dto_contracts": List[DTOContract],
+    }
+
+    def parse(self, state: PRDState, payload: Dict[str, Any]) -> PRDState:
         return {
-            **state,
             "core_entities": payload.get("core_entities", []),
             "tables": payload.get("tables", []),
             "dto_contracts": payload.get("dto_contracts", []),
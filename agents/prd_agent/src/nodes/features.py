@@ -1,11 +1,12 @@
 """Feature planning node backed by an LLM."""
 from __future__ import annotations
 
-from langchain_core.messages import HumanMessage, SystemMessage
+from typing import Any, Dict, List
 
-from src.llm import get_llm
-from src.state import FeatureSpec, PRDState
-from src.utils import extract_json, message_to_str
+from langgraph.types import Send
+
+from src.nodes.base import LLMNode, render_context
+from src.state import FeatureOutline, FeatureSpec, PRDState
 
 SYSTEM_PROMPT = (
     "You are a product requirement expert. Given the context, propose 3-5 core features. "
@@ -24,22 +25,142 @@ SYSTEM_PROMPT = (
 )
 
 
-class FeatureNode:
+class FeatureNode(LLMNode):
     """Creates a feature backlog using the LLM response."""
 
-    def __call__(self, state: PRDState) -> PRDState:
-        llm = get_llm()
-        context = (
-            f"Project: {state.get('project_name')}\n"
-            f"Domain: {state.get('domain')}\n"
-            f"Goal: {state.get('project_goal')}\n"
-        )
-        result = llm.invoke(
-            [
-                SystemMessage(content=SYSTEM_PROMPT),
-                HumanMessage(content=f"{context}\nRespond ONLY with JSON."),
-            ]
-        )
-        payload = extract_json(message_to_str(result))
+    name = "features"
+    system_prompt = SYSTEM_PROMPT
+    input_keys = ("project_name", "domain", "project_goal")
+    output_keys = ("features",)
+    reply_schema = {"features": List[FeatureSpec]}
+
+    def parse(self, state: PRDState, payload: Dict[str, Any]) -> PRDState:
         features: list[FeatureSpec] = payload.get("features", [])
-        return {**state, "features": features}
+        return {"features": features}
+
+
+OUTLINE_PROMPT = (
+    "You are a product requirement expert. Given the context, list the product's core "
+    "features: 3-5 for a small product, as many as the requirement genuinely needs for a "
+    "large one. Return JSON with a `features` array of "
+    '{"name": string, "description": string}. '
+    "Keep each description to one sentence; the details are planned separately."
+)
+
+DETAIL_PROMPT = (
+    "You are a product requirement expert detailing ONE feature of a larger product. "
+    "Return JSON with a single `feature` object:\n"
+    "{\n"
+    '  "name": string,\n'
+    '  "description": string,\n'
+    '  "inputs": [string,...],\n'
+    '  "outputs": [string,...],\n'
+    '  "preconditions": [string,...],\n'
+    '  "postconditions": [string,...],\n'
+    '  "edge_cases": [string,...],\n'
+    '  "dependencies": [string,...]\n'
+    "}\n"
+    "`dependencies` may only name other features from the provided list."
+)
+
+
+class FeatureTask(PRDState, total=False):
+    """Payload sent to one :class:`FeatureDetailNode` invocation."""
+
+    feature_index: int
+    feature: FeatureOutline
+    feature_names: List[str]
+
+
+class FeatureOutlineNode(FeatureNode):
+    """First phase of map-reduce feature planning: names and one-line summaries only."""
+
+    system_prompt = OUTLINE_PROMPT
+    reply_schema = {"features": List[FeatureOutline]}
+
+    def parse(self, state: PRDState, payload: Dict[str, Any]) -> PRDState:
+        outline: List[FeatureOutline] = [
+            {"name": str(item["name"]), "description": str(item.get("description", ""))}
+            for item in payload.get("features", [])
+            if isinstance(item, dict) and item.get("name")
+        ]
+        return {"feature_outline": outline, "feature_details": None}  # type: ignore[typeddict-item]
+
+
+class FeatureDetailNode(LLMNode):
+    """Second phase: expands a single outlined feature; one instance runs per feature."""
+
+    name = "feature_detail"
+    system_prompt = DETAIL_PROMPT
+    input_keys = ("project_name", "domain", "project_goal", "feature")
+    reply_schema = {"feature": FeatureSpec}
+
+    def build_context(self, state: FeatureTask) -> str:  # type: ignore[override]
+        shared = {**state, "features": state.get("feature_names", [])}
+        keys = ("project_name", "domain", "features", "project_goal")
+        return render_context(shared, keys, self.name)  # type: ignore[arg-type]
+
+    def build_task(self, state: FeatureTask) -> str:  # type: ignore[override]
+        feature = state["feature"]
+        return f"Feature to detail: {feature['name']} - {feature['description']}"
+
+    def parse(self, state: FeatureTask, payload: Dict[str, Any]) -> PRDState:  # type: ignore[override]
+        detail = payload.get("feature")
+        if not isinstance(detail, dict):
+            return {"feature_details": []}
+        detail = {**detail, "name": state["feature"]["name"]}
+        return {"feature_details": [{"index": state["feature_index"], "feature": detail}]}  # type: ignore[typeddict-item]
+
+
+def fan_out_features(state: PRDState) -> List[Send] | str:
+    """Send every outlined feature to its own detail call, or go straight to the merge."""
+    outline = state.get("feature_outline", [])
+    if not outline or FeatureNode().is_reused(state):
+        return "feature_merge"
+    names = [item["name"] for item in outline]
+    return [
+        Send(
+            "feature_detail",
+            {
+                "project_name": state.get("project_name", ""),
+                "domain": state.get("domain", ""),
+                "project_goal": state.get("project_goal", ""),
+                "feature_index": index,
+                "feature": item,
+                "feature_names": names,
+            },
+        )
+        for index, item in enumerate(outline)
+    ]
+
+
+def _empty_feature(outline: FeatureOutline) -> FeatureSpec:
+    return {
+        "name": outline["name"],
+        "description": outline["description"],
+        "inputs": [],
+        "outputs": [],
+        "preconditions": [],
+        "postconditions": [],
+        "edge_cases": [],
+        "dependencies": [],
+    }
+
+
+def merge_features(state: PRDState) -> PRDState:
+    """Reduce the detail calls into ``features`` in outline order.
+
+    A detail reply that was empty or unparsable keeps its outline entry with
+    empty lists, so one bad reply never drops a feature from the PRD.
+    """
+    if FeatureNode().is_reused(state):
+        return {}
+    details: Dict[int, FeatureSpec] = {
+        item["index"]: item["feature"] for item in state.get("feature_details", [])
+    }
+    features: List[FeatureSpec] = []
+    for index, outline in enumerate(state.get("feature_outline", [])):
+        feature = {**_empty_feature(outline), **details.get(index, {})}
+        features.append(feature)  # type: ignore[arg-type]
+    return {"features": features}
+
@@ -0,0 +1,162 @@
+"""Fused node: data model, API contracts and NFRs in a single LLM round trip."""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Set, Tuple
+
+from src.nodes.api import ApiNode
+from src.nodes.base import LLMNode
+from src.nodes.datamodel import DataModelNode
+from src.nodes.nfr import NfrNode
+from src.state import PRDState
+from src.telemetry import NodeSpan, get_tracer
+from src.validation import validate_reply
+
+SYSTEM_PROMPT = (
+    "You are the architect writing the data model, API contracts and non-functional "
+    "requirements of a PRD in one pass. Return ONE JSON object with these keys, in this order:\n"
+    "{\n"
+    '  "core_entities": [string,...],\n'
+    '  "tables": [ {"name": string, "description": string, "primary_key": string,\n'
+    '              "fields": [ {"name": string, "type": string, "description": string, "constraints": string} ]} ],\n'
+    '  "dto_contracts": [ {"provider": string, "consumer": string, "payload": object, "notes": string} ],\n'
+    '  "apis": [ {"name": string, "url": string, "method": string,\n'
+    '             "request": [ {"name": string, "type": string, "required": bool, "description": string} ],\n'
+    '             "response": [ { ... } ],\n'
+    '             "errors": {"code": "description"},\n'
+    '             "example": {"request": object, "response": object}} ],\n'
+    '  "nfr": {"performance": string, "security": string, "scalability": string,\n'
+    '          "observability": string, "internationalization": string, "external_services": string},\n'
+    '  "risks": [string,...],\n'
+    '  "glossary": [string,...]\n'
+    "}\n"
+    "APIs follow RESTful style and use the entities and fields of the tables above. "
+    "Tailor the NFRs to the domain and the chosen frameworks."
+)
+
+# Keys that may legitimately be empty; any other empty key marks its section incomplete.
+_MAY_BE_EMPTY = {"dto_contracts", "risks", "glossary"}
+
+
+class FusedNode(LLMNode):
+    """Replaces the datamodel, api and nfr calls with one combined request.
+
+    The reply is split per section and each section is checked against its
+    node's ``reply_schema``; sections that are missing, invalid or empty are
+    produced by their regular node instead. The api section is redone too
+    when the data model was, since it must match the regenerated entities.
+    Redone sections run as concurrent dependency chains (datamodel then
+    api, nfr alongside), so a failed fused reply costs no more than the
+    unfused parallel graph.
+    """
+
+    name = "fused"
+    system_prompt = SYSTEM_PROMPT
+    input_keys = ("project_name", "domain", "features", "frameworks")
+    sections: Tuple[LLMNode, ...] = (DataModelNode(), ApiNode(), NfrNode())
+    output_keys = tuple(key for node in sections for key in node.output_keys)
+    reply_schema = {key: value for node in sections for key, value in node.reply_schema.items()}
+
+    def is_reused(self, state: PRDState) -> bool:
+        return all(node.is_reused(state) for node in self.sections)
+
+    def _complete(self, payload: Dict[str, Any]) -> Set[str]:
+        """Sections whose part of the fused reply can be used as is."""
+        complete: Set[str] = set()
+        for node in self.sections:
+            part = {key: payload[key] for key in node.output_keys if key in payload}
+            if validate_reply(node.reply_schema, part):
+                continue
+            if any(not part[key] and key not in _MAY_BE_EMPTY for key in node.output_keys):
+                continue
+            complete.add(node.name)
+        if "datamodel" not in complete:
+            complete.discard("api")
+        return complete
+
+    def _split(self, span: NodeSpan, state: PRDState, reply: Any) -> Tuple[PRDState, Set[str]]:
+        payload = self._decode(span, reply)
+        complete = self._complete(payload)
+        update: Dict[str, Any] = {}
+        for node in self.sections:
+            if node.name in complete:
+                update.update(node.parse(state, payload))
+        span.extra["fallbacks"] = [node.name for node in self.sections if node.name not in complete]
+        return update, complete  # type: ignore[return-value]
+
+    def _fused_call(self, state: PRDState) -> bool:
+        # Incremental runs where only some sections changed go straight to their own nodes.
+        return not any(node.is_reused(state) for node in self.sections)
+
+    def _chains(self, complete: Set[str]) -> List[List[LLMNode]]:
+        """Sections to redo, grouped so each node follows the ones whose outputs it reads."""
+        chains: List[List[LLMNode]] = []
+        for node in self.sections:
+            if node.name in complete:
+                continue
+            for chain in chains:
+                if any(key in node.input_keys for prior in chain for key in prior.output_keys):
+                    chain.append(node)
+                    break
+            else:
+                chains.append([node])
+        return chains
+
+    @staticmethod
+    def _run_chain(chain: List[LLMNode], state: PRDState) -> Dict[str, Any]:
+        update: Dict[str, Any] = {}
+        for node in chain:
+            update.update(node({**state, **update}))  # type: ignore[typeddict-item]
+        return update
+
+    @staticmethod
+    async def _arun_chain(chain: List[LLMNode], state: PRDState) -> Dict[str, Any]:
+        update: Dict[str, Any] = {}
+        for node in chain:
+            update.update(await node.acall({**state, **update}))  # type: ignore[typeddict-item]
+        return update
+
+    def __call__(self, state: PRDState) -> PRDState:
+        if self.is_reused(state):
+            return {}
+        update: Dict[str, Any] = {}
+        complete: Set[str] = set()
+        if self._fused_call(state):
+            with get_tracer().span(self.name) as span:
+                reply = self._stream_reply(state, self.build_messages(state), span)
+                update, complete = self._split(span, state, reply)
+        chains = self._chains(complete)
+        merged: PRDState = {**state, **update}  # type: ignore[typeddict-item]
+        if len(chains) > 1:
+            with ThreadPoolExecutor(max_workers=len(chains), thread_name_prefix="prd-fused") as pool:
+                futures = [
+                    pool.submit(contextvars.copy_context().run, self._run_chain, chain, merged)
+                    for chain in chains
+                ]
+                for future in futures:
+                    update.update(future.result())
+        elif chains:
+            update.update(self._run_chain(chains[0], merged))
+        return update  # type: ignore[return-value]
+
+    async def acall(self, state: PRDState) -> PRDState:
+        if self.is_reused(state):
+            return {}
+        update: Dict[str, Any] = {}
+        complete: Set[str] = set()
+        if self._fused_call(state):
+            with get_tracer().span(self.name) as span:
+                reply = await self._astream_reply(state, self.build_messages(state), span)
+                update, complete = self._split(span, state, reply)
+        merged: PRDState = {**state, **update}  # type: ignore[typeddict-item]
+        results = await asyncio.gather(
+            *(self._arun_chain(chain, merged) for chain in self._chains(complete))
+        )
+        for result in results:
+            update.update(result)
+        return update  # type: ignore[return-value]
+
+
+__all__ = ["FusedNode"]
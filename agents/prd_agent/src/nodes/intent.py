@@ -1,11 +1,10 @@
 """Intent node that leverages an LLM to interpret the raw user requirement."""
 from __future__ import annotations
 
-from langchain_core.messages import HumanMessage, SystemMessage
+from typing import Any, Dict, List
 
-from src.llm import get_llm
+from src.nodes.base import LLMNode
 from src.state import PRDState
-from src.utils import extract_json, message_to_str
 
 SYSTEM_PROMPT = (
     "You are a senior product strategist. Based on the provided requirement, "
@@ -23,20 +22,32 @@ SYSTEM_PROMPT = (
 )
 
 
-class IntentNode:
+class IntentNode(LLMNode):
     """Extracts context such as domain, goal, and audience via an LLM."""
 
-    def __call__(self, state: PRDState) -> PRDState:
-        llm = get_llm()
-        user_input = state.get("user_input", "")
-        result = llm.invoke(
-            [
-                SystemMessage(content=SYSTEM_PROMPT),
-                HumanMessage(
-                    content=f"Requirement:\n{user_input}\nRespond ONLY with JSON following the schema."
-                ),
-            ]
-        )
-        payload = extract_json(message_to_str(result))
+    name = "intent"
+    system_prompt = SYSTEM_PROMPT
+    input_keys = ("user_input",)
+    output_keys = (
+        "project_name",
+        "project_goal",
+        "background",
+        "value",
+        "user_segments",
+        "vision",
+        "domain",
+    )
+
+    reply_schema = {
+        "project_name": str,
+        "project_goal": str,
+        "background": str,
+        "value": str,
+        "user_segments": List[str],
+        "vision": str,
+        "domain": str,
+    }
+
+    def parse(self, state: PRDState, payload: Dict[str, Any]) -> PRDState:
         domain = payload.get("domain", "generic")
-        return {**state, **payload, "domain": domain}
+        return {**payload, "domain": domain}
@@ -0,0 +1,80 @@
+"""Tech-stack question, asked through a resumable LangGraph interrupt."""
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Sequence, Tuple
+
+from langgraph.types import interrupt
+
+from src.nodes.base import LLMNode
+from src.state import PRDState
+
+LANGUAGE_PROMPT = "你想用什么语言开发？(默认 Python)："
+
+LANGUAGE_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "python": ("python", "py"),
+    "javascript": ("javascript", "js", "typescript", "ts", "node"),
+    "java": ("java",),
+    "go": ("go", "golang"),
+}
+
+
+def normalize_language(raw: str) -> str:
+    candidate = raw.strip().lower()
+    if not candidate:
+        return "python"
+    for lang, aliases in LANGUAGE_ALIASES.items():
+        if candidate in aliases:
+            return lang
+    return candidate
+
+
+def parse_languages(raw: str | Sequence[str] | None) -> List[str]:
+    """``"python, java,go"`` (or a list) -> distinct normalized languages, first one first."""
+    if not raw:
+        return []
+    items = re.split(r"[,，、;；\s]+", raw) if isinstance(raw, str) else list(raw)
+    languages: List[str] = []
+    for item in items:
+        language = normalize_language(str(item)) if str(item).strip() else ""
+        if language and language not in languages:
+            languages.append(language)
+    return languages
+
+
+class LanguageNode:
+    """Entry node: settles ``tech_stack``, asking for it when the run has none.
+
+    The question is an ``interrupt`` with :data:`LANGUAGE_PROMPT` as its value,
+    so the run stops at a checkpoint instead of blocking a thread, and
+    continues once resumed with ``Command(resume=answer)``. Before stopping,
+    the first of ``prefetch`` that is not reused and has its inputs starts a
+    speculative call; its followers chain on (intent -> features -> datamodel),
+    so the language-independent calls overlap with the human's think time and
+    the real nodes pick up their replies after the resume.
+    """
+
+    name = "language"
+
+    def __init__(self, prefetch: Sequence[LLMNode] = ()) -> None:
+        self.prefetch = tuple(prefetch)
+
+    def _start_prefetch(self, state: PRDState) -> None:
+        for node in self.prefetch:
+            if node.is_reused(state):
+                continue
+            if all(key in state for key in node.input_keys):
+                node._prefetch(state)
+            return
+
+    def __call__(self, state: PRDState) -> PRDState:
+        raw = state.get("tech_stack")
+        if not raw:
+            # Runs again on resume; the prefetcher ignores prompts it already holds.
+            self._start_prefetch(state)
+            raw = interrupt(LANGUAGE_PROMPT)
+        language = normalize_language(str(raw or ""))
+        return {} if language == state.get("tech_stack") else {"tech_stack": language}
+
+
+__all__ = ["LANGUAGE_PROMPT", "LanguageNode", "normalize_language", "parse_languages"]
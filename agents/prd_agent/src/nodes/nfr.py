@@ -1,11 +1,10 @@
 """Non-functional requirement node that taps an LLM."""
 from __future__ import annotations
 
-from langchain_core.messages import HumanMessage, SystemMessage
+from typing import Any, Dict, List
 
-from src.llm import get_llm
+from src.nodes.base import LLMNode
 from src.state import PRDState
-from src.utils import extract_json, message_to_str
 
 SYSTEM_PROMPT = (
     "You are responsible for non-functional requirements of a PRD. "
@@ -26,25 +25,18 @@ SYSTEM_PROMPT = (
 )
 
 
-class NfrNode:
+class NfrNode(LLMNode):
     """Adds NFRs, dependencies, and risks via LLM output."""
 
-    def __call__(self, state: PRDState) -> PRDState:
-        llm = get_llm()
-        context = (
-            f"Project: {state.get('project_name')}\n"
-            f"Domain: {state.get('domain')}\n"
-            f"Architecture frameworks: {state.get('frameworks', {})}\n"
-        )
-        result = llm.invoke(
-            [
-                SystemMessage(content=SYSTEM_PROMPT),
-                HumanMessage(content=f"{context}\nRespond ONLY with JSON."),
-            ]
-        )
-        payload = extract_json(message_to_str(result))
+    name = "nfr"
+    system_prompt = SYSTEM_PROMPT
+    input_keys = ("project_name", "domain", "frameworks")
+    output_keys = ("nfr", "risks", "glossary")
+
+    reply_schema = {"nfr": Dict[str, str], "risks": List[str], "glossary": List[str]}
+
+    def parse(self, state: PRDState, payload: Dict[str, Any]) -> PRDState:
         return {
-            **state,
             "nfr": payload.get("nfr", {}),
             "risks": payload.get("risks", []),
             "glossary": payload.get("glossary", []),
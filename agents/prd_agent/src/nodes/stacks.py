@@ -0,0 +1,126 @@
+"""Per-language architecture fan-out for comparing tech stacks side by side."""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+
+from langchain_core.runnables import RunnableLambda
+from langgraph.types import Send
+
+from src.nodes.architecture import ArchitectureNode
+from src.nodes.nfr import NfrNode
+from src.state import PRDState, StackVariant
+
+# Keys of a variant besides its index: everything the two per-language nodes write.
+VARIANT_KEYS = (*ArchitectureNode.output_keys, *NfrNode.output_keys)
+
+
+class StackTask(PRDState, total=False):
+    """Payload sent to one :class:`StackVariantNode` invocation."""
+
+    stack_index: int
+
+
+def variant_nodes(stack: str) -> Tuple[ArchitectureNode, NfrNode]:
+    """Architecture and NFR nodes for one alternative language.
+
+    Named ``architecture:<stack>`` and ``nfr:<stack>``: same prompts as the primary stack's nodes, but their own names keep the
+    variant's spans, latency history, hedge counters and fingerprints apart;
+    routes and budgets fall back to the base node's configuration.
+    """
+    architecture, nfr = ArchitectureNode(), NfrNode()
+    architecture.name, nfr.name = f"architecture:{stack}", f"nfr:{stack}"
+    return architecture, nfr
+
+
+def _shared_inputs(state: PRDState) -> Dict[str, Any]:
+    return {
+        "project_name": state.get("project_name", ""),
+        "domain": state.get("domain", ""),
+        "project_goal": state.get("project_goal", ""),
+    }
+
+
+def variant_fingerprints(state: PRDState) -> Dict[str, str]:
+    """Input fingerprints of the variant nodes behind every entry of ``stack_comparison``."""
+    fingerprints: Dict[str, str] = {}
+    for variant in state.get("stack_comparison", []):
+        inputs: PRDState = {**_shared_inputs(state), **variant}  # type: ignore[typeddict-item]
+        for node in variant_nodes(variant["tech_stack"]):
+            fingerprints[node.name] = node.fingerprint(inputs)
+    return fingerprints
+
+
+class StackVariantNode:
+    """Architecture and then NFRs for one alternative language; one instance runs per language.
+
+    Both calls go through :func:`variant_nodes` with the task's language as
+    ``tech_stack``; NFRs follow because they read the frameworks. On
+    regeneration the task carries the previous variant and the stored
+    fingerprints, so a variant whose inputs are unchanged is not called again.
+    """
+
+    name = "stack_variant"
+
+    @staticmethod
+    def _variant(task: StackTask, state: PRDState) -> PRDState:
+        variant: StackVariant = {"index": task["stack_index"]}
+        variant.update({key: state[key] for key in VARIANT_KEYS if key in state})  # type: ignore[misc]
+        return {"stack_variants": [variant]}
+
+    def __call__(self, task: StackTask) -> PRDState:
+        architecture, nfr = variant_nodes(task["tech_stack"])
+        state: PRDState = {**task, **architecture(task)}  # type: ignore[typeddict-item]
+        state.update(nfr(state))
+        return self._variant(task, state)
+
+    async def acall(self, task: StackTask) -> PRDState:
+        architecture, nfr = variant_nodes(task["tech_stack"])
+        state: PRDState = {**task, **await architecture.acall(task)}  # type: ignore[typeddict-item]
+        state.update(await nfr.acall(state))
+        return self._variant(task, state)
+
+    def as_runnable(self) -> RunnableLambda:
+        return RunnableLambda(self, afunc=self.acall, name=type(self).__name__)
+
+
+def plan_stacks(state: PRDState) -> PRDState:
+    """Entry of the comparison phase; clears variants left by a previous run."""
+    return {"stack_variants": None}  # type: ignore[typeddict-item]
+
+
+def fan_out_stacks(state: PRDState) -> List[Send] | str:
+    """Send every language after the first to its own variant call, or go straight to the merge."""
+    alternatives = state.get("languages", [])[1:]
+    if not alternatives:
+        return "stack_merge"
+    base = {**_shared_inputs(state), "section_fingerprints": state.get("section_fingerprints", {})}
+    # Variants of the run being regenerated, reused when their inputs still match.
+    previous = {
+        variant.get("tech_stack"): {key: variant[key] for key in VARIANT_KEYS if key in variant}
+        for variant in state.get("stack_comparison", [])
+    }
+    return [
+        Send(
+            "stack_variant",
+            {**base, **previous.get(language, {}), "tech_stack": language, "stack_index": index},
+        )
+        for index, language in enumerate(alternatives, start=1)
+    ]
+
+
+def merge_stacks(state: PRDState) -> PRDState:
+    """Reduce the variants into ``stack_comparison`` in ``languages`` order."""
+    variants = sorted(state.get("stack_variants", []), key=lambda variant: variant["index"])
+    return {"stack_comparison": variants}
+
+
+__all__ = [
+    "StackTask",
+    "StackVariantNode",
+    "VARIANT_KEYS",
+    "fan_out_stacks",
+    "merge_stacks",
+    "plan_stacks",
+    "variant_fingerprints",
+    "variant_nodes",
+]
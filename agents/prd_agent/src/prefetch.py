@@ -0,0 +1,91 @@
+"""Store for speculative LLM calls started before their node is scheduled."""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Union
+
+from langchain_core.messages import BaseMessage, messages_to_dict
+
+Pending = Union["Future[Any]", "asyncio.Task[Any]"]
+
+
+class Prefetcher:
+    """Speculative replies keyed by a hash of the exact prompt that produced them.
+
+    A node that later builds a byte-identical prompt takes the pending entry
+    instead of calling the model again; a prompt that differs simply never
+    matches, so speculation can waste tokens but never change the output.
+    Sync speculation runs on a small thread pool, async speculation as tasks on
+    the caller's event loop. Unclaimed entries beyond ``max_entries`` are
+    dropped oldest-first.
+    """
+
+    def __init__(self, max_entries: int = 256, workers: int = 8) -> None:
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prd-prefetch")
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Pending]" = OrderedDict()
+        self.started = 0
+        self.used = 0
+        self.dropped = 0
+
+    @staticmethod
+    def key(messages: Sequence[BaseMessage]) -> str:
+        material = json.dumps(messages_to_dict(list(messages)), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _store(self, key: str, pending: Pending) -> None:
+        self._entries[key] = pending
+        self.started += 1
+        while len(self._entries) > self.max_entries:
+            _, stale = self._entries.popitem(last=False)
+            stale.cancel()
+            self.dropped += 1
+
+    def submit(self, key: str, fn: Callable[[], Any]) -> None:
+        with self._lock:
+            if key in self._entries:
+                return
+            context = contextvars.copy_context()
+            self._store(key, self._executor.submit(context.run, fn))
+
+    def submit_async(self, key: str, factory: Callable[[], Awaitable[Any]]) -> None:
+        with self._lock:
+            if key in self._entries:
+                return
+            self._store(key, asyncio.ensure_future(factory()))
+
+    def has_pending(self) -> bool:
+        return bool(self._entries)
+
+    def take(self, key: str) -> Optional[Pending]:
+        with self._lock:
+            pending = self._entries.pop(key, None)
+            if pending is not None:
+                self.used += 1
+            return pending
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "started": self.started,
+                "used": self.used,
+                "dropped": self.dropped,
+                "pending": len(self._entries),
+            }
+
+
+_PREFETCHER = Prefetcher()
+
+
+def get_prefetcher() -> Prefetcher:
+    return _PREFETCHER
+
+
+__all__ = ["Prefetcher", "get_prefetcher"]
@@ -0,0 +1,61 @@
+"""Base class for wrappers layered around the chat model returned by ``get_llm``."""
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, Iterator, Sequence
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+
+
+def message_to_chunk(message: BaseMessage) -> AIMessageChunk:
+    """Turn a complete reply into a single stream chunk for ``stream`` callers."""
+    if isinstance(message, AIMessageChunk):
+        return message
+    return AIMessageChunk(
+        content=message.content,
+        id=message.id,
+        response_metadata=dict(message.response_metadata),
+        usage_metadata=getattr(message, "usage_metadata", None),
+    )
+
+
+def chunk_to_message(chunk: AIMessageChunk) -> AIMessage:
+    """Collapse an accumulated stream back into a plain ``AIMessage``."""
+    return AIMessage(
+        content=chunk.content,
+        id=chunk.id,
+        response_metadata=dict(chunk.response_metadata),
+        usage_metadata=chunk.usage_metadata,
+    )
+
+
+class ChatModelProxy:
+    """Delegates the chat-model surface used by the nodes to ``inner``.
+
+    Subclasses override whichever of ``invoke``/``ainvoke``/``stream``/``astream``
+    they need; everything else (``model_name``, ``temperature``...) falls
+    through to the wrapped model.
+    """
+
+    def __init__(self, inner: Any) -> None:
+        self.inner = inner
+
+    def invoke(self, messages: Sequence[BaseMessage], **kwargs: Any) -> BaseMessage:
+        return self.inner.invoke(messages, **kwargs)
+
+    async def ainvoke(self, messages: Sequence[BaseMessage], **kwargs: Any) -> BaseMessage:
+        return await self.inner.ainvoke(messages, **kwargs)
+
+    def stream(self, messages: Sequence[BaseMessage], **kwargs: Any) -> Iterator[AIMessageChunk]:
+        yield from self.inner.stream(messages, **kwargs)
+
+    async def astream(
+        self, messages: Sequence[BaseMessage], **kwargs: Any
+    ) -> AsyncIterator[AIMessageChunk]:
+        async for chunk in self.inner.astream(messages, **kwargs):
+            yield chunk
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.inner, name)
+
+
+__all__ = ["ChatModelProxy", "chunk_to_message", "message_to_chunk"]
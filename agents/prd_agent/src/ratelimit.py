@@ -0,0 +1,292 @@
+"""Request/token rate limiting and retry with backoff for LLM calls."""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+import openai
+from langchain_core.messages import AIMessageChunk, BaseMessage
+
+from src.proxy import ChatModelProxy
+from src.utils import message_to_str
+
+try:  # POSIX only; other platforms fall back to a per-process bucket.
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Classic token bucket refilled at ``rate_per_sec`` up to ``capacity``.
+
+    With ``state_path`` the level lives in a small JSON file guarded by an
+    ``flock``, so every process on the host draws from the same budget. A
+    thread lock serializes access within the process either way. The level may
+    go negative when a call turns out to cost more than was reserved; later
+    callers then wait for the debt to refill.
+    """
+
+    def __init__(
+        self, capacity: float, rate_per_sec: float, state_path: str | Path | None = None
+    ) -> None:
+        self.capacity = capacity
+        self.rate_per_sec = rate_per_sec
+        self.state_path = Path(state_path) if state_path and fcntl is not None else None
+        self._lock = threading.Lock()
+        self._level = capacity
+        self._updated = time.time()
+        if self.state_path is not None:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _refill(self, level: float, updated: float, now: float) -> float:
+        return min(self.capacity, level + (now - updated) * self.rate_per_sec)
+
+    def _update(self, amount: float, force: bool) -> float:
+        """Take ``amount`` if available (or always when ``force``); return wait seconds."""
+        with self._lock:
+            if self.state_path is None:
+                return self._apply(amount, force)
+            with open(self.state_path.with_suffix(".lock"), "a+") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    try:
+                        state = json.loads(self.state_path.read_text())
+                        self._level, self._updated = state["level"], state["updated"]
+                    except (FileNotFoundError, ValueError, KeyError):
+                        self._level, self._updated = self.capacity, time.time()
+                    wait = self._apply(amount, force)
+                    self.state_path.write_text(
+                        json.dumps({"level": self._level, "updated": self._updated})
+                    )
+                    return wait
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _apply(self, amount: float, force: bool) -> float:
+        now = time.time()
+        self._level = self._refill(self._level, self._updated, now)
+        self._updated = now
+        # A single request larger than the bucket would otherwise never fit.
+        needed = min(amount, self.capacity)
+        if force or self._level >= needed:
+            self._level -= amount
+            return 0.0
+        return (needed - self._level) / self.rate_per_sec
+
+    def acquire(self, amount: float = 1.0) -> None:
+        while (wait := self._update(amount, force=False)) > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, amount: float = 1.0) -> None:
+        while (wait := await asyncio.to_thread(self._update, amount, False)) > 0:
+            await asyncio.sleep(wait)
+
+    def debit(self, amount: float) -> None:
+        """Charge (or refund, if negative) without waiting."""
+        if amount:
+            self._update(amount, force=True)
+
+
+@dataclass
+class RetryPolicy:
+    max_retries: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+
+    def is_retryable(self, exc: BaseException) -> bool:
+        if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError)):
+            return True
+        status = getattr(exc, "status_code", None)
+        return status in _RETRYABLE_STATUS
+
+    def delay(self, attempt: int, exc: BaseException) -> float:
+        retry_after = _retry_after(exc)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # Full jitter keeps concurrent workers from retrying in lock-step.
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            return None
+    return None
+
+
+def estimate_tokens(messages: Sequence[BaseMessage]) -> int:
+    """Cheap prompt-size estimate (~4 chars/token) used to reserve TPM budget."""
+    return sum(len(message_to_str(message)) for message in messages) // 4 + 1
+
+
+def _usage_tokens(message: BaseMessage) -> Optional[int]:
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+class RateLimitedChatModel(ChatModelProxy):
+    """Applies RPM/TPM buckets and retries transient failures with backoff.
+
+    Tokens are reserved from the prompt estimate before the call and settled
+    against ``usage_metadata`` afterwards. Streams are retried only if they
+    fail before the first chunk has been handed to the caller.
+    """
+
+    def __init__(
+        self,
+        inner: Any,
+        requests: TokenBucket | None = None,
+        tokens: TokenBucket | None = None,
+        retry: RetryPolicy | None = None,
+    ) -> None:
+        super().__init__(inner)
+        self.requests = requests
+        self.tokens = tokens
+        self.retry = retry or RetryPolicy()
+        self.retries = 0
+
+    def _acquire(self, estimate: int) -> None:
+        if self.requests is not None:
+            self.requests.acquire(1)
+        if self.tokens is not None:
+            self.tokens.acquire(estimate)
+
+    async def _aacquire(self, estimate: int) -> None:
+        if self.requests is not None:
+            await self.requests.aacquire(1)
+        if self.tokens is not None:
+            await self.tokens.aacquire(estimate)
+
+    def _settle(self, estimate: int, message: BaseMessage | None) -> None:
+        used = _usage_tokens(message) if message is not None else None
+        if self.tokens is not None and used is not None:
+            self.tokens.debit(used - estimate)
+
+    def _should_retry(self, attempt: int, exc: BaseException) -> bool:
+        if attempt >= self.retry.max_retries or not self.retry.is_retryable(exc):
+            return False
+        self.retries += 1
+        return True
+
+    def invoke(self, messages: Sequence[BaseMessage], **kwargs: Any) -> BaseMessage:
+        estimate = estimate_tokens(messages)
+        attempt = 0
+        while True:
+            self._acquire(estimate)
+            try:
+                result = self.inner.invoke(messages, **kwargs)
+            except Exception as exc:
+                if not self._should_retry(attempt, exc):
+                    raise
+                time.sleep(self.retry.delay(attempt, exc))
+                attempt += 1
+                continue
+            self._settle(estimate, result)
+            return result
+
+    async def ainvoke(self, messages: Sequence[BaseMessage], **kwargs: Any) -> BaseMessage:
+        estimate = estimate_tokens(messages)
+        attempt = 0
+        while True:
+            await self._aacquire(estimate)
+            try:
+                result = await self.inner.ainvoke(messages, **kwargs)
+            except Exception as exc:
+                if not self._should_retry(attempt, exc):
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt, exc))
+                attempt += 1
+                continue
+            self._settle(estimate, result)
+            return result
+
+    def stream(self, messages: Sequence[BaseMessage], **kwargs: Any) -> Iterator[AIMessageChunk]:
+        estimate = estimate_tokens(messages)
+        attempt = 0
+        while True:
+            self._acquire(estimate)
+            full: AIMessageChunk | None = None
+            try:
+                for chunk in self.inner.stream(messages, **kwargs):
+                    full = chunk if full is None else full + chunk
+                    yield chunk
+            except Exception as exc:
+                if full is not None or not self._should_retry(attempt, exc):
+                    raise
+                time.sleep(self.retry.delay(attempt, exc))
+                attempt += 1
+                continue
+            self._settle(estimate, full)
+            return
+
+    async def astream(
+        self, messages: Sequence[BaseMessage], **kwargs: Any
+    ) -> AsyncIterator[AIMessageChunk]:
+        estimate = estimate_tokens(messages)
+        attempt = 0
+        while True:
+            await self._aacquire(estimate)
+            full: AIMessageChunk | None = None
+            try:
+                async for chunk in self.inner.astream(messages, **kwargs):
+                    full = chunk if full is None else full + chunk
+                    yield chunk
+            except Exception as exc:
+                if full is not None or not self._should_retry(attempt, exc):
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt, exc))
+                attempt += 1
+                continue
+            self._settle(estimate, full)
+            return
+
+
+def buckets_from_env(scope: str) -> tuple[Optional[TokenBucket], Optional[TokenBucket]]:
+    """Build RPM/TPM buckets from ``LLM_RPM``/``LLM_TPM``; ``scope`` names the shared files."""
+    state_dir = os.getenv("LLM_RATE_STATE_DIR") or os.path.join(
+        tempfile.gettempdir(), "prd_agent_ratelimit"
+    )
+    buckets: list[Optional[TokenBucket]] = []
+    for env, suffix in (("LLM_RPM", "rpm"), ("LLM_TPM", "tpm")):
+        per_minute = float(os.getenv(env, "0") or 0)
+        if per_minute <= 0:
+            buckets.append(None)
+            continue
+        buckets.append(
+            TokenBucket(
+                capacity=per_minute,
+                rate_per_sec=per_minute / 60.0,
+                state_path=Path(state_dir) / f"{scope}.{suffix}.json",
+            )
+        )
+    return buckets[0], buckets[1]
+
+
+__all__ = [
+    "RateLimitedChatModel",
+    "RetryPolicy",
+    "TokenBucket",
+    "buckets_from_env",
+    "estimate_tokens",
+]
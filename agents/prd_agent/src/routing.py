@@ -0,0 +1,254 @@
+"""Per-node model routing and the latency observations behind its fallback policy.
+
+Routes come from a JSON file (``--routes`` or ``LLM_ROUTES_FILE``) keyed by
+node name, with an optional ``default`` entry::
+
+    {
+      "default": {"model": "gpt-4o", "temperature": 0.15},
+      "intent": {"model": "gpt-4o-mini", "temperature": 0},
+      "nfr": {"model": "gpt-4o-mini"},
+      "api": {"fallback": "gpt-4o-mini", "fallback_p95_ms": 20000}
+    }
+
+and per-node env overrides such as ``LLM_MODEL_INTENT``,
+``LLM_TEMPERATURE_INTENT``, ``LLM_FALLBACK_MODEL_API`` and
+``LLM_FALLBACK_P95_MS_API``. A node with a ``fallback`` is sent to it while
+the primary model's observed p95 for that node exceeds the threshold.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessageChunk, BaseMessage
+
+from src.proxy import ChatModelProxy
+
+DEFAULT_ROUTE = "default"
+
+
+class LatencyTracker:
+    """Rolling per-key call latencies: the last ``window`` samples younger than ``max_age_s``.
+
+    Old samples age out, so a model that stopped receiving traffic (because
+    its node fell back) is tried again once its slow samples have expired.
+    """
+
+    def __init__(self, window: int = 50, max_age_s: float = 600.0, min_samples: int = 5) -> None:
+        self.window = window
+        self.max_age_s = max_age_s
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[Tuple[float, float]]] = {}
+
+    def observe(self, key: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.setdefault(key, deque(maxlen=self.window))
+            samples.append((time.monotonic(), seconds))
+
+    def _recent(self, key: str) -> list[float]:
+        cutoff = time.monotonic() - self.max_age_s
+        samples = self._samples.get(key)
+        if not samples:
+            return []
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        return [seconds for _, seconds in samples]
+
+    def percentile(self, key: str, pct: float) -> Optional[float]:
+        """Nearest-rank percentile in seconds, or ``None`` below ``min_samples``."""
+        with self._lock:
+            recent = sorted(self._recent(key))
+        if len(recent) < max(1, self.min_samples):
+            return None
+        index = min(len(recent) - 1, max(0, round(pct / 100 * len(recent)) - 1))
+        return recent[index]
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            keys = list(self._samples)
+        data: Dict[str, Dict[str, float]] = {}
+        for key in keys:
+            with self._lock:
+                recent = sorted(self._recent(key))
+            if recent:
+                data[key] = {
+                    "samples": len(recent),
+                    "p50_ms": recent[max(0, round(0.5 * len(recent)) - 1)] * 1000,
+                    "p95_ms": recent[max(0, round(0.95 * len(recent)) - 1)] * 1000,
+                }
+        return data
+
+
+def latency_key(node: str, model: str) -> str:
+    return f"{node}/{model}"
+
+
+def ttft_key(key: str) -> str:
+    """Key under which :class:`ObservedChatModel` records time to first chunk for ``key``."""
+    return f"{key}/ttft"
+
+
+class ObservedChatModel(ChatModelProxy):
+    """Records the wall time of every finished call (failed ones included) under ``key``.
+
+    Streams also record the time to their first chunk under ``ttft_key(key)``.
+
+    Calls abandoned by the caller (a closed stream, a cancelled task) are not
+    recorded: their elapsed time says nothing about how long they would have taken.
+    """
+
+    def __init__(self, inner: Any, tracker: LatencyTracker, key: str) -> None:
+        super().__init__(inner)
+        self.tracker = tracker
+        self.key = key
+
+    def invoke(self, messages: Sequence[BaseMessage], **kwargs: Any) -> BaseMessage:
+        started = time.perf_counter()
+        try:
+            return self.inner.invoke(messages, **kwargs)
+        finally:
+            self.tracker.observe(self.key, time.perf_counter() - started)
+
+    async def ainvoke(self, messages: Sequence[BaseMessage], **kwargs: Any) -> BaseMessage:
+        started = time.perf_counter()
+        try:
+            return await self.inner.ainvoke(messages, **kwargs)
+        except asyncio.CancelledError:
+            started = None
+            raise
+        finally:
+            if started is not None:
+                self.tracker.observe(self.key, time.perf_counter() - started)
+
+    def stream(self, messages: Sequence[BaseMessage], **kwargs: Any) -> Iterator[AIMessageChunk]:
+        started = time.perf_counter()
+        first = True
+        try:
+            for chunk in self.inner.stream(messages, **kwargs):
+                if first:
+                    first = False
+                    self.tracker.observe(ttft_key(self.key), time.perf_counter() - started)
+                yield chunk
+        except GeneratorExit:
+            started = None
+            raise
+        finally:
+            if started is not None:
+                self.tracker.observe(self.key, time.perf_counter() - started)
+
+    async def astream(
+        self, messages: Sequence[BaseMessage], **kwargs: Any
+    ) -> AsyncIterator[AIMessageChunk]:
+        started = time.perf_counter()
+        first = True
+        try:
+            async for chunk in self.inner.astream(messages, **kwargs):
+                if first:
+                    first = False
+                    self.tracker.observe(ttft_key(self.key), time.perf_counter() - started)
+                yield chunk
+        except (GeneratorExit, asyncio.CancelledError):
+            started = None
+            raise
+        finally:
+            if started is not None:
+                self.tracker.observe(self.key, time.perf_counter() - started)
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    model: str
+    temperature: float
+    fallback: Optional[str] = None
+    fallback_p95_ms: Optional[float] = None
+
+
+def load_routes(path: str | Path | None) -> Dict[str, Dict[str, Any]]:
+    if not path:
+        return {}
+    try:
+        routes = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError) as exc:
+        raise ValueError(f"无法读取模型路由配置 {path}：{exc}") from exc
+    if not isinstance(routes, dict) or not all(isinstance(value, dict) for value in routes.values()):
+        raise ValueError(f"模型路由配置 {path} 应为 {{节点名: {{model, temperature, ...}}}}")
+    return routes
+
+
+class ModelRouter:
+    """Resolves which model and temperature each node calls, and when to fall back."""
+
+    def __init__(
+        self,
+        default_model: str,
+        default_temperature: float,
+        routes: Dict[str, Dict[str, Any]] | None = None,
+        tracker: LatencyTracker | None = None,
+    ) -> None:
+        self.routes = routes or {}
+        self.tracker = tracker or LatencyTracker()
+        base = self.routes.get(DEFAULT_ROUTE, {})
+        self.default = ModelRoute(
+            model=str(base.get("model") or default_model),
+            temperature=float(base.get("temperature", default_temperature)),
+            fallback=base.get("fallback"),
+            fallback_p95_ms=base.get("fallback_p95_ms"),
+        )
+        self.fallbacks: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._resolved: Dict[str, ModelRoute] = {}
+
+    def route(self, node: str | None) -> ModelRoute:
+        name = node or DEFAULT_ROUTE
+        route = self._resolved.get(name)
+        if route is None:
+            route = self._resolve(name)
+            self._resolved[name] = route
+        return route
+
+    def _resolve(self, name: str) -> ModelRoute:
+        # A variant such as "architecture:go" is configured like its base node.
+        base = name.split(":", 1)[0]
+        config = (self.routes.get(name) or self.routes.get(base, {})) if name != DEFAULT_ROUTE else {}
+        suffix = base.upper()
+        model = os.getenv(f"LLM_MODEL_{suffix}") or config.get("model") or self.default.model
+        temperature = os.getenv(f"LLM_TEMPERATURE_{suffix}") or config.get("temperature")
+        fallback = os.getenv(f"LLM_FALLBACK_MODEL_{suffix}") or config.get("fallback")
+        threshold = os.getenv(f"LLM_FALLBACK_P95_MS_{suffix}") or config.get("fallback_p95_ms")
+        return ModelRoute(
+            model=str(model),
+            temperature=float(temperature if temperature is not None else self.default.temperature),
+            fallback=str(fallback) if fallback else self.default.fallback,
+            fallback_p95_ms=float(threshold) if threshold else self.default.fallback_p95_ms,
+        )
+
+    def select(self, node: str | None) -> Tuple[str, float]:
+        """``(model, temperature)`` for the next call of ``node``."""
+        route = self.route(node)
+        if not route.fallback or not route.fallback_p95_ms:
+            return route.model, route.temperature
+        p95 = self.tracker.percentile(latency_key(node or DEFAULT_ROUTE, route.model), 95)
+        if p95 is None or p95 * 1000 <= route.fallback_p95_ms:
+            return route.model, route.temperature
+        with self._lock:
+            self.fallbacks[node or DEFAULT_ROUTE] = self.fallbacks.get(node or DEFAULT_ROUTE, 0) + 1
+        return route.fallback, route.temperature
+
+
+__all__ = [
+    "LatencyTracker",
+    "ModelRoute",
+    "ModelRouter",
+    "ObservedChatModel",
+    "latency_key",
+    "load_routes",
+    "ttft_key",
+]
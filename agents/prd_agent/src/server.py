@@ -0,0 +1,310 @@
+"""Long-lived HTTP service that keeps one compiled graph and LLM client warm.
+
+Requests are accepted on stdlib HTTP threads and generated concurrently on a
+single background event loop, so every PRD shares the compiled graph, the
+LLM client's keep-alive connection pool, the rate-limit buckets and the
+response cache. Routes::
+
+    POST /prd                 {"input": ..., "language": ...} -> 202 {"id": ...}
+    GET  /prd/<id>            status, progress and timing
+    GET  /prd/<id>/markdown   the finished PRD (409 while still running)
+    GET  /prd/<id>/events     progress as server-sent events
+    GET  /healthz             job counts plus cache stats
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.dedup import DedupIndex
+from src.graph import _shared_graph, agenerate_prd
+from src.llm import (
+    get_budgeter,
+    get_cache,
+    get_cassette,
+    get_hedger,
+    get_llm,
+    get_router,
+    get_single_flight,
+)
+from src.nodes.language import parse_languages
+from src.telemetry import run_context
+
+TERMINAL = ("done", "error")
+
+
+class Job:
+    """One submitted PRD. Events are kept so a late SSE reader can replay them."""
+
+    def __init__(self, job_id: str, user_input: str, language: str, output: Path) -> None:
+        self.id = job_id
+        self.user_input = user_input
+        self.language = language
+        self.output = output
+        self.status = "queued"
+        self.project_name = ""
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.nodes_done: List[str] = []
+        self.reused_sections: List[str] = []
+        self.events: List[Dict[str, Any]] = []
+        self.changed = threading.Condition()
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        with self.changed:
+            self.events.append(event)
+            self.changed.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "id": self.id,
+            "status": self.status,
+            "language": self.language,
+            "nodes_done": list(self.nodes_done),
+            "submitted_at": self.submitted_at,
+        }
+        if self.started_at is not None:
+            data["queue_s"] = round(self.started_at - self.submitted_at, 3)
+        if self.finished_at is not None and self.started_at is not None:
+            data["latency_s"] = round(self.finished_at - self.started_at, 3)
+        if self.project_name:
+            data["project_name"] = self.project_name
+        if self.reused_sections:
+            data["reused_sections"] = list(self.reused_sections)
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class PRDService:
+    """Owns the event loop, the job table and the generation settings shared by all jobs."""
+
+    def __init__(
+        self,
+        out_dir: Path,
+        concurrency: int = 8,
+        max_jobs: int = 1000,
+        default_language: str = "python",
+        parallel: bool = True,
+        speculative: bool = False,
+        feature_fanout: bool = False,
+        api_shard_size: int = 0,
+        fused: bool = False,
+        dedup: DedupIndex | None = None,
+    ) -> None:
+        self.out_dir = out_dir
+        self.dedup = dedup
+        self.max_jobs = max_jobs
+        self.default_language = default_language
+        self.options: Dict[str, Any] = {
+            "parallel": parallel,
+            "speculative": speculative,
+            "feature_fanout": feature_fanout,
+            "api_shard_size": api_shard_size,
+            "fused": fused,
+        }
+        self.loop = asyncio.new_event_loop()
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._thread = threading.Thread(target=self.loop.run_forever, name="prd-service", daemon=True)
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+
+    def start(self) -> None:
+        """Compile the graph and build the LLM client before the first request arrives."""
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        _shared_graph(
+            parallel=self.options["parallel"],
+            speculative=self.options["speculative"],
+            feature_fanout=self.options["feature_fanout"],
+            api_shard_size=self.options["api_shard_size"],
+            fused=self.options["fused"],
+            compare_languages=len(parse_languages(self.default_language)) > 1,
+        )
+        get_llm()
+        self._thread.start()
+
+    def close(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+    def submit(self, user_input: str, language: str | None = None) -> Job:
+        job_id = uuid.uuid4().hex[:12]
+        job = Job(job_id, user_input, language or self.default_language, self.out_dir / f"{job_id}.md")
+        with self._lock:
+            self._jobs[job_id] = job
+            self._evict()
+        asyncio.run_coroutine_threadsafe(self._run(job), self.loop)
+        return job
+
+    def _evict(self) -> None:
+        # Oldest finished jobs go first; running jobs are never dropped.
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.status in TERMINAL]:
+            if len(self._jobs) <= self.max_jobs:
+                break
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        data: Dict[str, Any] = {"ok": True, "jobs": counts}
+        cache = get_cache()
+        if cache is not None:
+            data["cache"] = cache.stats()
+        if self.dedup is not None:
+            data["dedup"] = self.dedup.stats()
+        router = get_router()
+        data["latency"] = router.tracker.stats()
+        if router.fallbacks:
+            data["fallbacks"] = dict(router.fallbacks)
+        hedger = get_hedger()
+        if hedger is not None:
+            data["hedges"] = hedger.stats()
+        group = get_single_flight()
+        if group is not None:
+            data["coalesced"] = group.stats()
+        cassette = get_cassette()
+        if cassette is not None:
+            data["cassette"] = cassette.stats()
+        compacted = get_budgeter().stats()
+        if compacted:
+            data["compacted"] = compacted
+        return data
+
+    async def _run(self, job: Job) -> None:
+        def _on_event(mode: str, chunk: Any) -> None:
+            if mode == "updates":
+                for node in chunk:
+                    job.nodes_done.append(node)
+                    job.emit({"event": "node", "node": node})
+            elif mode == "custom" and isinstance(chunk, dict) and "sections" in chunk:
+                job.emit({"event": "section", "sections": chunk["sections"]})
+            elif mode == "custom" and isinstance(chunk, dict):
+                job.emit({"event": "partial", "node": chunk.get("node"), "keys": sorted(chunk.get("partial", {}))})
+
+        async with self._semaphore:
+            job.status, job.started_at = "running", time.time()
+            job.emit({"event": "started"})
+            try:
+                with run_context(job.id):
+                    state = await agenerate_prd(
+                        job.user_input,
+                        language=job.language,
+                        output_path=str(job.output),
+                        on_event=_on_event,
+                        dedup=self.dedup,
+                        **self.options,
+                    )
+                job.project_name = state.get("project_name", "")
+                job.reused_sections = list(state.get("reused_sections", []))
+                job.status = "done"
+            except Exception as exc:  # noqa: BLE001 - reported on the job, service keeps going
+                job.error = f"{type(exc).__name__}: {exc}"
+                job.status = "error"
+            job.finished_at = time.time()
+            job.emit({"event": job.status, **job.snapshot()})
+
+
+_JOB_PATH = re.compile(r"^/prd/(?P<id>[0-9a-f]+)(?P<tail>/markdown|/events)?/?$")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "PRDServer"
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002 - stdlib signature
+        return
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, data: Dict[str, Any]) -> None:
+        self._send(status, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    def do_POST(self) -> None:  # noqa: N802 - stdlib naming
+        if self.path.rstrip("/") != "/prd":
+            self._json(404, {"error": "not found"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except json.JSONDecodeError as exc:
+            self._json(400, {"error": f"invalid JSON: {exc}"})
+            return
+        if not isinstance(body, dict) or not str(body.get("input") or "").strip():
+            self._json(400, {"error": "`input` is required"})
+            return
+        job = self.server.service.submit(str(body["input"]), body.get("language"))
+        self._json(202, {"id": job.id, "status": job.status, "url": f"/prd/{job.id}"})
+
+    def do_GET(self) -> None:  # noqa: N802 - stdlib naming
+        if self.path.rstrip("/") == "/healthz":
+            self._json(200, self.server.service.stats())
+            return
+        match = _JOB_PATH.match(self.path)
+        job = self.server.service.get(match["id"]) if match else None
+        if job is None:
+            self._json(404, {"error": "not found"})
+        elif match["tail"] == "/markdown":
+            if job.status != "done":
+                self._json(409, job.snapshot())
+            else:
+                self._send(200, job.output.read_bytes(), "text/markdown; charset=utf-8")
+        elif match["tail"] == "/events":
+            self._stream_events(job)
+        else:
+            self._json(200, job.snapshot())
+
+    def _stream_events(self, job: Job) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        sent = 0
+        while True:
+            with job.changed:
+                job.changed.wait_for(lambda: len(job.events) > sent, timeout=15)
+                pending = job.events[sent:]
+            sent += len(pending)
+            try:
+                if not pending:
+                    self.wfile.write(b": keep-alive\n\n")
+                for event in pending:
+                    data = json.dumps(event, ensure_ascii=False)
+                    self.wfile.write(f"event: {event['event']}\ndata: {data}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            if pending and pending[-1]["event"] in TERMINAL:
+                return
+
+
+class PRDServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], service: PRDService) -> None:
+        super().__init__(address, _Handler)
+        self.service = service
+
+
+__all__ = ["Job", "PRDServer", "PRDService"]
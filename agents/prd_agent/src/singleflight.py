@@ -0,0 +1,229 @@
+"""Single-flight de-duplication: identical concurrent LLM calls share one request."""
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessageChunk, BaseMessage
+
+from src.cache import ResponseCache
+from src.proxy import ChatModelProxy, chunk_to_message, message_to_chunk
+
+
+class _Abandoned(Exception):
+    """The leading call was cancelled or its stream closed; followers make their own call."""
+
+
+class SingleFlight:
+    """Process-wide table of in-flight calls keyed by model, temperature and messages.
+
+    A ``concurrent.futures.Future`` carries each result so that threads and
+    coroutines (on any event loop) can wait for the same call. Followers wait
+    at most ``wait_s`` seconds, then make their own call, so a leader that
+    never finishes (e.g. a stream nobody drains) cannot hold them up.
+    """
+
+    def __init__(self, wait_s: float = 120.0) -> None:
+        self.wait_s = wait_s
+        self._lock = threading.Lock()
+        self._flights: Dict[str, "Future[BaseMessage]"] = {}
+        self.coalesced: Dict[str, int] = {}
+
+    def join(self, key: str) -> Tuple["Future[BaseMessage]", bool]:
+        """The flight for ``key`` and whether the caller leads it (must make the call)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = Future()
+            self._flights[key] = flight
+            return flight, True
+
+    def land(
+        self,
+        key: str,
+        flight: "Future[BaseMessage]",
+        result: Optional[BaseMessage] = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        if error is not None:
+            flight.set_exception(error)
+        else:
+            flight.set_result(result)  # type: ignore[arg-type]
+
+    def record(self, node: str) -> None:
+        with self._lock:
+            self.coalesced[node] = self.coalesced.get(node, 0) + 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.coalesced)
+
+
+class SingleFlightChatModel(ChatModelProxy):
+    """Lets concurrent identical calls ride on the first one instead of hitting the endpoint.
+
+    Followers of a streaming call receive the whole reply as one chunk once it
+    has finished. A failure of the leading call is shared with its followers;
+    if the leader is abandoned instead (cancelled task, closed stream) they
+    fall back to calling the model themselves, as they do once they have
+    waited longer than ``group.wait_s``.
+    """
+
+    def __init__(
+        self,
+        inner: Any,
+        group: SingleFlight,
+        node: str,
+        model: str,
+        temperature: float | None,
+        base_url: str | None,
+    ) -> None:
+        super().__init__(inner)
+        self.group = group
+        self.node = node
+        self._key_params = {"model": model, "temperature": temperature, "base_url": base_url}
+
+    def _key(self, messages: Sequence[BaseMessage], kwargs: Dict[str, Any]) -> str:
+        return ResponseCache.make_key(messages=messages, **self._key_params, **kwargs)
+
+    def _land(self, key: str, flight: "Future[BaseMessage]", error: BaseException) -> None:
+        # Only real failures are shared; an abandoned leader says nothing about the call.
+        self.group.land(key, flight, error=error if isinstance(error, Exception) else _Abandoned())
+
+    def _wait(self, flight: "Future[BaseMessage]") -> Optional[BaseMessage]:
+        """The leader's reply, or ``None`` once the follower has waited ``group.wait_s``."""
+        try:
+            return flight.result(timeout=self.group.wait_s)
+        except TimeoutError:
+            return None
+
+    async def _await(self, flight: "Future[BaseMessage]") -> Optional[BaseMessage]:
+        waiter = asyncio.wrap_future(flight)
+        # Marks the outcome retrieved even when this follower stops waiting before it lands.
+        waiter.add_done_callback(lambda done: done.cancelled() or done.exception())
+        try:
+            # Shielded: a cancelled (or timed out) follower must not cancel the shared flight.
+            return await asyncio.wait_for(asyncio.shield(waiter), self.group.wait_s)
+        except TimeoutError:
+            return None
+
+    def invoke(self, messages: Sequence[BaseMessage], **kwargs: Any) -> BaseMessage:
+        key = self._key(messages, kwargs)
+        while True:
+            flight, leader = self.group.join(key)
+            if not leader:
+                try:
+                    reply = self._wait(flight)
+                except _Abandoned:
+                    continue
+                if reply is None:
+                    return self.inner.invoke(messages, **kwargs)
+                self.group.record(self.node)
+                return reply.model_copy()
+            try:
+                result = self.inner.invoke(messages, **kwargs)
+            except BaseException as exc:
+                self._land(key, flight, exc)
+                raise
+            self.group.land(key, flight, result)
+            return result
+
+    async def ainvoke(self, messages: Sequence[BaseMessage], **kwargs: Any) -> BaseMessage:
+        key = self._key(messages, kwargs)
+        while True:
+            flight, leader = self.group.join(key)
+            if not leader:
+                try:
+                    reply = await self._await(flight)
+                except _Abandoned:
+                    continue
+                if reply is None:
+                    return await self.inner.ainvoke(messages, **kwargs)
+                self.group.record(self.node)
+                return reply.model_copy()
+            try:
+                result = await self.inner.ainvoke(messages, **kwargs)
+            except BaseException as exc:
+                self._land(key, flight, exc)
+                raise
+            self.group.land(key, flight, result)
+            return result
+
+    def stream(self, messages: Sequence[BaseMessage], **kwargs: Any) -> Iterator[AIMessageChunk]:
+        key = self._key(messages, kwargs)
+        while True:
+            flight, leader = self.group.join(key)
+            if not leader:
+                try:
+                    reply = self._wait(flight)
+                except _Abandoned:
+                    continue
+                if reply is None:
+                    yield from self.inner.stream(messages, **kwargs)
+                    return
+                self.group.record(self.node)
+                yield message_to_chunk(reply)
+                return
+            full: AIMessageChunk | None = None
+            landed = False
+            try:
+                for chunk in self.inner.stream(messages, **kwargs):
+                    full = chunk if full is None else full + chunk
+                    yield chunk
+                landed = True
+                self.group.land(key, flight, chunk_to_message(full or AIMessageChunk(content="")))
+            except Exception as exc:
+                if not landed:
+                    landed = True
+                    self.group.land(key, flight, error=exc)
+                raise
+            finally:
+                # Closed before the end (GeneratorExit) or interrupted: followers call themselves.
+                if not landed:
+                    self.group.land(key, flight, error=_Abandoned())
+            return
+
+    async def astream(
+        self, messages: Sequence[BaseMessage], **kwargs: Any
+    ) -> AsyncIterator[AIMessageChunk]:
+        key = self._key(messages, kwargs)
+        while True:
+            flight, leader = self.group.join(key)
+            if not leader:
+                try:
+                    reply = await self._await(flight)
+                except _Abandoned:
+                    continue
+                if reply is None:
+                    async for chunk in self.inner.astream(messages, **kwargs):
+                        yield chunk
+                    return
+                self.group.record(self.node)
+                yield message_to_chunk(reply)
+                return
+            full: AIMessageChunk | None = None
+            landed = False
+            try:
+                async for chunk in self.inner.astream(messages, **kwargs):
+                    full = chunk if full is None else full + chunk
+                    yield chunk
+                landed = True
+                self.group.land(key, flight, chunk_to_message(full or AIMessageChunk(content="")))
+            except Exception as exc:
+                if not landed:
+                    landed = True
+                    self.group.land(key, flight, error=exc)
+                raise
+            finally:
+                if not landed:
+                    self.group.land(key, flight, error=_Abandoned())
+            return
+
+
+__all__ = ["SingleFlight", "SingleFlightChatModel"]
@@ -1,7 +1,10 @@
 """Typed state definitions shared across LangGraph nodes."""
 from __future__ import annotations
 
-from typing import Any, Dict, List, TypedDict
+from typing import Annotated, Any, Dict, List, Optional, TypeVar
+
+# typing_extensions' TypedDict so pydantic can validate replies against these on Python < 3.12.
+from typing_extensions import NotRequired, TypedDict
 
 
 class FeatureSpec(TypedDict):
@@ -15,6 +18,30 @@ class FeatureSpec(TypedDict):
     dependencies: List[str]
 
 
+class FeatureOutline(TypedDict):
+    name: str
+    description: str
+
+
+class FeatureDetail(TypedDict):
+    index: int
+    feature: FeatureSpec
+
+
+T = TypeVar("T")
+
+
+def append_or_reset(left: List[T], right: Optional[List[T]]) -> List[T]:
+    """Reducer for fan-out results: parallel writes append, ``None`` clears the list.
+
+    The node that starts a fan-out writes ``None`` so a rerun on a
+    checkpointed thread never mixes in results from the previous run.
+    """
+    if right is None:
+        return []
+    return [*(left or []), *right]
+
+
 class TableField(TypedDict):
     name: str
     type: str
@@ -49,8 +76,13 @@ class ApiSpec(TypedDict):
     method: str
     request: List[ApiField]
     response: List[ApiField]
-    errors: Dict[str, str]
-    example: Dict[str, Any]
+    errors: NotRequired[Dict[str, str]]
+    example: NotRequired[Dict[str, Any]]
+
+
+class ApiShard(TypedDict):
+    index: int
+    apis: List[ApiSpec]
 
 
 class FrameworkInsight(TypedDict, total=False):
@@ -61,18 +93,36 @@ class FrameworkInsight(TypedDict, total=False):
     orchestration: List[str]
 
 
+class StackVariant(TypedDict, total=False):
+    """Architecture and NFR sections generated for one alternative language."""
+
+    index: int
+    tech_stack: str
+    frameworks: FrameworkInsight
+    business_architecture: str
+    technical_architecture: str
+    data_flow: str
+    scalability: str
+    nfr: Dict[str, str]
+    risks: List[str]
+    glossary: List[str]
+
+
 class PRDState(TypedDict, total=False):
     user_input: str
     domain: str
     project_name: str
     project_goal: str
     tech_stack: str
+    languages: List[str]
     frameworks: FrameworkInsight
     background: str
     value: str
     user_segments: List[str]
     vision: str
     features: List[FeatureSpec]
+    feature_outline: List[FeatureOutline]
+    feature_details: Annotated[List[FeatureDetail], append_or_reset]
     business_architecture: str
     technical_architecture: str
     data_flow: str
@@ -81,19 +131,31 @@ class PRDState(TypedDict, total=False):
     tables: List[TableSchema]
     dto_contracts: List[DTOContract]
     apis: List[ApiSpec]
+    api_shards: Annotated[List[ApiShard], append_or_reset]
     nfr: Dict[str, str]
     risks: List[str]
     glossary: List[str]
-    prd_markdown: str
+    stack_variants: Annotated[List[StackVariant], append_or_reset]
+    stack_comparison: List[StackVariant]
+    assembled_sections: List[str]
+    output_path: str
+    section_fingerprints: Dict[str, str]
+    reused_sections: List[str]
+    reuse_similarity: float
 
 
 __all__ = [
     "ApiField",
+    "ApiShard",
     "ApiSpec",
     "DTOContract",
+    "FeatureDetail",
+    "FeatureOutline",
     "FeatureSpec",
     "FrameworkInsight",
     "PRDState",
+    "StackVariant",
     "TableField",
     "TableSchema",
+    "append_or_reset",
 ]
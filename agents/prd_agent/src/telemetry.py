@@ -0,0 +1,230 @@
+"""Per-node spans: latency, time-to-first-token, token usage and parse outcome.
+
+``cached_tokens`` counts input tokens the provider served from its prompt
+prefix cache (``usage_metadata["input_token_details"]["cache_read"]``).
+"""
+from __future__ import annotations
+
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.messages import BaseMessage
+
+_RUN_ID: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("prd_run_id", default=None)
+
+
+@dataclass
+class NodeSpan:
+    node: str
+    run_id: Optional[str] = None
+    started_at: float = 0.0
+    wall_ms: float = 0.0
+    ttft_ms: Optional[float] = None
+    cpu_ms: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    total_tokens: int = 0
+    cached_tokens: int = 0
+    cache_hit: bool = False
+    parse: Optional[str] = None
+    error: Optional[str] = None
+    invalid_fields: int = 0
+    repairs: int = 0
+    repair_failed: bool = False
+    dropped_items: int = 0
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    _t0: float = field(default=0.0, repr=False)
+
+    def first_token(self) -> None:
+        """Mark the arrival of the first non-empty chunk (idempotent)."""
+        if self.ttft_ms is None:
+            self.ttft_ms = (time.perf_counter() - self._t0) * 1000
+
+    def record_response(self, message: BaseMessage | None) -> None:
+        if message is None:
+            return
+        usage = getattr(message, "usage_metadata", None) or {}
+        self.input_tokens += int(usage.get("input_tokens", 0) or 0)
+        self.output_tokens += int(usage.get("output_tokens", 0) or 0)
+        self.total_tokens += int(usage.get("total_tokens", 0) or 0)
+        details = usage.get("input_token_details") or {}
+        self.cached_tokens += int(details.get("cache_read", 0) or 0)
+        self.cache_hit = bool(message.response_metadata.get("cache_hit"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("_t0", None)
+        return data
+
+
+def _share(part: int, whole: int) -> str:
+    return f"{part} ({part * 100 // whole}%)" if whole else str(part)
+
+
+class Tracer:
+    """Collects node spans, keeps running aggregates and optionally writes JSONL.
+
+    Only aggregates are held in memory so a long-lived batch or server does not
+    grow without bound; individual spans go to ``trace_file`` when configured.
+    """
+
+    def __init__(self, trace_file: str | Path | None = None) -> None:
+        self.trace_file = Path(trace_file) if trace_file else None
+        if self.trace_file is not None:
+            self.trace_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, Any]] = {}
+
+    @contextmanager
+    def span(self, node: str) -> Iterator[NodeSpan]:
+        span = NodeSpan(node=node, run_id=_RUN_ID.get(), started_at=time.time())
+        span._t0 = time.perf_counter()
+        cpu0 = time.thread_time()
+        try:
+            yield span
+        except BaseException as exc:
+            span.error = f"{type(exc).__name__}: {exc}"
+            raise
+        finally:
+            span.wall_ms = (time.perf_counter() - span._t0) * 1000
+            # thread_time is exact for sync nodes; under asyncio it also counts
+            # other coroutines that ran on the loop thread meanwhile.
+            span.cpu_ms = (time.thread_time() - cpu0) * 1000
+            self.record(span)
+
+    def record(self, span: NodeSpan) -> None:
+        with self._lock:
+            totals = self._totals.setdefault(
+                span.node,
+                {
+                    "calls": 0,
+                    "wall_ms": 0.0,
+                    "max_wall_ms": 0.0,
+                    "ttft_ms": 0.0,
+                    "ttft_samples": 0,
+                    "cpu_ms": 0.0,
+                    "input_tokens": 0,
+                    "output_tokens": 0,
+                    "cached_tokens": 0,
+                    "cache_hits": 0,
+                    "errors": 0,
+                    "repairs": 0,
+                    "repair_failures": 0,
+                    "parse": {},
+                },
+            )
+            totals["calls"] += 1
+            totals["wall_ms"] += span.wall_ms
+            totals["max_wall_ms"] = max(totals["max_wall_ms"], span.wall_ms)
+            if span.ttft_ms is not None:
+                totals["ttft_ms"] += span.ttft_ms
+                totals["ttft_samples"] += 1
+            totals["cpu_ms"] += span.cpu_ms
+            totals["input_tokens"] += span.input_tokens
+            totals["output_tokens"] += span.output_tokens
+            totals["cached_tokens"] += span.cached_tokens
+            totals["cache_hits"] += int(span.cache_hit)
+            totals["errors"] += int(span.error is not None)
+            totals["repairs"] += span.repairs
+            totals["repair_failures"] += int(span.repair_failed)
+            if span.parse:
+                totals["parse"][span.parse] = totals["parse"].get(span.parse, 0) + 1
+            if self.trace_file is not None:
+                with self.trace_file.open("a", encoding="utf-8") as handle:
+                    handle.write(json.dumps(span.to_dict(), ensure_ascii=False) + "\n")
+
+    def event(self, node: str, kind: str, **fields: Any) -> None:
+        """Write a one-off event (not a span) to ``trace_file``; a no-op without one."""
+        if self.trace_file is None:
+            return
+        record = {"event": kind, "node": node, "run_id": _RUN_ID.get(), "at": time.time(), **fields}
+        with self._lock, self.trace_file.open("a", encoding="utf-8") as handle:
+            handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {node: {**totals, "parse": dict(totals["parse"])} for node, totals in self._totals.items()}
+
+    def format_summary(self) -> str:
+        rows: List[List[str]] = [
+            [
+                "node", "calls", "avg ms", "max ms", "avg ttft", "cpu ms",
+                "in tok", "cached", "out tok", "cache", "repair", "parse",
+            ]
+        ]
+        for node, totals in self.summary().items():
+            calls = totals["calls"] or 1
+            ttft = (
+                f"{totals['ttft_ms'] / totals['ttft_samples']:.0f}" if totals["ttft_samples"] else "-"
+            )
+            parse = ",".join(f"{key}={count}" for key, count in sorted(totals["parse"].items())) or "-"
+            rows.append(
+                [
+                    node,
+                    str(totals["calls"]),
+                    f"{totals['wall_ms'] / calls:.0f}",
+                    f"{totals['max_wall_ms']:.0f}",
+                    ttft,
+                    f"{totals['cpu_ms']:.1f}",
+                    str(totals["input_tokens"]),
+                    _share(totals["cached_tokens"], totals["input_tokens"]),
+                    str(totals["output_tokens"]),
+                    str(totals["cache_hits"]),
+                    f"{totals['repairs']}/{totals['repair_failures']}",
+                    parse,
+                ]
+            )
+        widths = [max(len(row[col]) for row in rows) for col in range(len(rows[0]))]
+        return "\n".join(
+            "  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows
+        )
+
+    def prompt_cache(self) -> Dict[str, int]:
+        """Input and provider-cached input tokens over every node."""
+        with self._lock:
+            return {
+                "input_tokens": sum(totals["input_tokens"] for totals in self._totals.values()),
+                "cached_tokens": sum(totals["cached_tokens"] for totals in self._totals.values()),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._totals.clear()
+
+
+_TRACER = Tracer()
+
+
+def configure_tracer(trace_file: str | Path | None = None) -> Tracer:
+    """Replace the process-wide tracer (e.g. to start writing a JSONL trace)."""
+    global _TRACER
+    _TRACER = Tracer(trace_file)
+    return _TRACER
+
+
+def get_tracer() -> Tracer:
+    return _TRACER
+
+
+def current_run_id() -> Optional[str]:
+    return _RUN_ID.get()
+
+
+@contextmanager
+def run_context(run_id: str | None) -> Iterator[None]:
+    """Tag every span recorded inside the block (and its tasks) with ``run_id``."""
+    token = _RUN_ID.set(run_id)
+    try:
+        yield
+    finally:
+        _RUN_ID.reset(token)
+
+
+__all__ = ["NodeSpan", "Tracer", "configure_tracer", "current_run_id", "get_tracer", "run_context"]
@@ -3,7 +3,7 @@ from __future__ import annotations
 
 import json
 import re
-from typing import Any, Dict
+from typing import Any, Dict, List, Tuple
 
 from langchain_core.messages import BaseMessage
 
@@ -26,25 +26,113 @@ def message_to_str(message: BaseMessage | str) -> str:
     return str(content)
 
 
-def extract_json(text: str) -> Dict[str, Any]:
-    """Attempt to extract a JSON object from potentially noisy text."""
+PARSE_DIRECT = "direct"
+PARSE_BRACE_SCAN = "brace_scan"
+PARSE_PARTIAL = "partial"
+PARSE_EMPTY = "empty"
+
+
+def extract_json_with_outcome(text: str) -> Tuple[Dict[str, Any], str]:
+    """Like :func:`extract_json` but also reports which parsing path succeeded."""
     cleaned = text.strip()
     if cleaned.startswith("```"):
         cleaned = re.sub(r"^```(?:json)?", "", cleaned).strip()
         if cleaned.endswith("```"):
             cleaned = cleaned[:-3].strip()
     try:
-        return json.loads(cleaned)
+        return json.loads(cleaned), PARSE_DIRECT
     except json.JSONDecodeError:
         start = cleaned.find("{")
         end = cleaned.rfind("}")
         if start != -1 and end != -1 and end > start:
             snippet = cleaned[start : end + 1]
             try:
-                return json.loads(snippet)
+                return json.loads(snippet), PARSE_BRACE_SCAN
             except json.JSONDecodeError:
                 pass
-    return {}
+    return {}, PARSE_EMPTY
+
+
+def extract_json(text: str) -> Dict[str, Any]:
+    """Attempt to extract a JSON object from potentially noisy text."""
+    return extract_json_with_outcome(text)[0]
+
+
+class StreamingJsonParser:
+    """Incrementally parses a streamed JSON object member by member.
+
+    ``feed`` returns the top-level ``(key, value)`` pairs whose value became
+    complete with the new text, so callers can act on early keys while the
+    rest of the reply is still arriving. Text before the first ``{`` (for
+    example a Markdown fence) is ignored, and a member that fails to parse is
+    skipped rather than poisoning the rest of the object.
+    """
+
+    def __init__(self) -> None:
+        self._pending: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.closed = False
+        self.members: Dict[str, Any] = {}
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        completed: List[Tuple[str, Any]] = []
+        if self.closed or not text:
+            return completed
+        segment_start = 0
+        for index, char in enumerate(text):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+                    segment_start = index + 1
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._close_member(text[segment_start:index], completed)
+                    self.closed = True
+                    return completed
+            elif char == "," and self._depth == 1:
+                self._close_member(text[segment_start:index], completed)
+                segment_start = index + 1
+        if self._depth > 0:
+            self._pending.append(text[segment_start:])
+        return completed
+
+    def _close_member(self, tail: str, completed: List[Tuple[str, Any]]) -> None:
+        member = ("".join(self._pending) + tail).strip()
+        self._pending = []
+        if not member:
+            return
+        try:
+            parsed = json.loads("{" + member + "}")
+        except json.JSONDecodeError:
+            return
+        for key, value in parsed.items():
+            self.members[key] = value
+            completed.append((key, value))
 
 
-__all__ = ["extract_json", "message_to_str"]
+__all__ = [
+    "StreamingJsonParser",
+    "PARSE_BRACE_SCAN",
+    "PARSE_DIRECT",
+    "PARSE_EMPTY",
+    "PARSE_PARTIAL",
+    "extract_json",
+    "extract_json_with_outcome",
+    "message_to_str",
+]
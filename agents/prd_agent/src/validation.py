@@ -0,0 +1,149 @@
+"""Validate LLM replies against the ``state.py`` TypedDicts and build targeted repair requests."""
+from __future__ import annotations
+
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+
+# Bounds the repair prompt; the model is told how many problems were left out.
+MAX_LISTED_PROBLEMS = 20
+
+
+class Problem(NamedTuple):
+    key: str
+    index: Optional[int]
+    path: str
+    message: str
+
+
+@lru_cache(maxsize=None)
+def _adapter(annotation: Any) -> TypeAdapter[Any]:
+    return TypeAdapter(annotation)
+
+
+def _path(key: str, loc: Tuple[Any, ...]) -> str:
+    path = key
+    for part in loc:
+        path += f"[{part}]" if isinstance(part, int) else f".{part}"
+    return path
+
+
+def validate_reply(schema: Dict[str, Any], payload: Dict[str, Any]) -> List[Problem]:
+    """Missing or invalid top-level keys of ``payload``; list items are reported by index."""
+    problems: List[Problem] = []
+    for key, annotation in schema.items():
+        if key not in payload:
+            problems.append(Problem(key, None, key, "missing"))
+            continue
+        try:
+            _adapter(annotation).validate_python(payload[key])
+        except ValidationError as exc:
+            for error in exc.errors():
+                loc = tuple(error["loc"])
+                index = loc[0] if loc and isinstance(loc[0], int) else None
+                problems.append(Problem(key, index, _path(key, loc), error["msg"]))
+    return problems
+
+
+def repair_request(problems: List[Problem], payload: Dict[str, Any]) -> str:
+    """Instructions naming only the broken fields, plus the current value of each broken item."""
+    lines = ["Your previous JSON reply had these problems:"]
+    lines.extend(f"- {problem.path}: {problem.message}" for problem in problems[:MAX_LISTED_PROBLEMS])
+    if len(problems) > MAX_LISTED_PROBLEMS:
+        lines.append(f"- ... and {len(problems) - MAX_LISTED_PROBLEMS} more of the same kind")
+    current: Dict[str, Any] = {}
+    for problem in problems:
+        value = payload.get(problem.key)
+        if problem.index is not None and isinstance(value, list):
+            current.setdefault(problem.key, {})[str(problem.index)] = value[problem.index]
+        elif value is not None and problem.index is None:
+            current[problem.key] = value
+    if current:
+        lines.append("Current values of the affected entries:")
+        lines.append(json.dumps(current, ensure_ascii=False, default=str))
+    lines.append(
+        "Return JSON containing ONLY the corrections, following the original schema: "
+        'a whole key as {"key": value}, or individual list items as '
+        '{"key": {"<index>": corrected item}}. Do not repeat entries that were valid.'
+    )
+    return "\n".join(lines)
+
+
+def _broken_indexes(problems: List[Problem], key: str) -> Optional[List[int]]:
+    """Sorted indexes of ``key``'s broken items, ``None`` when the key is broken as a whole."""
+    indexes: set[int] = set()
+    for problem in problems:
+        if problem.key != key:
+            continue
+        if problem.index is None:
+            return None
+        indexes.add(problem.index)
+    return sorted(indexes)
+
+
+def _merge_items(items: List[Any], value: Any, broken: List[int]) -> List[Any]:
+    """Write the corrections in ``value`` over the broken positions of ``items``."""
+    merged = list(items)
+    if isinstance(value, dict):
+        for index, item in value.items():
+            position = int(index)
+            if position < len(merged):
+                merged[position] = item
+            else:
+                merged.append(item)
+    elif len(value) == len(items):
+        # The whole list resent: take only the positions that were broken.
+        for position in broken:
+            merged[position] = value[position]
+    else:
+        # Just the corrected items, in the order they were listed.
+        for position, item in zip(broken, value):
+            merged[position] = item
+    return merged
+
+
+def merge_repair(
+    schema: Dict[str, Any], payload: Dict[str, Any], fix: Dict[str, Any], problems: List[Problem]
+) -> Dict[str, Any]:
+    """Apply a repair reply for ``problems``: dicts are merged, lists change only where broken.
+
+    A list key whose items were reported by index accepts the corrections
+    as ``{"<index>": item}``, as the whole list again, or as a list of just
+    the corrected items, mapped onto the broken indexes in order; either
+    way the items that were valid are kept as they were.
+    """
+    merged = dict(payload)
+    for key, value in fix.items():
+        if key not in schema:
+            continue
+        current = merged.get(key)
+        broken = _broken_indexes(problems, key)
+        is_indexed = isinstance(value, dict) and value and all(str(index).isdigit() for index in value)
+        if isinstance(current, list) and broken is not None and (is_indexed or isinstance(value, list)):
+            merged[key] = _merge_items(current, value, broken)
+        elif isinstance(current, dict) and isinstance(value, dict):
+            merged[key] = {**current, **value}
+        else:
+            merged[key] = value
+    return merged
+
+
+def drop_invalid_items(
+    schema: Dict[str, Any], payload: Dict[str, Any], problems: List[Problem]
+) -> Tuple[Dict[str, Any], int]:
+    """Last resort after a failed repair: keep every valid list item, drop the broken ones."""
+    broken: Dict[str, set[int]] = {}
+    for problem in problems:
+        if problem.index is not None and isinstance(payload.get(problem.key), list):
+            broken.setdefault(problem.key, set()).add(problem.index)
+    cleaned = dict(payload)
+    dropped = 0
+    for key, indexes in broken.items():
+        cleaned[key] = [item for index, item in enumerate(payload[key]) if index not in indexes]
+        dropped += len(indexes)
+    return cleaned, dropped
+
+
+__all__ = ["Problem", "drop_invalid_items", "merge_repair", "repair_request", "validate_reply"]
@@ -0,0 +1,27 @@
+"""Lets the tests import ``src`` and ``bench`` however pytest is started; shared fixtures."""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.fake_llm import LatencyModel, ScriptedChatModel, Workload  # noqa: E402
+from src.llm import configure_llm  # noqa: E402
+from src.telemetry import Tracer, configure_tracer  # noqa: E402
+
+
+@pytest.fixture
+def tracer() -> Tracer:
+    """A fresh process-wide tracer, so span counts start from zero."""
+    return configure_tracer()
+
+
+@pytest.fixture
+def scripted_llm(tracer: Tracer) -> ScriptedChatModel:
+    """Every node answers from a fast scripted model: no network, no response cache."""
+    client = ScriptedChatModel(workload=Workload("test"), latency=LatencyModel(median_ms=1, sigma=0.0))
+    configure_llm(cache=False, client=client)
+    return client
@@ -0,0 +1,42 @@
+"""API sharding: entity groups, endpoint normalization and the shard merge."""
+from __future__ import annotations
+
+from src.nodes.api import endpoint_key, fan_out_apis, merge_apis, shard_entities
+
+
+def _api(method: str, url: str, name: str = "") -> dict:
+    return {"name": name or f"{method} {url}", "url": url, "method": method, "request": [], "response": []}
+
+
+def test_entities_are_grouped_in_order():
+    assert shard_entities(["a", "b", "c", "d", "e"], 2) == [["a", "b"], ["c", "d"], ["e"]]
+    assert shard_entities([], 3) == [[]]
+    assert shard_entities(["a", "b"], 0) == [["a"], ["b"]]
+
+
+def test_fan_out_sends_every_shard_with_the_full_entity_list():
+    state = {"project_name": "Blog", "core_entities": ["User", "Post", "Tag"], "features": []}
+    sends = fan_out_apis(2)(state)
+    assert [send.arg["shard_entities"] for send in sends] == [["User", "Post"], ["Tag"]]
+    assert [send.arg["shard_index"] for send in sends] == [0, 1]
+    assert all(send.arg["core_entities"] == ["User", "Post", "Tag"] for send in sends)
+
+
+def test_endpoint_key_normalizes_path_parameters_and_slashes():
+    expected = ("GET", "/posts/{}")
+    for url in ("/posts/{id}", "/posts/:id", "/posts/<int:post_id>", "/Posts/{postId}/", "/posts/{id}?full=1"):
+        assert endpoint_key(_api("get", url)) == expected
+    assert endpoint_key(_api("POST", "/posts/{id}")) != expected
+    assert endpoint_key(_api("GET", "/posts/{id}/comments")) != expected
+    assert endpoint_key(_api("GET", "/")) == endpoint_key(_api("GET", "")) == ("GET", "/")
+
+
+def test_merge_keeps_shard_order_and_the_first_duplicate():
+    state = {
+        "api_shards": [
+            {"index": 1, "apis": [_api("GET", "/posts/:id", "second"), _api("GET", "/tags")]},
+            {"index": 0, "apis": [_api("GET", "/posts/{id}", "first"), _api("POST", "/posts")]},
+        ]
+    }
+    apis = merge_apis(state)["apis"]
+    assert [api["name"] for api in apis] == ["first", "POST /posts", "GET /tags"]
@@ -0,0 +1,133 @@
+"""AssemblerNode: anchored layout, in-place section patches and atomic file replacement."""
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from src.nodes import assembler as assembler_module
+from src.nodes.assembler import PLACEHOLDER, AssemblerNode
+
+STATE = {
+    "user_input": "博客",
+    "domain": "content",
+    "project_name": "Blog",
+    "project_goal": "Publish posts.",
+    "background": "Writers need a home.",
+    "value": "Fast publishing.",
+    "user_segments": ["writers"],
+    "vision": "Every writer.",
+}
+FEATURES = {
+    "features": [
+        {
+            "name": "Post",
+            "description": "Write posts",
+            "inputs": ["text"],
+            "outputs": ["id"],
+            "preconditions": [],
+            "postconditions": [],
+            "edge_cases": [],
+            "dependencies": [],
+        }
+    ]
+}
+NFR = {"nfr": {"performance": "p95 < 200ms"}, "risks": ["spam"], "glossary": ["PRD"]}
+
+
+def _section(text: str, name: str) -> str:
+    start = text.index(f"<!-- prd:{name} -->")
+    return text[start : text.index(f"<!-- /prd:{name} -->", start)]
+
+
+@pytest.fixture
+def prd(tmp_path):
+    path = tmp_path / "prd.md"
+    state = {**STATE, "output_path": str(path)}
+    AssemblerNode().start(state)
+    return path, state
+
+
+def test_start_lays_out_every_section_with_placeholders(prd):
+    path, _ = prd
+    text = path.read_text(encoding="utf-8")
+    names = ["intent", "architecture", "features", "datamodel", "api", "nfr"]
+    assert [text.index(f"<!-- prd:{name} -->") for name in names] == sorted(
+        text.index(f"<!-- prd:{name} -->") for name in names
+    )
+    # The intent outputs are already in the state, so that section is rendered straight away.
+    assert "Writers need a home." in _section(text, "intent")
+    assert _section(text, "features").endswith(f"{PLACEHOLDER}\n")
+    assert "<!-- prd:comparison -->" not in text
+
+
+def test_publish_patches_only_the_sections_of_the_update(prd):
+    path, state = prd
+    before = path.read_text(encoding="utf-8")
+    assert AssemblerNode().publish(state, FEATURES) == ["features"]
+    after = path.read_text(encoding="utf-8")
+    assert "### 功能 1: Post" in _section(after, "features")
+    for name in ("intent", "architecture", "datamodel", "api", "nfr"):
+        assert _section(after, name) == _section(before, name)
+    assert AssemblerNode().publish(state, {"user_input": "博客"}) == []
+    assert path.read_text(encoding="utf-8") == after
+
+
+def test_publish_keeps_manual_edits_of_other_sections(prd):
+    path, state = prd
+    edited = path.read_text(encoding="utf-8").replace("### 背景\n", "### 背景\n手工补充。\n")
+    path.write_text(edited, encoding="utf-8")
+    AssemblerNode().publish(state, NFR)
+    text = path.read_text(encoding="utf-8")
+    assert "手工补充。" in text and "p95 < 200ms" in _section(text, "nfr")
+
+
+def test_failed_write_leaves_the_previous_document_and_no_temp_file(prd, monkeypatch):
+    path, state = prd
+    before = path.read_text(encoding="utf-8")
+
+    def broken(self, state):
+        yield "## half a section"
+        raise RuntimeError("render failed")
+
+    monkeypatch.setattr(AssemblerNode, "_render_features", broken)
+    with pytest.raises(RuntimeError):
+        AssemblerNode().publish(state, FEATURES)
+    assert path.read_text(encoding="utf-8") == before
+    assert [item.name for item in path.parent.iterdir()] == ["prd.md"]
+
+
+def test_concurrent_publishes_all_land(prd):
+    path, state = prd
+    updates = [FEATURES, NFR, {"core_entities": ["Post"], "tables": [], "dto_contracts": []}, {"apis": []}]
+    threads = [
+        threading.Thread(target=AssemblerNode().publish, args=({**state, **update}, update))
+        for update in updates
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    text = path.read_text(encoding="utf-8")
+    for name in ("features", "datamodel", "api", "nfr"):
+        assert PLACEHOLDER not in _section(text, name)
+    assert assembler_module._LOCKS == {}
+
+
+def test_assemble_fills_placeholders_and_returns_only_their_names(prd):
+    path, state = prd
+    AssemblerNode().publish(state, FEATURES)
+    result = AssemblerNode()({**state, **FEATURES, **NFR})
+    assert result == {"assembled_sections": ["architecture", "datamodel", "api", "nfr"]}
+    text = path.read_text(encoding="utf-8")
+    assert PLACEHOLDER not in text and "### 功能 1: Post" in text
+    assert path.with_suffix(".state.json").exists()
+
+
+def test_document_without_anchors_is_laid_out_again(tmp_path):
+    path = tmp_path / "prd.md"
+    path.write_text("# An older PRD without anchors\n", encoding="utf-8")
+    result = AssemblerNode()({**STATE, **FEATURES, "output_path": str(path)})
+    text = path.read_text(encoding="utf-8")
+    assert "An older PRD" not in text and "### 功能 1: Post" in text
+    assert result["assembled_sections"][:3] == ["intent", "architecture", "features"]
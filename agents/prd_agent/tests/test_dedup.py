@@ -0,0 +1,86 @@
+"""MinHash signatures and the LSH index around the similarity threshold."""
+from __future__ import annotations
+
+import hashlib
+import random
+
+import pytest
+
+from src.dedup import DedupIndex, MinHasher, estimate_similarity, normalize_text, shingles
+
+BASE = "为我生成一个博客系统的PRD，支持文章发布、评论审核、标签管理、全文搜索和订阅通知，面向个人创作者。"
+
+
+def _words(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    return ["".join(rng.choice("abcdefghijklmnop") for _ in range(6)) for _ in range(count)]
+
+
+def _jaccard(left: str, right: str) -> float:
+    a, b = shingles(left), shingles(right)
+    return len(a & b) / len(a | b)
+
+
+def test_swar_minimum_matches_the_per_lane_minimum():
+    hasher = MinHasher(num_perm=16)
+    items = shingles(BASE)
+    lanes = []
+    for item in items:
+        digest = hashlib.shake_128(hasher._salt + item.encode("utf-8")).digest(hasher._width)
+        lanes.append([int.from_bytes(digest[i : i + 4], "little") & 0x7FFFFFFF for i in range(0, len(digest), 4)])
+    assert hasher.signature(BASE) == tuple(min(column) for column in zip(*lanes))
+
+
+def test_normalization_ignores_case_width_and_punctuation():
+    assert normalize_text("ＰＲＤ：Blog,  System!") == "prd blog system"
+    hasher = MinHasher()
+    assert hasher.signature("Blog System") == hasher.signature("  blog，SYSTEM ")
+
+
+def test_estimate_tracks_jaccard_similarity():
+    hasher = MinHasher()
+    words = _words(60, seed=1)
+    for keep in (60, 48, 30):
+        left = " ".join(words)
+        right = " ".join(words[:keep] + _words(60 - keep, seed=keep))
+        estimate = estimate_similarity(hasher.signature(left), hasher.signature(right))
+        assert abs(estimate - _jaccard(left, right)) < 0.12
+
+
+def test_empty_text_matches_only_empty_text():
+    hasher = MinHasher()
+    empty = hasher.signature("!!!")
+    assert estimate_similarity(empty, hasher.signature("")) == 1.0
+    assert estimate_similarity(empty, hasher.signature(BASE)) == 0.0
+
+
+def test_lookup_hits_at_the_threshold_and_misses_just_above_it(tmp_path):
+    words = _words(80, seed=7)
+    stored, query = " ".join(words), " ".join(words[:70] + _words(10, seed=8))
+    probe = MinHasher()
+    similarity = estimate_similarity(probe.signature(stored), probe.signature(query))
+    assert 0.6 < similarity < 0.95
+
+    at = DedupIndex(tmp_path / "at.sqlite3", threshold=similarity)
+    at.add(stored, {"project_name": "Blog"})
+    match = at.lookup(query)
+    assert match is not None and match["similarity"] == similarity
+    assert match["state"] == {"project_name": "Blog"} and match["user_input"] == stored
+
+    above = DedupIndex(tmp_path / "above.sqlite3", threshold=similarity + 1 / probe.num_perm)
+    above.add(stored, {"project_name": "Blog"})
+    assert above.lookup(query) is None
+    assert above.stats() == {"hits": 0, "misses": 1, "entries": 1}
+
+
+def test_unrelated_requirement_misses_even_at_a_low_threshold(tmp_path):
+    index = DedupIndex(tmp_path / "index.sqlite3", threshold=0.1)
+    index.add(BASE, {})
+    assert index.lookup("帮我设计一个仓储物流调度平台，包含车辆排班与路径规划。") is None
+    assert index.lookup(BASE.replace("PRD", "prd")) is not None
+
+
+def test_index_refuses_other_minhash_parameters(tmp_path):
+    DedupIndex(tmp_path / "index.sqlite3").close()
+    with pytest.raises(ValueError):
+        DedupIndex(tmp_path / "index.sqlite3", num_perm=60)
@@ -0,0 +1,64 @@
+"""Map-reduce feature planning: fan-out payloads and the merge back into ``features``."""
+from __future__ import annotations
+
+from src.nodes.features import FeatureDetailNode, fan_out_features, merge_features
+
+OUTLINE = [
+    {"name": "Post", "description": "Write posts"},
+    {"name": "Comment", "description": "Discuss posts"},
+    {"name": "Search", "description": "Find posts"},
+]
+
+
+def _detail(index: int, name: str) -> dict:
+    return {
+        "index": index,
+        "feature": {
+            "name": name,
+            "description": f"{name} in detail",
+            "inputs": ["text"],
+            "outputs": ["id"],
+            "preconditions": [],
+            "postconditions": [],
+            "edge_cases": ["empty"],
+            "dependencies": [],
+        },
+    }
+
+
+def test_fan_out_sends_one_task_per_outlined_feature():
+    sends = fan_out_features({"project_name": "Blog", "feature_outline": OUTLINE})
+    assert [send.arg["feature_index"] for send in sends] == [0, 1, 2]
+    assert sends[1].arg["feature"] == OUTLINE[1]
+    assert sends[0].arg["feature_names"] == ["Post", "Comment", "Search"]
+    assert fan_out_features({"feature_outline": []}) == "feature_merge"
+
+
+def test_merge_restores_outline_order_whatever_the_arrival_order():
+    state = {"feature_outline": OUTLINE, "feature_details": [_detail(2, "Search"), _detail(0, "Post")]}
+    features = merge_features(state)["features"]
+    assert [feature["name"] for feature in features] == ["Post", "Comment", "Search"]
+    assert features[0]["description"] == "Post in detail"
+
+
+def test_missing_detail_keeps_the_outline_entry_with_empty_lists():
+    features = merge_features({"feature_outline": OUTLINE, "feature_details": [_detail(0, "Post")]})["features"]
+    assert features[1] == {
+        "name": "Comment",
+        "description": "Discuss posts",
+        "inputs": [],
+        "outputs": [],
+        "preconditions": [],
+        "postconditions": [],
+        "edge_cases": [],
+        "dependencies": [],
+    }
+
+
+def test_detail_reply_keeps_the_outline_name():
+    task = {"feature_index": 1, "feature": OUTLINE[1], "feature_names": ["Post", "Comment", "Search"]}
+    renamed = _detail(0, "Comments v2")["feature"]
+    update = FeatureDetailNode().parse(task, {"feature": renamed})
+    assert update["feature_details"][0]["index"] == 1
+    assert update["feature_details"][0]["feature"]["name"] == "Comment"
+    assert FeatureDetailNode().parse(task, {"feature": "oops"}) == {"feature_details": []}
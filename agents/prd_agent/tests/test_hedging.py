@@ -0,0 +1,141 @@
+"""Hedged calls: when a duplicate request fires, which one wins, and what the loser costs."""
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from typing import Any, Dict, Iterator, List
+
+import pytest
+from langchain_core.messages import BaseMessage, HumanMessage
+
+from bench.fake_llm import LatencyModel, ScriptedChatModel, Workload
+from src.hedging import HedgedChatModel, HedgePolicy, Hedger
+from src.routing import LatencyTracker
+
+# Per-attempt script, indexed by the order the requests reach the model.
+DELAYS: List[float] = []
+FAILS: List[int] = []
+STARTED: List[int] = []
+CLOSED: List[int] = []
+_LOCK = threading.Lock()
+
+MESSAGES = [HumanMessage(content="hi")]
+
+
+class _RacedModel(ScriptedChatModel):
+    """Answers ``{"attempt": n}`` after ``DELAYS[n]`` seconds, all of it before the first chunk."""
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        with _LOCK:
+            STARTED.append(len(STARTED))
+            return json.dumps({"attempt": STARTED[-1]})
+
+    def _delay(self, text: str) -> float:
+        attempt = json.loads(text)["attempt"]
+        if attempt in FAILS:
+            time.sleep(DELAYS[attempt])
+            raise RuntimeError(f"attempt {attempt} failed")
+        return DELAYS[attempt]
+
+    def _stream(self, messages: List[BaseMessage], *args: Any, **kwargs: Any) -> Iterator[Any]:
+        attempt = len(STARTED)
+        try:
+            yield from super()._stream(messages, *args, **kwargs)
+        finally:
+            CLOSED.append(attempt)
+
+
+@pytest.fixture(autouse=True)
+def _script():
+    for items in (DELAYS, FAILS, STARTED, CLOSED):
+        items.clear()
+    yield
+
+
+def _model(delays: List[float], max_per_run: int = 2, history: float = 0.05) -> HedgedChatModel:
+    DELAYS.extend(delays)
+    tracker = LatencyTracker(min_samples=5)
+    for _ in range(5):
+        tracker.observe("node:ttft", history)
+    inner = _RacedModel(workload=Workload("test"), latency=LatencyModel(ttft_ratio=1.0), chunks=4)
+    return HedgedChatModel(inner, Hedger(HedgePolicy(max_per_run=max_per_run), tracker), "node", "node:ttft")
+
+
+def _attempt(message: BaseMessage) -> int:
+    return json.loads(str(message.content))["attempt"]
+
+
+def _wait_closed(attempt: int, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while attempt not in CLOSED and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return attempt in CLOSED
+
+
+def test_without_history_the_call_goes_straight_through():
+    model = _model([0.0])
+    model.hedger.tracker = LatencyTracker(min_samples=5)
+    assert _attempt(model.invoke(MESSAGES)) == 0
+    assert STARTED == [0] and model.hedger.stats() == {}
+
+
+def test_a_fast_primary_never_fires_a_hedge():
+    model = _model([0.0], history=0.5)
+    assert _attempt(model.invoke(MESSAGES)) == 0
+    assert STARTED == [0] and model.hedger.stats() == {}
+
+
+def test_the_hedge_wins_when_the_primary_stalls_and_the_loser_is_closed():
+    model = _model([0.6, 0.0])
+    started = time.monotonic()
+    assert _attempt(model.invoke(MESSAGES)) == 1
+    assert time.monotonic() - started < 0.5
+    assert model.hedger.stats() == {"node": {"fired": 1, "won": 1}}
+    assert _wait_closed(0)
+
+
+def test_a_stream_forwards_only_the_winners_chunks():
+    model = _model([0.6, 0.0])
+    text = "".join(str(chunk.content) for chunk in model.stream(MESSAGES))
+    assert json.loads(text) == {"attempt": 1}
+
+
+def test_a_primary_that_fails_after_the_hedge_fired_leaves_the_race_to_the_hedge():
+    FAILS.append(0)
+    model = _model([0.1, 0.3])
+    assert _attempt(model.invoke(MESSAGES)) == 1
+    assert model.hedger.stats() == {"node": {"fired": 1, "won": 1}}
+
+
+def test_the_error_is_raised_once_every_attempt_failed():
+    FAILS.extend([0, 1])
+    model = _model([0.1, 0.1])
+    with pytest.raises(RuntimeError):
+        model.invoke(MESSAGES)
+    assert model.hedger.stats() == {"node": {"fired": 1, "won": 0}}
+
+
+def test_the_run_budget_caps_the_hedges_fired():
+    model = _model([0.2, 0.2, 0.2], max_per_run=1)
+    assert _attempt(model.invoke(MESSAGES)) == 0
+    assert _attempt(model.invoke(MESSAGES)) == 2
+    assert STARTED == [0, 1, 2]
+    assert model.hedger.stats()["node"]["fired"] == 1
+
+
+def test_async_hedge_wins_when_the_primary_stalls():
+    model = _model([0.6, 0.0])
+
+    async def main() -> Dict[str, Any]:
+        started = time.monotonic()
+        reply = await model.ainvoke(MESSAGES)
+        chunks = [str(chunk.content) async for chunk in model.astream(MESSAGES)]
+        return {"attempt": _attempt(reply), "elapsed": time.monotonic() - started, "chunks": chunks}
+
+    DELAYS.extend([0.6, 0.0])
+    result = asyncio.run(main())
+    assert result["attempt"] == 1 and result["elapsed"] < 0.9
+    assert json.loads("".join(result["chunks"])) == {"attempt": 3}
+    assert model.hedger.stats() == {"node": {"fired": 2, "won": 2}}
@@ -0,0 +1,89 @@
+"""Section fingerprints, the state snapshot and regeneration that reuses unchanged sections."""
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from src.graph import generate_prd, regenerate_prd
+from src.incremental import (
+    SECTION_NODES,
+    load_snapshot,
+    save_snapshot,
+    section_fingerprints,
+    snapshot_path,
+)
+from src.nodes.architecture import ArchitectureNode
+from src.nodes.intent import IntentNode
+
+
+def _calls(tracer) -> dict:
+    return {node: totals["calls"] for node, totals in tracer.summary().items() if node != "assembler"}
+
+
+def test_fingerprint_depends_only_on_the_node_inputs():
+    node = IntentNode()
+    state = {"user_input": "博客", "project_name": "ignored by intent"}
+    assert node.fingerprint(state) == node.fingerprint({"user_input": "博客"})
+    assert node.fingerprint(state) != node.fingerprint({"user_input": "论坛"})
+    architecture = ArchitectureNode()
+    assert architecture.fingerprint({"tech_stack": "Golang"}) == architecture.fingerprint({"tech_stack": "go"})
+
+
+def test_is_reused_needs_a_matching_fingerprint_and_the_outputs():
+    node = IntentNode()
+    state = {"user_input": "博客", "project_name": "Blog"}
+    outputs = {key: "x" for key in node.output_keys}
+    seeded = {"section_fingerprints": {"intent": node.fingerprint(state)}}
+    assert node.is_reused({**state, **outputs, **seeded})
+    assert not node.is_reused({**state, **seeded})
+    assert not node.is_reused({**state, **outputs, "user_input": "论坛", **seeded})
+
+
+def test_snapshot_round_trip_seeds_the_fingerprints(tmp_path):
+    state = {"user_input": "博客", "project_name": "Blog", "assembled_sections": ["intent"]}
+    path = save_snapshot(state, snapshot_path(tmp_path / "prd.md"))
+    assert path.name == "prd.state.json"
+    loaded = load_snapshot(path)
+    assert loaded["section_fingerprints"] == section_fingerprints(state)
+    assert "assembled_sections" not in loaded and loaded["project_name"] == "Blog"
+
+
+def test_unknown_snapshot_version_is_refused(tmp_path):
+    path = tmp_path / "prd.state.json"
+    path.write_text(json.dumps({"version": 0, "state": {}}), encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_snapshot(path)
+    with pytest.raises(ValueError):
+        load_snapshot(tmp_path / "missing.state.json")
+
+
+def test_regenerate_reruns_only_the_sections_whose_inputs_changed(scripted_llm, tracer, tmp_path):
+    output = tmp_path / "prd.md"
+    first = generate_prd("为我生成一个博客系统的prd", "python", output_path=str(output))
+    assert _calls(tracer) == {node.name: 1 for node in SECTION_NODES}
+    assert first["reused_sections"] == []
+
+    tracer.reset()
+    unchanged = regenerate_prd(str(output))
+    assert unchanged["reused_sections"] == [node.name for node in SECTION_NODES]
+    assert _calls(tracer) == {}
+
+    tracer.reset()
+    switched = regenerate_prd(str(output), language="golang")
+    assert switched["tech_stack"] == "go"
+    # The scripted model answers every language with the same frameworks, so NFRs stay.
+    assert _calls(tracer) == {"architecture": 1}
+    assert "architecture" not in switched["reused_sections"]
+    assert load_snapshot(snapshot_path(output))["tech_stack"] == "go"
+
+
+def test_manual_edits_outside_rerun_sections_survive_regeneration(scripted_llm, tmp_path):
+    output = tmp_path / "prd.md"
+    generate_prd("为我生成一个博客系统的prd", "python", output_path=str(output))
+    edited = output.read_text(encoding="utf-8").replace("### 背景\n", "### 背景\n手工补充。\n")
+    output.write_text(edited, encoding="utf-8")
+    regenerate_prd(str(output), language="java")
+    text = output.read_text(encoding="utf-8")
+    assert "手工补充。" in text
+    assert text.count("<!-- prd:architecture -->") == 1
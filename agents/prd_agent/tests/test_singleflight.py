@@ -0,0 +1,146 @@
+"""Single-flight: identical concurrent calls share one request, and followers never get stuck."""
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import pytest
+from langchain_core.messages import BaseMessage, HumanMessage
+
+from bench.fake_llm import LatencyModel, ScriptedChatModel, Workload
+from src.singleflight import SingleFlight, SingleFlightChatModel
+
+# Requests that reached the model, and the script every one of them follows.
+CALLS: List[int] = []
+SCRIPT = {"delay": 0.2, "fail": False}
+_LOCK = threading.Lock()
+
+MESSAGES = [HumanMessage(content="hi")]
+
+
+class _CountingModel(ScriptedChatModel):
+    """Answers ``{"call": n}`` after ``SCRIPT["delay"]`` seconds, or fails if ``SCRIPT["fail"]``."""
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        with _LOCK:
+            CALLS.append(len(CALLS))
+            return json.dumps({"call": CALLS[-1]})
+
+    def _delay(self, text: str) -> float:
+        if SCRIPT["fail"]:
+            time.sleep(SCRIPT["delay"])
+            raise RuntimeError("endpoint down")
+        return SCRIPT["delay"]
+
+
+@pytest.fixture(autouse=True)
+def _script():
+    CALLS.clear()
+    SCRIPT.update(delay=0.2, fail=False)
+    yield
+
+
+def _model(wait_s: float = 120.0) -> SingleFlightChatModel:
+    inner = _CountingModel(workload=Workload("test"), latency=LatencyModel(), chunks=4)
+    return SingleFlightChatModel(
+        inner, SingleFlight(wait_s=wait_s), "node", model="m", temperature=0.2, base_url=None
+    )
+
+
+def _call(message: BaseMessage) -> int:
+    return json.loads(str(message.content))["call"]
+
+
+def _follow(model: SingleFlightChatModel) -> "tuple[threading.Thread, List[BaseMessage]]":
+    replies: List[BaseMessage] = []
+    thread = threading.Thread(target=lambda: replies.append(model.invoke(MESSAGES)))
+    thread.start()
+    time.sleep(0.05)  # joined the leader's flight
+    return thread, replies
+
+
+def test_concurrent_identical_calls_share_one_request():
+    model = _model()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        replies = list(pool.map(lambda _: model.invoke(MESSAGES), range(4)))
+    assert CALLS == [0]
+    assert {_call(reply) for reply in replies} == {0}
+    assert model.group.stats() == {"node": 3}
+    assert model.group._flights == {}
+
+
+def test_different_calls_are_not_coalesced():
+    model = _model()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        list(pool.map(lambda text: model.invoke([HumanMessage(content=text)]), ["a", "b"]))
+    assert len(CALLS) == 2 and model.group.stats() == {}
+
+
+def test_a_leader_failure_is_shared_with_its_followers():
+    SCRIPT["fail"] = True
+    model = _model()
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(model.invoke, MESSAGES) for _ in range(3)]
+        errors = [future.exception(timeout=5) for future in futures]
+    assert CALLS == [0]
+    assert all(isinstance(error, RuntimeError) for error in errors)
+
+
+def test_a_follower_of_a_stream_closed_early_makes_its_own_call():
+    model = _model()
+    stream = model.stream(MESSAGES)
+    next(stream)
+    thread, replies = _follow(model)
+    stream.close()
+    thread.join(timeout=5)
+    assert CALLS == [0, 1] and _call(replies[0]) == 1
+    assert model.group.stats() == {}
+
+
+def test_a_follower_stops_waiting_for_a_suspended_leader():
+    model = _model(wait_s=0.1)
+    stream = model.stream(MESSAGES)
+    next(stream)  # the leader is never drained
+    started = time.monotonic()
+    thread, replies = _follow(model)
+    thread.join(timeout=5)
+    assert time.monotonic() - started < 1.0
+    assert CALLS == [0, 1] and _call(replies[0]) == 1
+    stream.close()
+    assert model.group._flights == {}
+
+
+def test_a_streaming_leader_hands_its_whole_reply_to_followers():
+    model = _model()
+    stream = model.stream(MESSAGES)
+    chunks = [str(next(stream).content)]
+    thread, replies = _follow(model)
+    chunks.extend(str(chunk.content) for chunk in stream)
+    thread.join(timeout=5)
+    assert CALLS == [0] and replies[0].content == "".join(chunks)
+    assert model.group.stats() == {"node": 1}
+
+
+def test_async_calls_coalesce_and_a_cancelled_leader_frees_its_followers():
+    model = _model()
+
+    async def coalesce() -> List[BaseMessage]:
+        return await asyncio.gather(*(model.ainvoke(MESSAGES) for _ in range(3)))
+
+    replies = asyncio.run(coalesce())
+    assert CALLS == [0] and {_call(reply) for reply in replies} == {0}
+
+    async def cancel_leader() -> BaseMessage:
+        leader = asyncio.ensure_future(model.ainvoke(MESSAGES))
+        await asyncio.sleep(0.02)
+        follower = asyncio.ensure_future(model.ainvoke(MESSAGES))
+        await asyncio.sleep(0.02)
+        leader.cancel()
+        return await follower
+
+    assert _call(asyncio.run(cancel_leader())) == 2
+    assert CALLS == [0, 1, 2] and model.group._flights == {}
@@ -0,0 +1,70 @@
+"""StreamingJsonParser and extract_json_with_outcome on split, fenced and truncated replies."""
+from __future__ import annotations
+
+import json
+
+from src.utils import (
+    PARSE_BRACE_SCAN,
+    PARSE_DIRECT,
+    PARSE_EMPTY,
+    StreamingJsonParser,
+    extract_json_with_outcome,
+)
+
+PAYLOAD = {
+    "project_name": 'Blog "Pro", v2',
+    "features": [{"name": "Post", "tags": ["a,b", "{c}"]}, {"name": "Comment"}],
+    "domain": "content\\publishing",
+    "count": 3,
+}
+
+
+def _feed_all(parser: StreamingJsonParser, chunks):
+    completed = []
+    for chunk in chunks:
+        completed.extend(parser.feed(chunk))
+    return completed
+
+
+def test_members_complete_in_order_when_split_at_every_character():
+    text = json.dumps(PAYLOAD, ensure_ascii=False)
+    parser = StreamingJsonParser()
+    completed = _feed_all(parser, text)
+    assert completed == list(PAYLOAD.items())
+    assert parser.members == PAYLOAD
+    assert parser.closed
+
+
+def test_member_is_reported_by_the_chunk_that_completes_it():
+    parser = StreamingJsonParser()
+    assert parser.feed('{"project_name": "Bl') == []
+    assert parser.feed('og", "features": [{"na') == [("project_name", "Blog")]
+    assert parser.feed('me": "Post"}]}') == [("features", [{"name": "Post"}])]
+    assert parser.feed(', "late": 1}') == []
+
+
+def test_text_before_the_object_is_ignored():
+    parser = StreamingJsonParser()
+    _feed_all(parser, ["```json\n", '{"a": 1,', ' "b": [1, 2]}', "\n```"])
+    assert parser.members == {"a": 1, "b": [1, 2]}
+
+
+def test_truncated_reply_keeps_the_members_that_closed():
+    text = json.dumps(PAYLOAD, ensure_ascii=False)
+    cut = text[: text.index('"domain"') + 12]
+    parser = StreamingJsonParser()
+    _feed_all(parser, [cut[:20], cut[20:]])
+    assert parser.members == {"project_name": PAYLOAD["project_name"], "features": PAYLOAD["features"]}
+    assert not parser.closed
+
+
+def test_malformed_member_is_skipped():
+    parser = StreamingJsonParser()
+    _feed_all(parser, ['{"a": 1, "b": tru, "c": "ok"}'])
+    assert parser.members == {"a": 1, "c": "ok"}
+
+
+def test_extract_json_outcomes():
+    assert extract_json_with_outcome('```json\n{"a": 1}\n```') == ({"a": 1}, PARSE_DIRECT)
+    assert extract_json_with_outcome('Sure! {"a": 1} Hope it helps.') == ({"a": 1}, PARSE_BRACE_SCAN)
+    assert extract_json_with_outcome('{"a": 1, "b": [') == ({}, PARSE_EMPTY)
@@ -0,0 +1,113 @@
+"""Reply validation, partial repair merging and the repair call of an LLM node."""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List
+
+from langchain_core.messages import BaseMessage
+
+from bench.fake_llm import ScriptedChatModel, Workload
+from src.llm import configure_llm
+from src.nodes.datamodel import DataModelNode
+from src.telemetry import configure_tracer
+from src.validation import drop_invalid_items, merge_repair, validate_reply
+
+SCHEMA = DataModelNode.reply_schema
+
+
+def _table(name: str, **overrides: Any) -> Dict[str, Any]:
+    table = {
+        "name": name,
+        "description": f"{name} table",
+        "primary_key": "id",
+        "fields": [{"name": "id", "type": "bigint", "description": "key", "constraints": "pk"}],
+    }
+    table.update(overrides)
+    return table
+
+
+def _payload() -> Dict[str, Any]:
+    broken = _table("posts")
+    del broken["primary_key"]
+    return {
+        "core_entities": ["User", "Post", "Tag"],
+        "tables": [_table("users"), broken, _table("tags", fields="none")],
+        "dto_contracts": [],
+    }
+
+
+def test_problems_name_the_broken_items_by_index():
+    problems = validate_reply(SCHEMA, {**_payload(), "dto_contracts": "n/a"})
+    assert {(problem.key, problem.index) for problem in problems} == {
+        ("tables", 1),
+        ("tables", 2),
+        ("dto_contracts", None),
+    }
+    assert "tables[1].primary_key" in {problem.path for problem in problems}
+    assert validate_reply(SCHEMA, {"core_entities": []})[0].path == "tables"
+
+
+def test_indexed_fix_replaces_only_the_broken_items():
+    payload = _payload()
+    problems = validate_reply(SCHEMA, payload)
+    fix = {"tables": {"1": _table("posts"), "2": _table("tags")}}
+    merged = merge_repair(SCHEMA, payload, fix, problems)
+    assert merged["tables"][0] is payload["tables"][0]
+    assert [table["name"] for table in merged["tables"]] == ["users", "posts", "tags"]
+    assert validate_reply(SCHEMA, merged) == []
+
+
+def test_list_of_corrections_maps_onto_the_broken_indexes_in_order():
+    payload = _payload()
+    problems = validate_reply(SCHEMA, payload)
+    merged = merge_repair(SCHEMA, payload, {"tables": [_table("posts"), _table("tags")]}, problems)
+    assert validate_reply(SCHEMA, merged) == []
+    assert merged["tables"][0] == payload["tables"][0]
+
+
+def test_resent_list_only_takes_the_broken_positions():
+    payload = _payload()
+    problems = validate_reply(SCHEMA, payload)
+    resent = [_table("renamed"), _table("posts"), _table("tags")]
+    merged = merge_repair(SCHEMA, payload, {"tables": resent}, problems)
+    assert [table["name"] for table in merged["tables"]] == ["users", "posts", "tags"]
+
+
+def test_unknown_keys_in_the_fix_are_ignored_and_whole_keys_replaced():
+    payload = {**_payload(), "dto_contracts": "n/a"}
+    problems = validate_reply(SCHEMA, payload)
+    merged = merge_repair(SCHEMA, payload, {"dto_contracts": [], "extra": 1}, problems)
+    assert merged["dto_contracts"] == [] and "extra" not in merged
+
+
+def test_failed_repair_drops_only_the_broken_items():
+    payload = _payload()
+    cleaned, dropped = drop_invalid_items(SCHEMA, payload, validate_reply(SCHEMA, payload))
+    assert dropped == 2
+    assert [table["name"] for table in cleaned["tables"]] == ["users"]
+    assert cleaned["core_entities"] == payload["core_entities"]
+
+
+# Message count of every call the model below receives.
+CALLS: List[int] = []
+
+
+class _RepairingModel(ScriptedChatModel):
+    """First reply has two broken tables; the repair call fixes one of them."""
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        CALLS.append(len(messages))
+        if len(messages) > 2:
+            return json.dumps({"tables": {"1": _table("posts")}})
+        return json.dumps(_payload())
+
+
+def test_node_repairs_partially_and_keeps_the_valid_items():
+    configure_llm(cache=False, single_flight=False, client=_RepairingModel(workload=Workload("repair")))
+    tracer = configure_tracer()
+    state = {"project_name": "Blog", "domain": "content", "features": []}
+    update = DataModelNode()(state)
+    assert [table["name"] for table in update["tables"]] == ["users", "posts"]
+    assert CALLS == [2, 3]
+    totals = tracer.summary()["datamodel"]
+    assert (totals["repairs"], totals["repair_failures"]) == (1, 1)